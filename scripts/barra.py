@@ -11,6 +11,7 @@
 
 # Import modules
 import os
+import re
 import sys
 import argparse
 from pprint import pprint
@@ -23,10 +24,34 @@ from iris.experimental.equalise_cubes import equalise_attributes
 from iris.util import unify_time_units
 import iris.coord_categorisation as ct
 import time
+from collections import OrderedDict
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from cube_utils import (
+    DEFAULT_CHUNK, chunk_time, realise, regrid_linear, subset_bbox,
+    wind_speed
+)
 
 # Turn off warnings for ease of reading output (Iris complains a lot)
 warnings.filterwarnings('ignore')
 
+# Patterns for the date fields of the directory and filename masks
+DATE_FIELDS = {
+    'yyyy': r'\d{4}',
+    'mm': r'\d{2}',
+    'dd': r'\d{2}',
+    'hh': r'\d{2}',
+}
+
+# Directory listings, shared by all variables (see list_directory)
+_directory_listings = {}
+
+# Extra grid cells kept around the bounding box: V is regridded onto U,
+# so it needs points either side of the box to interpolate from
+BBOX_PAD = {
+    'vwnd10m': 1,
+}
+
 def parse_args():
     """Parse arguments for the script.
 
@@ -90,6 +115,40 @@ def parse_args():
         type=str, default=default_output_dir
     )
 
+    parser.add_argument(
+        '-b', '--bbox',
+        help='Bounding box to subset the data to: lon_W lat_S lon_E lat_N\n'
+             'default=whole domain\n\n',
+        type=float, nargs=4, default=None
+    )
+
+    parser.add_argument(
+        '-w', '--workers',
+        help='Number of processes used to load and clean the data\n'
+             'default=1\n\n',
+        type=int, default=1
+    )
+
+    parser.add_argument(
+        '--split_files',
+        help='Also share the files of each variable between the workers\n\n',
+        action='store_true'
+    )
+
+    parser.add_argument(
+        '--chunk',
+        help='Number of timesteps per chunk of lazy data\n'
+             'default=%s\n\n' % DEFAULT_CHUNK,
+        type=int, default=DEFAULT_CHUNK
+    )
+
+    parser.add_argument(
+        '--streaming',
+        help='Process one forecast cycle at a time, keeping only running\n'
+             'daily maxima in memory (for long periods)\n\n',
+        action='store_true'
+    )
+
     # Parse the arguments, convert to dict
     args = vars(parser.parse_args())
 
@@ -121,6 +180,157 @@ def interpolate_template(template, context):
     return populated
 
 
+def date_context(args, variable, date):
+    """Build the context to fill the masks for a variable and forecast cycle.
+
+    Args:
+        args (dict) : Arguments dictionary from parse_args
+        variable (str) : Variable name
+        date (datetime.datetime) : Forecast cycle
+
+    Returns:
+        dict : Context for interpolate_template
+    """
+    context = dict(args)
+    context['variable'] = variable
+    context['yyyy'] = date.strftime('%Y')
+    context['mm'] = date.strftime('%m')
+    context['dd'] = date.strftime('%d')
+    context['hh'] = date.strftime('%H')
+
+    return context
+
+
+def get_filepath(args, variable, date):
+    """Get the filepath for the variable at a single forecast cycle.
+
+    Args:
+        args (dict) : Arguments dictionary from parse_args
+        variable (str) : Variable name
+        date (datetime.datetime) : Forecast cycle
+
+    Returns:
+        str : Filepath (which may not exist)
+    """
+    context = date_context(args, variable, date)
+
+    return os.path.join(
+        interpolate_template(args['directory_mask'], context),
+        interpolate_template(args['filename_mask'], context)
+    )
+
+
+def list_directory(directory):
+    """List the files in a directory, once (the listing is cached).
+
+    Args:
+        directory (str) : Path to the directory
+
+    Returns:
+        list : Names of the entries (empty if the directory doesn't exist)
+    """
+    if directory not in _directory_listings:
+        try:
+            _directory_listings[directory] = sorted(os.listdir(directory))
+        except (FileNotFoundError, NotADirectoryError):
+            _directory_listings[directory] = []
+
+    return _directory_listings[directory]
+
+
+def filename_regex(template, context):
+    """Compile a regular expression matching filenames from a template.
+
+    The date fields ({yyyy}, {mm}, {dd}, {hh}) become named groups; any
+    other field is replaced by its value in the context.
+
+    Args:
+        template (str) : Filename mask
+        context (dict) : Dictionary of variables
+
+    Returns:
+        re.Pattern : Compiled pattern
+    """
+    pattern = ''
+    seen = set()
+    parts = re.split(r'\{(\w+)\}', template)
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            pattern += re.escape(part)
+        elif part in DATE_FIELDS:
+            if part in seen:
+                pattern += '(?P=%s)' % part
+            else:
+                pattern += '(?P<%s>%s)' % (part, DATE_FIELDS[part])
+                seen.add(part)
+        elif part in context:
+            pattern += re.escape(str(context[part]))
+        else:
+            pattern += re.escape('{%s}' % part)
+
+    return re.compile('^%s$' % pattern)
+
+
+def index_filepaths(args, variable, dt=datetime.timedelta(hours=6)):
+    """Find the files for a variable from a listing of each directory.
+
+    Each directory (e.g. {yyyy}/{mm}) is listed once and its entries
+    matched against the filename mask, rather than checking every
+    expected file individually.
+
+    Args:
+        args (dict) : Arguments dictionary from parse_args
+        variable (str) : Variable name
+        dt (datetime.timedelta) : Interval between files
+
+    Returns:
+        tuple : (OrderedDict of cycle -> filepath, list of missing cycles)
+    """
+    # Every forecast cycle we expect to find
+    dates = []
+    current_date = args['start_date_obj']
+    while current_date <= args['end_date_obj']:
+        dates.append(current_date)
+        current_date += dt
+
+    # Index the files in each directory the cycles live in
+    context = date_context(args, variable, args['start_date_obj'])
+    regex = filename_regex(args['filename_mask'], context)
+    found = {}
+    for date in dates:
+        directory = interpolate_template(
+            args['directory_mask'], date_context(args, variable, date)
+        )
+        if directory in found:
+            continue
+        found[directory] = {}
+        for name in list_directory(directory):
+            match = regex.match(name)
+            if match:
+                fields = match.groupdict()
+                cycle = datetime.datetime(
+                    int(fields.get('yyyy', date.year)),
+                    int(fields.get('mm', date.month)),
+                    int(fields.get('dd', date.day)),
+                    int(fields.get('hh', date.hour))
+                )
+                found[directory][cycle] = os.path.join(directory, name)
+
+    # Match the expected cycles with what was found
+    filepaths = OrderedDict()
+    missing = []
+    for date in dates:
+        directory = interpolate_template(
+            args['directory_mask'], date_context(args, variable, date)
+        )
+        if date in found[directory]:
+            filepaths[date] = found[directory][date]
+        else:
+            missing.append(date)
+
+    return filepaths, missing
+
+
 def get_filepaths(args, variable, dt=datetime.timedelta(hours=6)):
     """Get all of the filepaths for the variable across directories.
 
@@ -132,57 +342,80 @@ def get_filepaths(args, variable, dt=datetime.timedelta(hours=6)):
     Returns:
         list : List of filepaths to load
     """
-    # Set an initial context
-    context = args
+    filepaths, missing = index_filepaths(args, variable, dt)
 
-    # Add the variable
-    context['variable'] = variable
+    # Report any gaps in the data
+    for date in missing:
+        print('Missing %s for cycle %s' % (variable, date))
+
+    return list(filepaths.values())
+
+
+def get_cycle_filepaths(args, variables, dt=datetime.timedelta(hours=6)):
+    """Get the filepaths of every variable, grouped by forecast cycle.
+
+    A variable missing from a cycle is left out of that cycle (its data
+    from the previous cycle covers the gap, as in batch mode); cycles
+    with no files at all are left out.
+
+    Args:
+        args (dict) : Arguments dictionary from parse_args
+        variables (list) : Variable names
+        dt (datetime.timedelta) : Interval between files
 
-    # Create an empty list of files
-    filepaths = []
+    Returns:
+        list : Dictionaries of variable -> filepath, in cycle order
+    """
+    index = OrderedDict(
+        (variable, index_filepaths(args, variable, dt)[0])
+        for variable in variables
+    )
+
+    cycles = []
 
-    # Loop through until we find all of the files
     current_date = args['start_date_obj']
     while current_date <= args['end_date_obj']:
 
-        # Update the context with the current date
-        context['yyyy'] = current_date.strftime('%Y')
-        context['mm'] = current_date.strftime('%m')
-        context['dd'] = current_date.strftime('%d')
-        context['hh'] = current_date.strftime('%H')
-
-        # Work out the filepath
-        filepath = os.path.join(
-            interpolate_template(args['directory_mask'], context),
-            interpolate_template(args['filename_mask'], context)
+        # Keep whichever variables the cycle has
+        cycle = OrderedDict(
+            (variable, index[variable][current_date])
+            for variable in variables if current_date in index[variable]
         )
+        for variable in variables:
+            if variable not in cycle:
+                print('Missing %s for cycle %s' % (variable, current_date))
+        if cycle:
+            cycles.append(cycle)
 
-        # If the file exists, add it to the list
-        if os.path.isfile(filepath):
-            filepaths.append(filepath)
 
         # Next time
         current_date += dt
 
-    # Return
-    return filepaths
+    return cycles
 
 
-def load_data(variable, filepaths):
+def load_data(variable, filepaths, bbox=None):
     """Load the data.
 
     Args:
         variable (str) : Name of the variable in the file
         filepaths (list) : List of files from get_filepaths
+        bbox (tuple) : (lon_W, lat_S, lon_E, lat_N) to subset to, or None
 
     Returns:
         iris.cube.CubeList : CubeList of data
     """
-    return iris.load(
+    cubes = iris.load(
         filepaths,
         iris.Constraint(cube_func=lambda cube: cube.var_name == variable)
     )
 
+    # Subset each file (lazily) so only the box is ever read
+    pad = BBOX_PAD.get(variable, 0)
+    return iris.cube.CubeList(
+        subset_bbox(cube, bbox, pad) for cube in cubes
+    )
+
 
 def remove_coord(cube, coord):
     """Remove a coordinate from a cube (when the Iris built-in fails).
@@ -200,48 +433,75 @@ def remove_coord(cube, coord):
     return cube
 
 
-def clean_data(cubes):
-    """There is metadata present that breaks the cube merge, this fixes that.
+def remove_overlap(current, next):
+    """Remove the times in a cube that are also covered by the next cube.
+
+    The cut is found with a binary search on the numeric time points and
+    applied by slicing, so lazy data stays lazy.
+
+    Args:
+        current (iris.cube.Cube) : Cube of data
+        next (iris.cube.Cube) : Cube from the following forecast cycle
+
+    Returns:
+        iris.cube.Cube : Subset of the current cube (None if it is
+            entirely overlapped by the next cube)
+    """
+    time = current.coord('time')
+    next_time = next.coord('time')
+
+    # First time of the next cube, in the units of the current cube
+    first = next_time.units.convert(next_time.points[0], time.units)
+
+    # Work out where to slice
+    index = np.searchsorted(time.points, first, side='left')
+    if index == 0:
+        return None
+    if index == len(time.points):
+        return current
+
+    # Subset the current cube
+    keys = [slice(None)] * current.ndim
+    keys[current.coord_dims(time)[0]] = slice(0, index)
+    return current[tuple(keys)]
+
+
+def strip_metadata(cubes):
+    """Remove the metadata that breaks the cube merge, in a single pass.
 
     Args:
         cubes (iris.cube.CubeList) : List of cubes
 
     Returns:
-        iris.cube.CubeList : Cleaned data that *should* merge
+        iris.cube.CubeList : The same cubes, sans offending metadata
     """
-    # Remove offending data
     for cube in cubes:
         cube.coord('time').attributes = {}
-        cube.remove_coord('forecast_reference_time')
-
-    # Remove overlapping data
-    for i in range(len(cubes) - 1):
-
-        # Get the current and next cubes
-        current, next = cubes[i], cubes[i+1]
+        remove_coord(cube, 'forecast_reference_time')
 
-        # Work out where to slice
-        _slice = next.coord('time').cell(0)
+    return cubes
 
-        # Build up a constraint to actually slice
-        time_constraint = iris.Constraint(
-            time = lambda cell: cell < _slice
-        )
 
-        # Subset the current cube
-        current = current.extract(time_constraint)
+def clean_data(cubes):
+    """There is metadata present that breaks the cube merge, this fixes that.
 
-        # Remove offending metadata
-        frt = 'forecast_reference_time'
-        current.coord('time').attributes = {}
-        current = remove_coord(current, frt)
+    Args:
+        cubes (iris.cube.CubeList) : List of cubes
 
-        # Replace cube in list with an updated one
-        cubes[i] = current
+    Returns:
+        iris.cube.CubeList : Cleaned data that *should* merge
+    """
+    # Remove offending metadata (slices below inherit the clean metadata)
+    strip_metadata(cubes)
 
-    # Remove the offending metadata on the last one (for some reason it lives?)
-    cubes[-1].coord('time').attributes = {}
-    cubes[-1] = remove_coord(cubes[-1], frt)
+    # Remove overlapping data
+    trimmed = [
+        remove_overlap(current, next)
+        for current, next in zip(cubes[:-1], cubes[1:])
+    ]
+    cubes = iris.cube.CubeList(
+        cube for cube in trimmed + [cubes[-1]] if cube is not None
+    )
 
     # Equalise metadata (delete anything that isn't consistent)
     equalise_attributes(cubes)
@@ -253,6 +513,286 @@ def clean_data(cubes):
     return cubes
 
 
+def load_and_clean(variable, filepaths, bbox=None):
+    """Load and clean the data for a variable.
+
+    Args:
+        variable (str) : Name of the variable in the file
+        filepaths (list) : List of files from get_filepaths
+        bbox (tuple) : (lon_W, lat_S, lon_E, lat_N) to subset to, or None
+
+    Returns:
+        iris.cube.CubeList : Cleaned data that *should* merge
+    """
+    return clean_data(load_data(variable, filepaths, bbox))
+
+
+def split_list(items, n):
+    """Split a list into (at most) n contiguous, similarly sized chunks.
+
+    Args:
+        items (list) : List to split
+        n (int) : Number of chunks
+
+    Returns:
+        list : List of lists, in the original order
+    """
+    size, extra = divmod(len(items), n)
+    chunks, start = [], 0
+    for i in range(n):
+        end = start + size + (1 if i < extra else 0)
+        if end > start:
+            chunks.append(items[start:end])
+        start = end
+
+    return chunks
+
+
+def load_variables(filepaths, workers=1, split_files=False, bbox=None):
+    """Load and clean several variables, optionally across processes.
+
+    Each variable is loaded and cleaned by its own worker. With
+    split_files, the files of each variable are also shared between the
+    workers and the pieces are joined (in file order) before cleaning.
+
+    Args:
+        filepaths (dict) : Variable -> list of files from get_filepaths
+        workers (int) : Number of processes (1 loads sequentially)
+        split_files (bool) : Share the files of each variable between workers
+        bbox (tuple) : (lon_W, lat_S, lon_E, lat_N) to subset to, or None
+
+    Returns:
+        OrderedDict : Variable -> cleaned iris.cube.CubeList
+    """
+    if workers <= 1:
+        return OrderedDict(
+            (variable, load_and_clean(variable, paths, bbox))
+            for variable, paths in filepaths.items()
+        )
+
+    # Spawn (rather than fork) so workers don't inherit netCDF/HDF5 locks
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+
+        if not split_files:
+            futures = OrderedDict(
+                (variable, pool.submit(load_and_clean, variable, paths, bbox))
+                for variable, paths in filepaths.items()
+            )
+            return OrderedDict(
+                (variable, future.result())
+                for variable, future in futures.items()
+            )
+
+        # Submit every chunk of every variable before waiting on any
+        futures = OrderedDict(
+            (variable, [pool.submit(load_data, variable, chunk, bbox)
+                        for chunk in split_list(paths, workers)])
+            for variable, paths in filepaths.items()
+        )
+
+    cubes = OrderedDict()
+    for variable, chunks in futures.items():
+        joined = iris.cube.CubeList()
+        for future in chunks:
+            joined.extend(future.result())
+        cubes[variable] = clean_data(joined)
+
+    return cubes
+
+
+def load_cycle(filepaths, bbox=None):
+    """Load (lazily) one cube per variable for a single forecast cycle.
+
+    Args:
+        filepaths (dict) : Variable -> filepath, from get_cycle_filepaths
+        bbox (tuple) : (lon_W, lat_S, lon_E, lat_N) to subset to, or None
+
+    Returns:
+        dict : Variable -> iris.cube.Cube
+    """
+    return OrderedDict(
+        (variable, load_data(variable, [filepath], bbox)[0])
+        for variable, filepath in filepaths.items()
+    )
+
+
+def fold_daily_max(days, cube):
+    """Fold a chunk of data into running maxima for each day of the year.
+
+    Args:
+        days (OrderedDict) : Day of year -> cube of the running maximum
+        cube (iris.cube.Cube) : Chunk of data covering part of the event
+
+    Returns:
+        OrderedDict : The updated running maxima
+    """
+    # Keep all of the days on the time units of the first one
+    if days:
+        units = next(iter(days.values())).coord('time').units
+        cube.coord('time').convert_units(units)
+
+    ct.add_day_of_year(cube, 'time')
+    daily = cube.aggregated_by(['day_of_year'], iris.analysis.MAX)
+
+    for day in daily.slices_over('day_of_year'):
+        key = day.coord('day_of_year').points[0]
+
+        if key in days:
+            # Combine with the maximum so far, widening the time bounds
+            previous = days[key]
+            bounds = np.concatenate([
+                previous.coord('time').bounds, day.coord('time').bounds
+            ])
+            lower, upper = bounds.min(), bounds.max()
+            day = previous.copy(data=np.maximum(previous.data, day.data))
+            day.coord('time').points = [(lower + upper) / 2.]
+            day.coord('time').bounds = [[lower, upper]]
+        else:
+            # Realise the data so the source file can be released
+            day.data
+
+        days[key] = day
+
+    return days
+
+
+def subset_time(cube, index):
+    """Subset a cube along its time dimension.
+
+    Args:
+        cube (iris.cube.Cube) : Cube of data
+        index (slice or numpy.ndarray) : Time indices to keep
+
+    Returns:
+        iris.cube.Cube : Subset of the cube
+    """
+    keys = [slice(None)] * cube.ndim
+    keys[cube.coord_dims('time')[0]] = index
+    return cube[tuple(keys)]
+
+
+def pair_winds(winds):
+    """Match up the U and V data waiting to be turned into wind speed.
+
+    U and V are trimmed independently, so a file missing for one of them
+    leaves their cubes covering different times; wind speed is only
+    calculated for the times both have, once both have them.
+
+    Args:
+        winds (dict) : uwnd10m/vwnd10m -> list of trimmed cubes, oldest
+            first (consumed in place)
+
+    Returns:
+        list : (uwnd10m, vwnd10m) pairs of cubes on the same times
+    """
+    pairs = []
+    while winds['uwnd10m'] and winds['vwnd10m']:
+        uwnd10m = winds['uwnd10m'][0]
+        vwnd10m = winds['vwnd10m'][0]
+
+        # Compare the times in the units of U
+        units = uwnd10m.coord('time').units
+        u_times = uwnd10m.coord('time').points
+        v_time = vwnd10m.coord('time')
+        v_times = v_time.units.convert(v_time.points, units)
+
+        _, u_index, v_index = np.intersect1d(u_times, v_times,
+                                             return_indices=True)
+        if len(u_index):
+            vwnd = subset_time(vwnd10m, v_index)
+            vwnd.coord('time').convert_units(units)
+            pairs.append((subset_time(uwnd10m, u_index), vwnd))
+
+        # Drop whatever is now behind both of them
+        end = min(u_times[-1], v_times[-1])
+        u_keep = u_times > end
+        v_keep = v_times > end
+        for variable, cube, keep in [('uwnd10m', uwnd10m, u_keep),
+                                     ('vwnd10m', vwnd10m, v_keep)]:
+            if keep.any():
+                winds[variable][0] = subset_time(cube, np.flatnonzero(keep))
+            else:
+                winds[variable].pop(0)
+
+    return pairs
+
+
+def merge_days(days):
+    """Merge the running daily maxima back into a single cube.
+
+    Args:
+        days (OrderedDict) : Day of year -> cube of the daily maximum
+
+    Returns:
+        iris.cube.Cube : Daily maxima along the time dimension
+    """
+    cubes = iris.cube.CubeList(days.values())
+    equalise_attributes(cubes)
+
+    return cubes.merge_cube()
+
+
+def stream_daily_max(args):
+    """Calculate daily maximum wind speed and gust, one cycle at a time.
+
+    Each file is loaded, trimmed where the next file of the same
+    variable overlaps it (as clean_data does in batch mode) and folded
+    into running daily maxima before moving on, so memory is bounded by
+    a single cycle plus the maxima. A missing file only affects its own
+    variable.
+
+    Args:
+        args (dict) : Arguments dictionary from parse_args
+
+    Returns:
+        tuple : (max_speed, max_gust) cubes of daily maxima
+    """
+    variables = ['uwnd10m', 'vwnd10m', 'max_wndgust10m']
+    cycles = get_cycle_filepaths(args, variables)
+    print('Forecast cycles = %s' % len(cycles))
+
+    speed_days = OrderedDict()
+    gust_days = OrderedDict()
+
+    # Each variable is trimmed against its own next file, so a file
+    # missing for one variable doesn't lose the others
+    pending = OrderedDict()
+    winds = {'uwnd10m': [], 'vwnd10m': []}
+
+    def fold(variable, cube):
+        # Nothing left once the next file is taken into account
+        if cube is None:
+            return
+        cube = chunk_time(cube, args['chunk'])
+
+        if variable == 'max_wndgust10m':
+            fold_daily_max(gust_days, cube)
+            return
+
+        # Regrid U onto V and calculate wind speed
+        winds[variable].append(cube)
+        for uwnd10m, vwnd10m in pair_winds(winds):
+            vwnd10m = regrid_linear(vwnd10m, uwnd10m)
+            fold_daily_max(speed_days, wind_speed(uwnd10m, vwnd10m))
+
+    for i, cycle in enumerate(cycles):
+        print('Processing cycle %s of %s' % (i + 1, len(cycles)))
+
+        current = load_cycle(cycle, args['bbox'])
+        strip_metadata(current.values())
+        for variable, cube in current.items():
+            if variable in pending:
+                fold(variable, remove_overlap(pending[variable], cube))
+            pending[variable] = cube
+
+    # The last file of each variable isn't overlapped by anything
+    for variable, cube in pending.items():
+        fold(variable, cube)
+
+    return merge_days(speed_days), merge_days(gust_days)
+
+
 if __name__ == '__main__':
 
     start_time = time.time()
@@ -261,56 +801,73 @@ if __name__ == '__main__':
     args = parse_args()
     pprint(args)
 
-    # Get the filepaths
-    print('Getting filepaths')
-    uwnd10m_filepaths = get_filepaths(args, 'uwnd10m')
-    vwnd10m_filepaths = get_filepaths(args, 'vwnd10m')
-    max_wndgust10m_filepaths = get_filepaths(args, 'max_wndgust10m')
-
-    # List the numebr of files
-    print('uwnd10m_filepaths = %s' % len(uwnd10m_filepaths))
-    print('vwnd10m_filepaths = %s' % len(vwnd10m_filepaths))
-    print('max_wndgust10m_filepaths = %s' % len(max_wndgust10m_filepaths))
-
-    # Load the data
-    print('Loading uwnd10m, this may take a while...')
-    uwnd10m = load_data('uwnd10m', uwnd10m_filepaths)
-    print('Loading vwnd10m, this may take a while...')
-    vwnd10m = load_data('vwnd10m', vwnd10m_filepaths)
-    print('Loading max_wndgust10m, this may take a while...')
-    max_wndgust10m = load_data('max_wndgust10m', max_wndgust10m_filepaths)
-
-    # Clean the data
-    print('Cleaning data...')
-    uwnd10m = clean_data(uwnd10m)
-    vwnd10m = clean_data(vwnd10m)
-    max_wndgust10m = clean_data(max_wndgust10m)
-
-    # Concatenate into single cubes
-    print('Concatenating cubes...')
-    uwnd10m = uwnd10m.concatenate_cube()
-    vwnd10m = vwnd10m.concatenate_cube()
-    max_wndgust10m = max_wndgust10m.concatenate_cube()
-
-    # Regrid U onto V
-    print('Regridding U onto V (so they align in space)...')
-    interpolator = iris.analysis.Linear()
-    vwnd10m = vwnd10m.regrid(uwnd10m, interpolator)
-
-    # Create a cube of wind speed
-    print('Calculating wind speed...')
-    windspeed = (uwnd10m ** 2 + vwnd10m ** 2) ** 0.5
-    windspeed.rename('windspeed')
-    
-    # Create extra coordinate for daily statistics
-    ct.add_day_of_year(windspeed, 'time')
-    ct.add_day_of_year(max_wndgust10m, 'time')
-
-    print('Calculating max wind speed...')
-    max_speed = windspeed.aggregated_by(['day_of_year'], iris.analysis.MAX)
-
-    print('Calculating max (max) gust...')
-    max_gust = max_wndgust10m.aggregated_by(['day_of_year'], iris.analysis.MAX)
+    if args['streaming']:
+
+        # Fold each forecast cycle into running daily maxima
+        print('Streaming daily maxima...')
+        max_speed, max_gust = stream_daily_max(args)
+
+    else:
+
+        # Get the filepaths
+        print('Getting filepaths')
+        uwnd10m_filepaths = get_filepaths(args, 'uwnd10m')
+        vwnd10m_filepaths = get_filepaths(args, 'vwnd10m')
+        max_wndgust10m_filepaths = get_filepaths(args, 'max_wndgust10m')
+
+        # List the numebr of files
+        print('uwnd10m_filepaths = %s' % len(uwnd10m_filepaths))
+        print('vwnd10m_filepaths = %s' % len(vwnd10m_filepaths))
+        print('max_wndgust10m_filepaths = %s' % len(max_wndgust10m_filepaths))
+
+        # Load and clean the data
+        print('Loading and cleaning data (%s workers), this may take a while...'
+              % args['workers'])
+        cubes = load_variables(
+            OrderedDict([
+                ('uwnd10m', uwnd10m_filepaths),
+                ('vwnd10m', vwnd10m_filepaths),
+                ('max_wndgust10m', max_wndgust10m_filepaths)
+            ]),
+            workers=args['workers'], split_files=args['split_files'],
+            bbox=args['bbox']
+        )
+        uwnd10m = cubes['uwnd10m']
+        vwnd10m = cubes['vwnd10m']
+        max_wndgust10m = cubes['max_wndgust10m']
+
+        # Concatenate into single cubes
+        print('Concatenating cubes...')
+        uwnd10m = uwnd10m.concatenate_cube()
+        vwnd10m = vwnd10m.concatenate_cube()
+        max_wndgust10m = max_wndgust10m.concatenate_cube()
+
+        # Keep the data lazy, chunked along time
+        uwnd10m = chunk_time(uwnd10m, args['chunk'])
+        vwnd10m = chunk_time(vwnd10m, args['chunk'])
+        max_wndgust10m = chunk_time(max_wndgust10m, args['chunk'])
+
+        # Regrid U onto V
+        print('Regridding U onto V (so they align in space)...')
+        vwnd10m = regrid_linear(vwnd10m, uwnd10m)
+
+        # Create a cube of wind speed
+        print('Calculating wind speed...')
+        windspeed = wind_speed(uwnd10m, vwnd10m)
+
+        # Create extra coordinate for daily statistics
+        ct.add_day_of_year(windspeed, 'time')
+        ct.add_day_of_year(max_wndgust10m, 'time')
+
+        print('Calculating max wind speed...')
+        max_speed = windspeed.aggregated_by(['day_of_year'], iris.analysis.MAX)
+
+        print('Calculating max (max) gust...')
+        max_gust = max_wndgust10m.aggregated_by(['day_of_year'], iris.analysis.MAX)
+
+        # Only the daily maxima are ever realised (in a single pass)
+        print('Realising daily maxima...')
+        realise([max_speed, max_gust])
 
     # Event maximum
     print('Calculating event maxima...')
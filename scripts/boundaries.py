@@ -0,0 +1,373 @@
+####################################################
+#   Store of region boundaries (e.g. the ABS SA1 polygons)
+#       clipped to a forecast domain, cached in a binary format
+#       keyed on the source file, with an index from region code to
+#       row so that impacts are joined to their regions by a take
+#       rather than a merge against every region in Australia.
+####################################################
+
+# Usage (build the store ahead of time for a domain):
+#   python boundaries.py /g/data/w85/BNHCRC/exposure/SA1_2016_AUST.shp
+#       -b 150.5 -34.0 153.0 -31.5
+
+# Import modules
+import os
+import hashlib
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+from exposure import checksum
+
+# GeoParquet is quickest to read, but needs pyarrow; pickle needs nothing
+try:
+    import pyarrow  # noqa: F401
+    STORE_FORMAT = 'parquet'
+except ImportError:
+    STORE_FORMAT = 'pkl'
+
+# Field of the boundary file holding the region code
+BOUNDARY_CODE = 'SA1_MAIN16'
+
+# Field of the impact data holding the region code
+IMPACT_CODE = 'SA1_CODE'
+
+
+def store_path(filepath, bbox=None, cache_dir=None, tolerance=None,
+               codes=None, code=BOUNDARY_CODE):
+    """Path of the store of a boundary file, clipped to a bounding box.
+
+    Args:
+        filepath (str) : Path of the boundary file (e.g. a shapefile)
+        bbox (tuple) : (lon_W, lat_S, lon_E, lat_N), or None for all regions
+        cache_dir (str) : Directory of the store (default: alongside the file)
+        tolerance (float) : Simplification tolerance, or None for none
+        codes (numpy.ndarray) : Sorted region codes, for a store of just
+            those regions (instead of a bounding box)
+        code (str) : Field holding the region code, which the store is
+            sorted on
+
+    Returns:
+        str : Path of the store
+    """
+    if cache_dir is None:
+        cache_dir = os.path.dirname(os.path.abspath(filepath))
+
+    # The attributes of a shapefile are held in its .dbf file
+    base = os.path.splitext(filepath)[0]
+    sources = [filepath] + [base + ext for ext in ['.dbf']
+                            if os.path.isfile(base + ext)]
+    key = ''.join(checksum(source, cache_dir)[:8] for source in sources)
+
+    if codes is not None:
+        domain = 'codes%s' % hashlib.sha1(
+            np.asarray(codes, dtype=np.int64).tobytes()
+        ).hexdigest()[:16]
+    elif bbox is None:
+        domain = 'all'
+    else:
+        domain = '_'.join('%g' % x for x in bbox)
+    if tolerance:
+        domain += '.simplify%g' % tolerance
+
+    return os.path.join(cache_dir, '%s.%s.%s.%s.%s' % (
+        os.path.basename(base), key, code, domain, STORE_FORMAT
+    ))
+
+
+def read_store(filepath):
+    """Read a boundary store.
+
+    Args:
+        filepath (str) : Path of the store
+
+    Returns:
+        geopandas.GeoDataFrame : Region boundaries
+    """
+    if STORE_FORMAT == 'parquet':
+        return gpd.read_parquet(filepath)
+
+    return pd.read_pickle(filepath)
+
+
+def write_store(gdf, filepath):
+    """Write a boundary store, replacing it in one step.
+
+    Args:
+        gdf (geopandas.GeoDataFrame) : Region boundaries
+        filepath (str) : Path of the store
+    """
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+    # Write alongside and then rename, so readers never see a partial file
+    tmp_filepath = '%s.%d.tmp' % (filepath, os.getpid())
+    if STORE_FORMAT == 'parquet':
+        gdf.to_parquet(tmp_filepath)
+    else:
+        gdf.to_pickle(tmp_filepath)
+    os.replace(tmp_filepath, filepath)
+
+
+def simplify_boundaries(gdf, tolerance):
+    """Simplify region boundaries, keeping neighbouring regions joined up.
+
+    Args:
+        gdf (geopandas.GeoDataFrame) : Region boundaries
+        tolerance (float) : Largest distance a simplified boundary may
+            move (in the units of the boundaries, e.g. degrees)
+
+    Returns:
+        geopandas.GeoDataFrame : Copy with simplified geometries
+    """
+    gdf = gdf.copy()
+    gdf.geometry = gdf.geometry.simplify(tolerance, preserve_topology=True)
+
+    return gdf
+
+
+def load_boundaries(filepath, bbox=None, code=BOUNDARY_CODE, cache_dir=None,
+                    tolerance=None):
+    """Load the regions intersecting a bounding box, from the store if built.
+
+    The first time a boundary file is loaded for a domain only the
+    regions intersecting it are read (using the spatial index of the
+    file, if it has one), sorted by code and stored. Each level of
+    simplification is stored alongside, built from the full resolution
+    store.
+
+    Args:
+        filepath (str) : Path of the boundary file (e.g. a shapefile)
+        bbox (tuple) : (lon_W, lat_S, lon_E, lat_N), or None for all regions
+        code (str) : Field holding the region code
+        cache_dir (str) : Directory of the store (default: alongside the file)
+        tolerance (float) : Simplification tolerance (e.g. degrees), or
+            None for full resolution
+
+    Returns:
+        geopandas.GeoDataFrame : Region boundaries, with an integer code
+    """
+    stored = store_path(filepath, bbox, cache_dir, tolerance, code=code)
+    if os.path.isfile(stored):
+        return read_store(stored)
+
+    if tolerance:
+        gdf = simplify_boundaries(
+            load_boundaries(filepath, bbox, code, cache_dir), tolerance
+        )
+    else:
+        gdf = gpd.read_file(filepath, bbox=tuple(bbox) if bbox else None)
+
+        # Integer codes join faster than strings, and sorting them lets
+        # code_index use a binary search
+        gdf[code] = gdf[code].astype(np.int64)
+        gdf = gdf.sort_values(code).reset_index(drop=True)
+
+    try:
+        write_store(gdf, stored)
+    except OSError as e:
+        # A read-only directory shouldn't stop the run
+        print('Unable to store %s: %s' % (filepath, e))
+
+    return gdf
+
+
+def read_regions(filepath, codes, code=BOUNDARY_CODE, batch=5000):
+    """Read only the regions with the given codes from a boundary file.
+
+    The codes are passed to the reader as an attribute filter, so the
+    other regions are never parsed.
+
+    Args:
+        filepath (str) : Path of the boundary file (e.g. a shapefile)
+        codes (list) : Region codes to read
+        code (str) : Field holding the region code
+        batch (int) : Number of codes in each filter expression
+
+    Returns:
+        geopandas.GeoDataFrame : Region boundaries, with an integer code
+    """
+    codes = np.unique(np.asarray(codes, dtype=np.int64))
+
+    # Codes are held as text in the ABS boundary files
+    parts = []
+    for start in range(0, len(codes), batch):
+        where = "%s IN (%s)" % (code, ','.join(
+            "'%d'" % value for value in codes[start:start + batch]
+        ))
+        parts.append(gpd.read_file(filepath, where=where))
+    gdf = pd.concat(parts, ignore_index=True) if parts else \
+        gpd.read_file(filepath, rows=0)
+
+    gdf[code] = gdf[code].astype(np.int64)
+    return gdf.sort_values(code).reset_index(drop=True)
+
+
+def load_regions(filepath, codes, code=BOUNDARY_CODE, cache_dir=None,
+                 tolerance=None):
+    """Load the regions with the given codes, from the store if built.
+
+    The regions are read with read_regions and stored, keyed on the
+    boundary file, the set of codes and the simplification tolerance,
+    so a rerun for the same regions reads the store.
+
+    Args:
+        filepath (str) : Path of the boundary file (e.g. a shapefile)
+        codes (list) : Region codes to read
+        code (str) : Field holding the region code
+        cache_dir (str) : Directory of the store (default: alongside the file)
+        tolerance (float) : Simplification tolerance (e.g. degrees), or
+            None for full resolution
+
+    Returns:
+        geopandas.GeoDataFrame : Region boundaries, with an integer code
+    """
+    codes = np.unique(np.asarray(codes, dtype=np.int64))
+
+    stored = store_path(filepath, cache_dir=cache_dir, tolerance=tolerance,
+                        codes=codes, code=code)
+    if os.path.isfile(stored):
+        return read_store(stored)
+
+    gdf = read_regions(filepath, codes, code)
+    if tolerance:
+        gdf = simplify_boundaries(gdf, tolerance)
+
+    try:
+        write_store(gdf, stored)
+    except OSError as e:
+        # A read-only directory shouldn't stop the run
+        print('Unable to store %s: %s' % (filepath, e))
+
+    return gdf
+
+
+def code_index(boundaries, code=BOUNDARY_CODE):
+    """Index from region code to row of the boundaries.
+
+    Args:
+        boundaries (geopandas.GeoDataFrame) : From load_boundaries
+        code (str) : Field holding the region code
+
+    Returns:
+        pandas.Index : Integer codes, in the order of the rows
+    """
+    return pd.Index(boundaries[code].values.astype(np.int64))
+
+
+def join_boundaries(impacts, boundaries, impactcode=IMPACT_CODE,
+                    boundarycode=BOUNDARY_CODE):
+    """Attach the boundary of its region to each row of an impact table.
+
+    Rows whose region isn't in the boundaries (e.g. outside the domain)
+    are dropped.
+
+    Args:
+        impacts (pandas.DataFrame) : One row per region
+        boundaries (geopandas.GeoDataFrame) : From load_boundaries
+        impactcode (str) : Field of the impacts holding the region code
+        boundarycode (str) : Field of the boundaries holding the region code
+
+    Returns:
+        geopandas.GeoDataFrame : Boundaries of the regions with their impacts
+    """
+    codes = pd.to_numeric(impacts[impactcode], errors='coerce')
+    rows = code_index(boundaries, boundarycode).get_indexer(codes)
+    found = rows >= 0
+
+    result = boundaries.take(rows[found]).reset_index(drop=True)
+    values = impacts.loc[found].drop(columns=impactcode).reset_index(drop=True)
+    for column in values.columns:
+        result[column] = values[column].values
+
+    return result
+
+
+def aggregate_impacts(impacts, boundaries, aggregations,
+                      impactcode=IMPACT_CODE, boundarycode=BOUNDARY_CODE):
+    """Aggregate per-asset impacts by region and attach the boundaries.
+
+    Args:
+        impacts (pandas.DataFrame) : One row per asset, with a region code
+        boundaries (geopandas.GeoDataFrame) : From load_boundaries
+        aggregations (dict) : Column -> list of statistics, as in the
+            HazImp aggregation kwargs (e.g. structural_loss: [mean, sum])
+        impactcode (str) : Field of the impacts holding the region code
+        boundarycode (str) : Field of the boundaries holding the region code
+
+    Returns:
+        geopandas.GeoDataFrame : Boundaries of the regions with the
+            aggregated impacts, in columns named <column>_<statistic>
+    """
+    grouped = impacts.groupby(impactcode).agg(aggregations)
+    grouped.columns = ['%s_%s' % column for column in grouped.columns]
+
+    return join_boundaries(grouped.reset_index(), boundaries,
+                           impactcode, boundarycode)
+
+
+def parse_args():
+    """Parse arguments for the script.
+
+    Returns:
+        dict : Dictionary of arguments passed to the script
+    """
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+
+    parser.add_argument(
+        'boundary_file',
+        help='Boundary file (e.g. SA1_2016_AUST.shp)\n\n',
+        type=str
+    )
+
+    parser.add_argument(
+        '-b', '--bbox',
+        help='Bounding box of the domain: lon_W lat_S lon_E lat_N\n'
+             'default=all regions\n\n',
+        type=float, nargs=4, default=None
+    )
+
+    parser.add_argument(
+        '-c', '--code',
+        help='Field holding the region code\ndefault=%s\n\n' % BOUNDARY_CODE,
+        type=str, default=BOUNDARY_CODE
+    )
+
+    parser.add_argument(
+        '-t', '--tolerance',
+        help='Also store boundaries simplified to these tolerances\n\n',
+        type=float, nargs='+', default=[]
+    )
+
+    parser.add_argument(
+        '--cache_dir',
+        help='Directory of the store\ndefault=alongside the boundary file\n\n',
+        type=str, default=None
+    )
+
+    return vars(parser.parse_args())
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+
+    start_time = time.time()
+    gdf = load_boundaries(args['boundary_file'], args['bbox'], args['code'],
+                          args['cache_dir'])
+    print('Stored %d regions as %s in %.1f seconds' % (
+        len(gdf), store_path(args['boundary_file'], args['bbox'],
+                             args['cache_dir'], code=args['code']),
+        time.time() - start_time
+    ))
+
+    for tolerance in args['tolerance']:
+        load_boundaries(args['boundary_file'], args['bbox'], args['code'],
+                        args['cache_dir'], tolerance)
+        print('Stored boundaries simplified to %g as %s' % (
+            tolerance, store_path(args['boundary_file'], args['bbox'],
+                                  args['cache_dir'], tolerance,
+                                  code=args['code'])
+        ))
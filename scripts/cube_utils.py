@@ -0,0 +1,296 @@
+####################################################
+#   Helpers shared by the hazard scripts (barra.py and
+#       op_hazard_output.py) for working with cubes of
+#       model data without realising the whole event in memory.
+####################################################
+
+# Import modules
+import dask
+import dask.array as da
+import numpy as np
+import iris.analysis
+import iris.analysis.maths
+from iris.cube import Cube
+
+# Default number of timesteps per chunk of lazy data
+DEFAULT_CHUNK = 24
+
+# Interpolation weights, keyed on the source and target grid coordinates
+_weights_cache = {}
+
+# Index ranges of bounding boxes, keyed on the grid coordinates
+_bbox_cache = {}
+
+
+def chunk_time(cube, chunk=DEFAULT_CHUNK):
+    """Make a cube's data lazy, chunked along the (leading) time dimension.
+
+    Args:
+        cube (iris.cube.Cube) : Cube with time as the first dimension
+        chunk (int) : Number of timesteps per chunk
+
+    Returns:
+        iris.cube.Cube : The same cube, with lazy rechunked data
+    """
+    data = cube.lazy_data()
+    chunks = (chunk,) + tuple(-1 for _ in data.shape[1:])
+    cube.data = data.rechunk(chunks)
+
+    return cube
+
+
+def wind_speed(uwnd, vwnd, name='windspeed'):
+    """Calculate wind speed from u and v components.
+
+    Uses a single hypot per chunk rather than cube arithmetic, which
+    builds u ** 2, v ** 2 and their sum as separate full-size arrays.
+    The result is lazy if the inputs are.
+
+    Args:
+        uwnd (iris.cube.Cube) : Eastward wind component
+        vwnd (iris.cube.Cube) : Northward wind component (same grid as uwnd)
+        name (str) : Name of the resulting cube
+
+    Returns:
+        iris.cube.Cube : Wind speed
+    """
+    return iris.analysis.maths.apply_ufunc(
+        np.hypot, uwnd, vwnd, new_unit=uwnd.units, new_name=name
+    )
+
+
+def realise(cubes):
+    """Realise the data of several lazy cubes in a single pass.
+
+    Cubes computed from the same source data (e.g. daily maxima of wind
+    speed and gust) share their reads rather than each re-reading it.
+
+    Args:
+        cubes (list) : Cubes to realise (in place)
+
+    Returns:
+        list : The same cubes, with real data
+    """
+    lazy = [cube for cube in cubes if cube.has_lazy_data()]
+    results = dask.compute(*[cube.lazy_data() for cube in lazy])
+    for cube, data in zip(lazy, results):
+        cube.data = data
+
+    return cubes
+
+
+def coord_slice(points, lower, upper, pad=0):
+    """Index range of the points within [lower, upper] (plus padding).
+
+    Args:
+        points (numpy.ndarray) : Monotonic coordinate points
+        lower (float) : Lower limit (inclusive)
+        upper (float) : Upper limit (inclusive)
+        pad (int) : Extra points to include either side
+
+    Returns:
+        slice : Index range into the points
+    """
+    inside = np.flatnonzero((points >= lower) & (points <= upper))
+    if not len(inside):
+        raise ValueError('No points between %s and %s' % (lower, upper))
+
+    start = max(inside[0] - pad, 0)
+    stop = min(inside[-1] + 1 + pad, len(points))
+
+    return slice(start, stop)
+
+
+def bbox_slices(cube, bbox, pad=0):
+    """Get (and cache) the index ranges of a bounding box on a cube's grid.
+
+    Args:
+        cube (iris.cube.Cube) : Cube with 1-D latitude and longitude
+        bbox (tuple) : (lon_W, lat_S, lon_E, lat_N) in degrees
+        pad (int) : Extra grid cells to include either side
+
+    Returns:
+        tuple : Index keys for the cube, selecting the bounding box
+    """
+    lon_W, lat_S, lon_E, lat_N = bbox
+    lat = cube.coord('latitude')
+    lon = cube.coord('longitude')
+
+    key = (lat.points.tobytes(), lon.points.tobytes(), tuple(bbox), pad)
+    if key not in _bbox_cache:
+        _bbox_cache[key] = (
+            coord_slice(lat.points, lat_S, lat_N, pad),
+            coord_slice(lon.points, lon_W, lon_E, pad)
+        )
+    lat_slice, lon_slice = _bbox_cache[key]
+
+    keys = [slice(None)] * cube.ndim
+    keys[cube.coord_dims(lat)[0]] = lat_slice
+    keys[cube.coord_dims(lon)[0]] = lon_slice
+
+    return tuple(keys)
+
+
+def subset_bbox(cube, bbox, pad=0):
+    """Subset a cube to a bounding box by indexing.
+
+    Unlike an iris.Constraint on latitude/longitude this needs no Python
+    callback per point, and on lazy (file-backed) data only the hyperslab
+    inside the box is ever read from disk.
+
+    Args:
+        cube (iris.cube.Cube) : Cube with 1-D latitude and longitude
+        bbox (tuple) : (lon_W, lat_S, lon_E, lat_N) in degrees, or None
+        pad (int) : Extra grid cells to include either side
+
+    Returns:
+        iris.cube.Cube : Subset of the cube (the cube itself if bbox is None)
+    """
+    if bbox is None:
+        return cube
+
+    return cube[bbox_slices(cube, bbox, pad)]
+
+
+def linear_weights(source, target):
+    """Weights to linearly interpolate along one axis of a rectilinear grid.
+
+    Each target point is a blend of source points i and i + 1; points
+    beyond the source grid are linearly extrapolated (as iris.analysis.Linear
+    does by default).
+
+    Args:
+        source (numpy.ndarray) : Monotonic source coordinate points
+        target (numpy.ndarray) : Target coordinate points
+
+    Returns:
+        tuple : (index, fraction) arrays; the weight of source point
+            index + 1 is fraction and of index is 1 - fraction
+    """
+    source = np.asarray(source, dtype=np.float64)
+    target = np.asarray(target, dtype=np.float64)
+
+    # Work on ascending points, mapping the indices back afterwards
+    if source[0] > source[-1]:
+        index, fraction = linear_weights(source[::-1], target)
+        return len(source) - 2 - index, 1. - fraction
+
+    index = np.searchsorted(source, target, side='right') - 1
+    index = np.clip(index, 0, len(source) - 2)
+    fraction = (target - source[index]) / (source[index + 1] - source[index])
+
+    return index, fraction
+
+
+def grid_weights(source, target):
+    """Get (and cache) the interpolation weights between two lat/lon grids.
+
+    Args:
+        source (iris.cube.Cube) : Cube on the source grid
+        target (iris.cube.Cube) : Cube on the target grid
+
+    Returns:
+        tuple : (lat_weights, lon_weights) from linear_weights
+    """
+    points = [cube.coord(name).points
+              for cube in [source, target]
+              for name in ['latitude', 'longitude']]
+    key = tuple(p.astype(np.float64).tobytes() for p in points)
+
+    if key not in _weights_cache:
+        src_lat, src_lon, tgt_lat, tgt_lon = points
+        _weights_cache[key] = (
+            linear_weights(src_lat, tgt_lat),
+            linear_weights(src_lon, tgt_lon)
+        )
+
+    return _weights_cache[key]
+
+
+def interpolate_block(block, lat_weights, lon_weights):
+    """Bilinearly interpolate the last two (lat, lon) dimensions of an array.
+
+    Args:
+        block (numpy.ndarray) : Data with lat, lon as the last two dimensions
+        lat_weights (tuple) : (index, fraction) from linear_weights
+        lon_weights (tuple) : (index, fraction) from linear_weights
+
+    Returns:
+        numpy.ndarray : Data on the target grid
+    """
+    dtype = block.dtype
+
+    index, fraction = lat_weights
+    fraction = fraction[:, np.newaxis]
+    block = (block[..., index, :] * (1. - fraction) +
+             block[..., index + 1, :] * fraction)
+
+    index, fraction = lon_weights
+    block = (block[..., index] * (1. - fraction) +
+             block[..., index + 1] * fraction)
+
+    return block.astype(dtype, copy=False)
+
+
+def regrid_linear(cube, target):
+    """Linearly regrid a cube onto the lat/lon grid of another cube.
+
+    Intended for winds on staggered (Arakawa) grids, e.g. v onto u. The
+    weights are built once per pair of grids and applied to every
+    timestep (and level) as a single gather, keeping lazy data lazy. If
+    the grids already coincide the cube is returned unchanged.
+
+    Args:
+        cube (iris.cube.Cube) : Cube to regrid, with lat, lon as the last
+            two dimensions
+        target (iris.cube.Cube) : Cube on the target grid
+
+    Returns:
+        iris.cube.Cube : Cube on the target grid
+    """
+    names = ['latitude', 'longitude']
+    source_coords = [cube.coord(name) for name in names]
+    target_coords = [target.coord(name) for name in names]
+
+    # Nothing to do when the grids are already aligned
+    if all(s.shape == t.shape and np.array_equal(s.points, t.points)
+           for s, t in zip(source_coords, target_coords)):
+        return cube
+
+    # Fall back on iris for anything other than trailing 1-D lat/lon
+    lat_dims, lon_dims = [cube.coord_dims(c) for c in source_coords]
+    if (lat_dims, lon_dims) != ((cube.ndim - 2,), (cube.ndim - 1,)) or \
+            min(c.shape[0] for c in source_coords) < 2:
+        return cube.regrid(target, iris.analysis.Linear())
+
+    lat_weights, lon_weights = grid_weights(cube, target)
+    shape = cube.shape[:-2] + tuple(c.shape[0] for c in target_coords)
+
+    if cube.has_lazy_data():
+        data = cube.lazy_data().rechunk(
+            cube.lazy_data().chunks[:-2] + (-1, -1)
+        )
+        data = da.map_blocks(
+            interpolate_block, data, lat_weights, lon_weights,
+            chunks=data.chunks[:-2] + tuple((n,) for n in shape[-2:]),
+            dtype=cube.dtype
+        )
+    else:
+        data = interpolate_block(cube.data, lat_weights, lon_weights)
+
+    # Rebuild the cube with the target's horizontal coordinates
+    horizontal = set(lat_dims + lon_dims)
+    result = Cube(data)
+    result.metadata = cube.metadata
+    for coord in cube.dim_coords:
+        dim, = cube.coord_dims(coord)
+        if dim not in horizontal:
+            result.add_dim_coord(coord.copy(), dim)
+    for coord in target_coords:
+        result.add_dim_coord(coord.copy(), cube.coord_dims(coord.name())[0])
+    for coord in cube.aux_coords:
+        dims = cube.coord_dims(coord)
+        if not horizontal.intersection(dims):
+            result.add_aux_coord(coord.copy(), dims)
+
+    return result
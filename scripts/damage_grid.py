@@ -0,0 +1,331 @@
+####################################################
+#   Combined wind-rain damage layer.
+#       Applies a damage model fitted to survey data (the probability
+#       from a discriminant, or the threshold curve fitted to its 0.5
+#       contour, as in the QDA notebook) to whole hazard grids from
+#       op_hazard_output.py in one array operation, then summarises
+#       the damage likelihood at the exposure of each region (SA1).
+####################################################
+
+# Usage:
+#   python damage_grid.py op_hazards_20191021_12.nc
+#       -s damage_hazard.shp -e NSW_Residential_Wind_Exposure_2018_TCRM.csv
+#       -o /g/data/w85/BNHCRC/impact/damage
+
+# Import modules
+import os
+import re
+import argparse
+import time
+from pprint import pprint
+
+import numpy as np
+import pandas as pd
+
+import discriminant
+from boundaries import IMPACT_CODE
+
+# Ways of turning the hazards into a damage likelihood
+DAMAGE_METHODS = ['probability', 'threshold']
+
+# Default hazards of the damage model (wind on the x axis, as fitted)
+DAMAGE_WIND = 'PSWG'
+DAMAGE_RAIN = 'PIRR'
+
+# Probability contour the threshold curve is fitted to
+THRESHOLD_LEVEL = 0.5
+
+# Name of the damage likelihood grid and column
+DAMAGE_NAME = 'damage_likelihood'
+
+
+def threshold_curve(wind, a, b, c):
+    """Rainfall at the damage threshold for a wind speed: a / (wind + b) + c.
+
+    Args:
+        wind (numpy.ndarray) : Wind hazard
+        a, b, c (float) : Parameters of the curve
+
+    Returns:
+        numpy.ndarray : Rainfall hazard on the threshold
+    """
+    return a / (wind + b) + c
+
+
+def fit_threshold(model, x, y, level=THRESHOLD_LEVEL):
+    """Fit the threshold curve to a probability contour of a discriminant.
+
+    The longest line of the contour is used, as picked out by hand in
+    the notebook.
+
+    Args:
+        model (dict) : Model fitted to (wind, rain), from discriminant
+        x (numpy.ndarray) : Points along the wind axis
+        y (numpy.ndarray) : Points along the rain axis
+        level (float) : Probability of the contour
+
+    Returns:
+        numpy.ndarray : Parameters (a, b, c) of threshold_curve
+    """
+    from contourpy import contour_generator
+    from scipy.optimize import curve_fit
+
+    surface = discriminant.probability_surface(model, x, y)
+    lines = contour_generator(x, y, surface).lines(level)
+    if not lines:
+        raise ValueError('No %g probability contour in the surface' % level)
+    line = max(lines, key=len)
+
+    params, _ = curve_fit(threshold_curve, line[:, 0], line[:, 1],
+                          maxfev=100000)
+
+    return params
+
+
+def damage_likelihood(wind, rain, model=None, params=None):
+    """Damage likelihood of every cell of a pair of hazard grids.
+
+    With a model this is the probability of damage; with threshold
+    curve parameters it is 1 where the rainfall is above the curve for
+    the wind speed and 0 elsewhere.
+
+    Args:
+        wind (numpy.ndarray) : Wind hazard (any shape)
+        rain (numpy.ndarray) : Rainfall hazard (same shape)
+        model (dict) : Model fitted to (wind, rain), from discriminant
+        params (numpy.ndarray) : Parameters of threshold_curve
+
+    Returns:
+        numpy.ndarray : Damage likelihood (0-1), NaN where either hazard
+            is missing
+    """
+    wind = np.ma.filled(np.ma.asarray(wind, dtype=np.float64), np.nan)
+    rain = np.ma.filled(np.ma.asarray(rain, dtype=np.float64), np.nan)
+
+    if model is not None:
+        likelihood = discriminant.damage_probability(model, wind, rain)
+    elif params is not None:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            likelihood = (rain > threshold_curve(wind, *params)).astype(float)
+    else:
+        raise ValueError('Need a model or threshold curve parameters')
+
+    likelihood[np.isnan(wind) | np.isnan(rain)] = np.nan
+
+    return likelihood
+
+
+def damage_cube(grids, model=None, params=None, wind=DAMAGE_WIND,
+                rain=DAMAGE_RAIN):
+    """Damage likelihood grid from a set of hazard grids.
+
+    Args:
+        grids (dict) : Hazard name -> cube, e.g. from load_hazard_grids
+        model (dict) : Model fitted to (wind, rain), from discriminant
+        params (numpy.ndarray) : Parameters of threshold_curve
+        wind (str) : Wind hazard of the model
+        rain (str) : Rainfall hazard of the model
+
+    Returns:
+        iris.cube.Cube : Damage likelihood on the grid of the hazards
+    """
+    likelihood = damage_likelihood(grids[wind].data, grids[rain].data,
+                                   model, params)
+
+    cube = grids[wind].copy(data=np.ma.masked_invalid(likelihood)
+                            .astype(np.float32))
+    cube.rename(DAMAGE_NAME)
+    cube.var_name = DAMAGE_NAME
+    cube.units = '1'
+    cube.attributes['damage_hazards'] = '%s %s' % (wind, rain)
+
+    return cube
+
+
+def region_damage(exposure, likelihood, code=IMPACT_CODE):
+    """Summarise the damage likelihood at the assets of each region.
+
+    Args:
+        exposure (pandas.DataFrame) : Exposure table, with a region code
+        likelihood (numpy.ndarray) : Damage likelihood at each asset; any
+            leading dimension (e.g. ensemble member) is averaged over
+        code (str) : Field holding the region code
+
+    Returns:
+        pandas.DataFrame : One row per region, with the mean and maximum
+            likelihood and the expected number of damaged assets (sum)
+    """
+    if likelihood.ndim > 1:
+        likelihood = np.nanmean(likelihood.reshape(-1, likelihood.shape[-1]),
+                                axis=0)
+
+    df = pd.DataFrame({code: exposure[code].values, DAMAGE_NAME: likelihood})
+    summary = df.groupby(code).agg({DAMAGE_NAME: ['mean', 'max', 'sum']})
+    summary.columns = ['%s_%s' % column for column in summary.columns]
+
+    return summary.reset_index()
+
+
+def parse_args():
+    """Parse arguments for the script.
+
+    Returns:
+        dict : Dictionary of arguments passed to the script
+    """
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+
+    parser.add_argument(
+        'hazard_file',
+        help='Hazard grids written by op_hazard_output.py -m combined\n\n',
+        type=str
+    )
+
+    parser.add_argument(
+        '-s', '--survey_file',
+        help='Survey records with the hazard at each (e.g. damage_hazard.shp)\n'
+             'to fit the damage model to\n\n',
+        type=str, default=None
+    )
+
+    parser.add_argument(
+        '-k', '--kind',
+        help='Kind of discriminant\ndefault=%s\n\n'
+             % discriminant.DISCRIMINANTS[0],
+        choices=discriminant.DISCRIMINANTS,
+        default=discriminant.DISCRIMINANTS[0]
+    )
+
+    parser.add_argument(
+        '-m', '--method',
+        help='Damage likelihood: the probability from the discriminant, or\n'
+             'whether the hazards are above the threshold curve\n'
+             'default=%s\n\n' % DAMAGE_METHODS[0],
+        choices=DAMAGE_METHODS, default=DAMAGE_METHODS[0]
+    )
+
+    parser.add_argument(
+        '--curve',
+        help='Parameters a b c of the threshold curve (instead of fitting\n'
+             'one to the survey data)\n\n',
+        type=float, nargs=3, default=None
+    )
+
+    parser.add_argument(
+        '--wind',
+        help='Wind hazard of the damage model\ndefault=%s\n\n' % DAMAGE_WIND,
+        type=str, default=DAMAGE_WIND
+    )
+
+    parser.add_argument(
+        '--rain',
+        help='Rainfall hazard of the damage model\ndefault=%s\n\n' % DAMAGE_RAIN,
+        type=str, default=DAMAGE_RAIN
+    )
+
+    parser.add_argument(
+        '-e', '--exposure_file',
+        help='Exposure file, to summarise the damage likelihood by region\n\n',
+        type=str, default=None
+    )
+
+    parser.add_argument(
+        '-c', '--code',
+        help='Field of the exposure holding the region code\n'
+             'default=%s\n\n' % IMPACT_CODE,
+        type=str, default=IMPACT_CODE
+    )
+
+    parser.add_argument(
+        '-o', '--output_dir',
+        help='Output directory\ndefault=.\n\n',
+        type=str, default='.'
+    )
+
+    parser.add_argument(
+        '--cache_dir',
+        help='Directory to keep fitted models, exposure and grid indices in\n'
+             'default=only cache in memory\n\n',
+        type=str, default=None
+    )
+
+    args = vars(parser.parse_args())
+
+    if args['curve'] is None and args['survey_file'] is None:
+        parser.error('Either a survey file or --curve is needed')
+    if args['method'] == 'probability' and args['survey_file'] is None:
+        parser.error('The probability method needs a survey file')
+
+    return args
+
+
+if __name__ == '__main__':
+
+    from op_hazard_output import load_hazard_grids
+    import exposure
+    import iris
+
+    start_time = time.time()
+
+    # Get the arguments, print them pretty
+    args = parse_args()
+    pprint(args)
+
+    model = params = None
+    if args['survey_file']:
+        import geopandas as gpd
+
+        survey = gpd.read_file(args['survey_file'])
+        survey = survey.dropna(axis=0, subset=[args['wind'], args['rain']])
+        X = np.column_stack([survey[args['wind']].values,
+                             survey[args['rain']].values])
+        model = discriminant.get_model(
+            X, discriminant.damage_classes(survey), args['kind'],
+            args['cache_dir']
+        )
+
+    if args['method'] == 'threshold':
+        if args['curve'] is not None:
+            params = np.array(args['curve'])
+        else:
+            params = fit_threshold(
+                model,
+                np.linspace(*discriminant.WIND_RANGE,
+                            num=discriminant.SURFACE_POINTS),
+                np.linspace(*discriminant.RAIN_RANGE,
+                            num=discriminant.SURFACE_POINTS)
+            )
+        print('Threshold curve: a=%g b=%g c=%g' % tuple(params))
+        model = None
+
+    print('Calculating damage likelihood...')
+    grids = load_hazard_grids(args['hazard_file'],
+                              [args['wind'], args['rain']])
+    cube = damage_cube(grids, model, params, args['wind'], args['rain'])
+
+    # Label the outputs after the hazards (e.g. op_hazards_20191021_12.nc)
+    match = re.search(r'\d{8}_\d{2}', os.path.basename(args['hazard_file']))
+    label = match.group(0) if match else 'event'
+
+    os.makedirs(args['output_dir'], exist_ok=True)
+    filepath = os.path.join(args['output_dir'], 'damage_%s.nc' % label)
+    iris.save(cube, filepath)
+    print('Data written to %s' % filepath)
+
+    if args['exposure_file']:
+        print('Summarising damage likelihood by region...')
+        assets = exposure.load_exposure(
+            args['exposure_file'], args['cache_dir'],
+            [exposure.EXPOSURE_LATITUDE, exposure.EXPOSURE_LONGITUDE,
+             args['code']]
+        )
+        index = exposure.grid_index(cube, assets, cache_dir=args['cache_dir'])
+        summary = region_damage(assets, exposure.sample_grid(cube, index),
+                                args['code'])
+
+        filepath = os.path.join(args['output_dir'], 'damage_%s.csv' % label)
+        summary.to_csv(filepath, index=False)
+        print('Data written to %s' % filepath)
+
+    print('DONE')
+    end_time = time.time()
+    print('Time elapsed = %s seconds' % (end_time - start_time))
@@ -0,0 +1,377 @@
+####################################################
+#   Discriminant analysis of damage against pairs of hazards.
+#       Fits a quadratic (or linear) discriminant of damaged/undamaged
+#       buildings for each combination of a rainfall and a wind
+#       hazard (as in the "QDA using multiple combinations of hazard
+#       parameters" notebook), caches the fitted Gaussians on disk and
+#       evaluates the probability of damage directly from them, on
+#       surfaces for plotting or on whole hazard grids.
+####################################################
+
+# Usage:
+#   python discriminant.py damage_hazard.shp -o qda_surfaces.png
+#       --cache_dir /g/data/w85/BNHCRC/cache/discriminant
+
+# Import modules
+import os
+import hashlib
+import argparse
+import time
+from collections import OrderedDict
+from itertools import product
+from pprint import pprint
+
+import numpy as np
+
+# Hazards making up the pairs (rainfall on the y axis, wind on the x axis)
+RAINFALL = ['PIRR', 'P1RR', 'N1RR', 'P6RR', 'PTEA']
+WIND = ['PSWG', 'PSMW', 'NSWG', 'PGWS']
+
+# Field of the survey data holding the damage state, and the states
+# counted as damaged
+DAMAGE_FIELD = 'EICU_Degda'
+DAMAGED_STATES = ['Destroyed - 76-100%',
+                  'Severe Impact - 51-75%',
+                  'Major Impact - 26-50%']
+
+# Kinds of discriminant: one covariance per class, or one shared
+DISCRIMINANTS = ['qda', 'lda']
+
+# Extent and resolution of the probability surfaces
+WIND_RANGE = (0, 100)
+RAIN_RANGE = (0, 500)
+SURFACE_POINTS = 1000
+
+# Probability contours drawn on the surfaces
+PROBABILITY_LEVELS = [0.05, 0.1, 0.25, 0.5, 0.75]
+
+# Fitted models, keyed on the data and kind of discriminant
+_model_cache = {}
+
+
+def damage_classes(df, field=DAMAGE_FIELD, states=DAMAGED_STATES):
+    """Classify survey records as damaged (1) or not (0).
+
+    Args:
+        df (pandas.DataFrame) : Survey records
+        field (str) : Field holding the damage state
+        states (list) : Damage states counted as damaged
+
+    Returns:
+        numpy.ndarray : 1 for damaged records, 0 for the rest
+    """
+    return df[field].isin(states).values.astype(int)
+
+
+def fit_discriminant(X, y, kind='qda'):
+    """Fit a Gaussian to the hazards of each class of a discriminant.
+
+    The fit is that of scikit-learn's QuadraticDiscriminantAnalysis
+    (an unbiased covariance per class) or LinearDiscriminantAnalysis
+    (the prior-weighted covariance shared by the classes).
+
+    Args:
+        X (numpy.ndarray) : (record, hazard) array
+        y (numpy.ndarray) : Class of each record
+        kind (str) : 'qda' or 'lda'
+
+    Returns:
+        dict : classes, priors, means and covariances (one per class)
+    """
+    if kind not in DISCRIMINANTS:
+        raise ValueError('Unknown discriminant %s' % kind)
+
+    X = np.asarray(X, dtype=np.float64)
+    classes, counts = np.unique(y, return_counts=True)
+    if len(classes) < 2:
+        raise ValueError('Need at least two classes, not %s' % classes)
+    if kind == 'qda' and counts.min() <= X.shape[1]:
+        raise ValueError('Too few records of a class (%d) for a quadratic '
+                         'discriminant' % counts.min())
+
+    priors = counts / float(counts.sum())
+    means = np.array([X[y == c].mean(axis=0) for c in classes])
+    if kind == 'qda':
+        covariances = np.array([np.cov(X[y == c], rowvar=False)
+                                for c in classes])
+    else:
+        shared = sum(prior * np.cov(X[y == c], rowvar=False, bias=True)
+                     for prior, c in zip(priors, classes))
+        covariances = np.repeat(shared[np.newaxis], len(classes), axis=0)
+
+    return {
+        'classes': classes,
+        'priors': priors,
+        'means': means,
+        'covariances': covariances,
+    }
+
+
+def model_key(X, y, kind):
+    """Key identifying the fit of a discriminant to some data.
+
+    Args:
+        X (numpy.ndarray) : (record, hazard) array
+        y (numpy.ndarray) : Class of each record
+        kind (str) : 'qda' or 'lda'
+
+    Returns:
+        str : Hex digest of the data and kind of discriminant
+    """
+    digest = hashlib.sha1(kind.encode())
+    digest.update(np.ascontiguousarray(X, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(y, dtype=np.int64).tobytes())
+
+    return digest.hexdigest()
+
+
+def get_model(X, y, kind='qda', cache_dir=None):
+    """Get (and cache) the discriminant fitted to some data.
+
+    Args:
+        X (numpy.ndarray) : (record, hazard) array
+        y (numpy.ndarray) : Class of each record
+        kind (str) : 'qda' or 'lda'
+        cache_dir (str) : Directory to keep fitted models in between runs
+            (default: only cache in memory)
+
+    Returns:
+        dict : Model from fit_discriminant
+    """
+    key = model_key(X, y, kind)
+
+    if key not in _model_cache:
+        filepath = None
+        if cache_dir is not None:
+            filepath = os.path.join(cache_dir, '%s_%s.npz' % (kind, key))
+
+        if filepath is not None and os.path.isfile(filepath):
+            with np.load(filepath) as saved:
+                _model_cache[key] = {name: saved[name]
+                                     for name in saved.files}
+        else:
+            _model_cache[key] = fit_discriminant(X, y, kind)
+            if filepath is not None:
+                os.makedirs(cache_dir, exist_ok=True)
+                np.savez(filepath, **_model_cache[key])
+
+    return _model_cache[key]
+
+
+def class_probabilities(model, *hazards):
+    """Probability of each class, straight from the fitted Gaussians.
+
+    The hazards only have to broadcast against each other, so a surface
+    is evaluated from its two axes (see probability_surface) and a set
+    of hazard grids from the grids themselves.
+
+    Args:
+        model (dict) : Model from fit_discriminant or get_model
+        hazards (numpy.ndarray) : One array per hazard, in the order
+            the model was fitted
+
+    Returns:
+        numpy.ndarray : Probabilities, with the classes as the first
+            dimension and the broadcast shape of the hazards after it
+    """
+    hazards = np.broadcast_arrays(*[np.asarray(h, dtype=np.float64)
+                                    for h in hazards])
+    nclasses = len(model['classes'])
+
+    log_density = np.empty((nclasses,) + hazards[0].shape)
+    for k in range(nclasses):
+        precision = np.linalg.inv(model['covariances'][k])
+        _, logdet = np.linalg.slogdet(model['covariances'][k])
+        deviations = [h - mean for h, mean in zip(hazards, model['means'][k])]
+
+        # Mahalanobis distance, one term of the quadratic form at a time
+        distance = np.zeros(hazards[0].shape)
+        for i, j in product(range(len(hazards)), repeat=2):
+            distance += precision[i, j] * deviations[i] * deviations[j]
+
+        log_density[k] = np.log(model['priors'][k]) - 0.5 * (logdet +
+                                                             distance)
+
+    # Normalise in log space so that far-off points don't underflow
+    log_density -= log_density.max(axis=0)
+    density = np.exp(log_density)
+
+    return density / density.sum(axis=0)
+
+
+def damage_probability(model, *hazards):
+    """Probability of damage (the last class) given the hazards.
+
+    Args:
+        model (dict) : Model from fit_discriminant or get_model
+        hazards (numpy.ndarray) : One array per hazard, in the order
+            the model was fitted
+
+    Returns:
+        numpy.ndarray : Probability of damage, shaped as the hazards
+    """
+    return class_probabilities(model, *hazards)[-1]
+
+
+def probability_surface(model, x, y):
+    """Probability of damage over every combination of two hazards.
+
+    Args:
+        model (dict) : Model fitted to (x, y) pairs of hazards
+        x (numpy.ndarray) : Points along the first (x axis) hazard
+        y (numpy.ndarray) : Points along the second (y axis) hazard
+
+    Returns:
+        numpy.ndarray : (len(y), len(x)) array, as from a meshgrid
+    """
+    return damage_probability(model, x[np.newaxis, :], y[:, np.newaxis])
+
+
+def fit_pairs(df, target, rainfall=RAINFALL, wind=WIND, kind='qda',
+              cache_dir=None):
+    """Fit a discriminant for every pair of a rainfall and a wind hazard.
+
+    Args:
+        df (pandas.DataFrame) : Survey records, with a field per hazard
+        target (numpy.ndarray) : Class of each record, from damage_classes
+        rainfall (list) : Rainfall hazards
+        wind (list) : Wind hazards
+        kind (str) : 'qda' or 'lda'
+        cache_dir (str) : Directory to keep fitted models in
+
+    Returns:
+        OrderedDict : (rainfall, wind) -> model fitted to (wind, rainfall)
+    """
+    models = OrderedDict()
+    for rain, gust in product(rainfall, wind):
+        X = np.column_stack([df[gust].values, df[rain].values])
+        models[(rain, gust)] = get_model(X, target, kind, cache_dir)
+
+    return models
+
+
+def plot_surfaces(models, df, filename, levels=PROBABILITY_LEVELS,
+                  npoints=SURFACE_POINTS):
+    """Plot the probability of damage for every pair of hazards.
+
+    Args:
+        models (dict) : (rainfall, wind) -> model, from fit_pairs
+        df (pandas.DataFrame) : Survey records (for the axis limits)
+        filename (str) : Path of the figure
+        levels (list) : Probabilities to contour
+        npoints (int) : Number of points along each axis of a surface
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib import colors
+
+    rainfall = list(OrderedDict.fromkeys(rain for rain, _ in models))
+    wind = list(OrderedDict.fromkeys(gust for _, gust in models))
+    nrows, ncols = len(rainfall), len(wind)
+
+    x = np.linspace(WIND_RANGE[0], WIND_RANGE[1], npoints)
+    y = np.linspace(RAIN_RANGE[0], RAIN_RANGE[1], npoints)
+
+    fig, axes = plt.subplots(nrows, ncols, figsize=(6 * ncols, 4 * nrows),
+                             facecolor='white', squeeze=False)
+    for (rain, gust), model in models.items():
+        ax = axes[rainfall.index(rain), wind.index(gust)]
+        Z = probability_surface(model, x, y)
+        # The surface is on a regular grid, which imshow draws far
+        # quicker than pcolormesh
+        cm = ax.imshow(Z, origin='lower', aspect='auto', cmap='viridis',
+                       extent=(x[0], x[-1], y[0], y[-1]),
+                       norm=colors.Normalize(0., 1.))
+        cs = ax.contour(x, y, Z, levels, linewidths=2., colors='k')
+        ax.clabel(cs, fmt='%.2f')
+
+        if rainfall.index(rain) == nrows - 1:
+            ax.set_xlabel(gust)
+        if wind.index(gust) == 0:
+            ax.set_ylabel(rain)
+        ax.set_xlim((np.floor(df[gust].values.min() / 10) * 10,
+                     np.ceil(df[gust].values.max() / 10) * 10))
+        ax.set_ylim((df[rain].values.min(), df[rain].values.max() * 1.1))
+
+    fig.tight_layout()
+    fig.subplots_adjust(wspace=0.3, hspace=0.3, right=0.9)
+    cbar_ax = fig.add_axes([0.92, 0.15, 0.02, 0.7])
+    fig.colorbar(cm, cax=cbar_ax, label='Probability of damage')
+
+    fig.savefig(filename, dpi=100)
+    plt.close(fig)
+
+
+def parse_args():
+    """Parse arguments for the script.
+
+    Returns:
+        dict : Dictionary of arguments passed to the script
+    """
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+
+    parser.add_argument(
+        'damage_file',
+        help='Survey records with the hazard at each (e.g. damage_hazard.shp)\n\n',
+        type=str
+    )
+
+    parser.add_argument(
+        '-o', '--output_file',
+        help='Figure of the probability surfaces\n\n',
+        type=str, required=True
+    )
+
+    parser.add_argument(
+        '-k', '--kind',
+        help='Kind of discriminant\ndefault=%s\n\n' % DISCRIMINANTS[0],
+        choices=DISCRIMINANTS, default=DISCRIMINANTS[0]
+    )
+
+    parser.add_argument(
+        '--damage_field',
+        help='Field holding the damage state\ndefault=%s\n\n' % DAMAGE_FIELD,
+        type=str, default=DAMAGE_FIELD
+    )
+
+    parser.add_argument(
+        '-n', '--npoints',
+        help='Number of points along each axis of a surface\n'
+             'default=%s\n\n' % SURFACE_POINTS,
+        type=int, default=SURFACE_POINTS
+    )
+
+    parser.add_argument(
+        '--cache_dir',
+        help='Directory to keep fitted models in\n'
+             'default=only cache in memory\n\n',
+        type=str, default=None
+    )
+
+    return vars(parser.parse_args())
+
+
+if __name__ == '__main__':
+
+    import geopandas as gpd
+
+    start_time = time.time()
+
+    # Get the arguments, print them pretty
+    args = parse_args()
+    pprint(args)
+
+    gdf = gpd.read_file(args['damage_file'])
+    gdf = gdf.dropna(axis=0, subset=RAINFALL + WIND)
+    target = damage_classes(gdf, args['damage_field'])
+    print('Fitting %d records (%d damaged)' % (len(gdf), target.sum()))
+
+    models = fit_pairs(gdf, target, kind=args['kind'],
+                       cache_dir=args['cache_dir'])
+    plot_surfaces(models, gdf, args['output_file'], npoints=args['npoints'])
+    print('Figure written to %s' % args['output_file'])
+
+    print('DONE')
+    end_time = time.time()
+    print('Time elapsed = %s seconds' % (end_time - start_time))
@@ -0,0 +1,172 @@
+####################################################
+#   Ensemble forecasts of the hazard grids.
+#       Stacks the weather fields of every ensemble member into one
+#       cube (time, realization, lat, lon), so that the event maxima,
+#       rolling rain windows and neighbourhood maxima are computed for
+#       all members at once, and summarises the per-member hazard
+#       grids as ensemble percentiles and exceedance probabilities.
+####################################################
+
+# Import modules
+from collections import OrderedDict
+
+import numpy as np
+import iris.analysis
+import iris.util
+from iris.coords import AuxCoord, DimCoord
+from iris.cube import CubeList
+
+from cube_utils import chunk_time
+
+# Name of the ensemble member coordinate (as in the CF conventions)
+MEMBER_COORD = 'realization'
+
+# Name of the coordinate holding the label of each member (e.g. em01)
+MEMBER_LABEL = 'member'
+
+# Default ensemble percentiles of each hazard
+ENSEMBLE_PERCENTILES = [10, 50, 90]
+
+# Default thresholds of the exceedance probabilities of each hazard,
+# in the units of the hazard (mm for rain, m s-1 for wind)
+EXCEEDANCE_THRESHOLDS = {
+    'PIRR': [5, 10],
+    'P1RR': [20, 50],
+    'N1RR': [20, 50],
+    'P6RR': [50, 100],
+    'PTEA': [100, 200],
+    'PSWG': [20, 25, 30],
+    'PSMW': [15, 20],
+    'NSWG': [20, 25, 30],
+    'PGWS': [25, 35],
+}
+
+
+def stack_members(cubes, members, chunk=None):
+    """Stack the same field from each ensemble member into one cube.
+
+    Time stays the first dimension (the members are the second), so
+    everything that reduces over time works on the stacked cube as it
+    does on a single forecast, keeping a leading member dimension.
+    The realization of each member is its position in the list, and
+    its label is kept in a member coordinate alongside.
+
+    Args:
+        cubes (list) : One (time, lat, lon) cube per member, on the same
+            times and grid
+        members (list) : Member labels (e.g. 000, em01 or ctl), in the
+            order of the cubes
+        chunk (int) : Number of timesteps per chunk, or None to leave the
+            chunks alone
+
+    Returns:
+        iris.cube.Cube : Cube of (time, realization, lat, lon)
+    """
+    stacked = CubeList()
+    for realization, (cube, member) in enumerate(zip(cubes, members)):
+        cube = cube.copy()
+        cube.add_aux_coord(AuxCoord(np.int32(realization),
+                                    standard_name=MEMBER_COORD))
+        cube.add_aux_coord(AuxCoord(str(member), long_name=MEMBER_LABEL))
+        stacked.append(cube)
+
+    # File names and the like shouldn't stop the members merging
+    iris.util.equalise_attributes(stacked)
+    cube = stacked.merge_cube()
+    cube.transpose([1, 0] + list(range(2, cube.ndim)))
+
+    if chunk is not None and cube.has_lazy_data():
+        cube = chunk_time(cube, chunk)
+
+    return cube
+
+
+def stack_weather(members_weather, members, chunk=None):
+    """Stack every weather field of each ensemble member.
+
+    Args:
+        members_weather (list) : One dict of name -> cube per member
+        members (list) : Member labels, in the same order
+        chunk (int) : Number of timesteps per chunk of lazy data
+
+    Returns:
+        OrderedDict : Name -> stacked cube
+    """
+    return OrderedDict(
+        (name, stack_members([weather[name] for weather in members_weather],
+                             members, chunk))
+        for name in members_weather[0]
+    )
+
+
+def ensemble_percentiles(cube, percentiles=ENSEMBLE_PERCENTILES):
+    """Percentiles of a hazard grid over the ensemble members.
+
+    Args:
+        cube (iris.cube.Cube) : Hazard with a realization dimension
+        percentiles (list) : Percentiles (0-100)
+
+    Returns:
+        iris.cube.Cube : Percentiles, with a leading percentile dimension
+    """
+    return cube.collapsed(MEMBER_COORD, iris.analysis.PERCENTILE,
+                          percent=list(percentiles))
+
+
+def exceedance_probability(cube, thresholds):
+    """Fraction of the ensemble members reaching each threshold.
+
+    Args:
+        cube (iris.cube.Cube) : Hazard with a realization dimension
+        thresholds (list) : Thresholds, in the units of the hazard
+
+    Returns:
+        iris.cube.Cube : Probabilities (0-1), with a leading threshold
+            dimension
+    """
+    probabilities = CubeList()
+    for threshold in thresholds:
+        probability = cube.collapsed(
+            MEMBER_COORD, iris.analysis.PROPORTION,
+            function=lambda values, threshold=threshold: values >= threshold
+        )
+        probability.add_aux_coord(
+            DimCoord(np.float32(threshold), long_name='threshold',
+                     units=cube.units)
+        )
+        probabilities.append(probability)
+
+    if len(probabilities) == 1:
+        result = iris.util.new_axis(probabilities[0], 'threshold')
+    else:
+        result = probabilities.merge_cube()
+
+    result.rename('probability_of_%s_above_threshold' % cube.name())
+    result.units = '1'
+
+    return result
+
+
+def ensemble_grids(grids, percentiles=ENSEMBLE_PERCENTILES,
+                   thresholds=EXCEEDANCE_THRESHOLDS):
+    """Ensemble percentiles and exceedance probabilities of hazard grids.
+
+    Args:
+        grids (dict) : Hazard name -> cube with a realization dimension
+        percentiles (list) : Percentiles (0-100)
+        thresholds (dict) : Hazard name -> thresholds; hazards without
+            any only get percentiles
+
+    Returns:
+        OrderedDict : <hazard>_percentile and <hazard>_probability -> cube
+    """
+    results = OrderedDict()
+    for name, cube in grids.items():
+        results['%s_percentile' % name] = ensemble_percentiles(cube,
+                                                               percentiles)
+        if thresholds.get(name):
+            results['%s_probability' % name] = exceedance_probability(
+                cube, thresholds[name]
+            )
+
+    return results
@@ -0,0 +1,251 @@
+####################################################
+#   Probabilistic impact of an ensemble forecast.
+#       Takes the structural loss ratio of every asset for every
+#       ensemble member (e.g. one HazImp run per member) as a single
+#       (asset, member) array and, in one grouped pass, works out
+#       the loss of each region (e.g. SA1) for each member, then the
+#       quantiles of the regional loss over the members and the
+#       probability of it exceeding each damage threshold.
+####################################################
+
+# Usage:
+#   python ensemble_impact.py impact/2019052600/2019052600_PSWG_*.csv
+#       -o impact/2019052600/2019052600_PSWG_ens.csv
+
+# Import modules
+import argparse
+import time
+import warnings
+from pprint import pprint
+
+import numpy as np
+import pandas as pd
+
+from boundaries import IMPACT_CODE
+
+# Columns of the HazImp per-asset output used here
+LOSS_RATIO = 'structural_loss_ratio'
+REPLACEMENT_VALUE = 'REPLACEMENT_VALUE'
+
+# Default quantiles (0-1) of the regional loss over the members
+LOSS_QUANTILES = [0.1, 0.5, 0.9]
+
+# Default damage thresholds, as a mean structural loss ratio of a region
+DAMAGE_THRESHOLDS = [0.01, 0.05, 0.1]
+
+
+def read_member_losses(filepaths, code=IMPACT_CODE, column=LOSS_RATIO,
+                       value=REPLACEMENT_VALUE):
+    """Read the per-asset losses of each member into one array.
+
+    Each file holds the assets of the same exposure in the same order
+    (HazImp keeps the order of the exposure file).
+
+    Args:
+        filepaths (list) : Per-asset impact CSV files, one per member
+        code (str) : Field holding the region code
+        column (str) : Field holding the structural loss ratio
+        value (str) : Field holding the replacement value, or None
+
+    Returns:
+        tuple : (codes, loss ratios, values) where loss ratios has one
+            row per asset and one column per member, and values is None
+            if not read
+    """
+    first = pd.read_csv(filepaths[0], usecols=[code, column] +
+                        ([value] if value else []))
+    codes = pd.to_numeric(first[code], errors='coerce').values
+    values = first[value].values if value else None
+
+    ratios = np.empty((len(first), len(filepaths)))
+    ratios[:, 0] = first[column].values
+    for member, filepath in enumerate(filepaths[1:], 1):
+        losses = pd.read_csv(filepath, usecols=[column])[column].values
+        if len(losses) != len(first):
+            raise ValueError('%s has %d assets, but %s has %d' % (
+                filepath, len(losses), filepaths[0], len(first)
+            ))
+        ratios[:, member] = losses
+
+    return codes, ratios, values
+
+
+def region_sums(inverse, nregions, data):
+    """Sum a per-asset, per-member array over the assets of each region.
+
+    Missing (NaN) values are left out of the sums and counts.
+
+    Args:
+        inverse (numpy.ndarray) : Region (0 .. nregions - 1) of each asset
+        nregions (int) : Number of regions
+        data (numpy.ndarray) : (asset, member) array
+
+    Returns:
+        tuple : (sums, counts) as (region, member) arrays
+    """
+    nmembers = data.shape[1]
+
+    # One bin per region and member, so a single bincount does them all
+    bins = (inverse[:, np.newaxis] * nmembers +
+            np.arange(nmembers)[np.newaxis, :]).ravel()
+    valid = np.isfinite(data).ravel()
+    size = nregions * nmembers
+
+    sums = np.bincount(bins[valid], weights=data.ravel()[valid],
+                       minlength=size)
+    counts = np.bincount(bins[valid], minlength=size)
+
+    return (sums.reshape(nregions, nmembers),
+            counts.reshape(nregions, nmembers))
+
+
+def member_quantiles(data, quantiles):
+    """Quantiles of a (region, member) array over the members.
+
+    Args:
+        data (numpy.ndarray) : (region, member) array, NaN where missing
+        quantiles (list) : Quantiles (0-1)
+
+    Returns:
+        numpy.ndarray : (quantile, region) array
+    """
+    with warnings.catch_warnings():
+        # Regions with no members left are NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanquantile(data, quantiles, axis=1)
+
+
+def ensemble_impacts(codes, ratios, values=None, quantiles=LOSS_QUANTILES,
+                     thresholds=DAMAGE_THRESHOLDS, code=IMPACT_CODE):
+    """Regional loss quantiles and exceedance probabilities over members.
+
+    The loss of a region for a member is the mean structural loss ratio
+    of its assets (and, with replacement values, their total structural
+    loss), as in the HazImp aggregation. Assets with no loss ratio
+    (e.g. outside the hazard grid) are left out.
+
+    Args:
+        codes (numpy.ndarray) : Region code of each asset
+        ratios (numpy.ndarray) : (asset, member) structural loss ratios
+        values (numpy.ndarray) : Replacement value of each asset, or None
+        quantiles (list) : Quantiles (0-1) of the regional loss
+        thresholds (list) : Damage thresholds (mean structural loss ratio)
+        code (str) : Name of the region code column
+
+    Returns:
+        pandas.DataFrame : One row per region, with the number of
+            members with a loss for it (nmembers), the mean and
+            quantiles (<column>_q<percent>) of each loss over those
+            members (named as in the HazImp aggregation, e.g.
+            structural_loss_ratio_mean), and the probability of the
+            mean loss ratio reaching each threshold
+            (<column>_p<threshold>) over all of the members, a member
+            with no loss for the region counting as not reaching it
+    """
+    ratios = np.asarray(ratios, dtype=np.float64)
+    if ratios.ndim != 2 or ratios.shape[0] != len(codes):
+        raise ValueError('Expected loss ratios of shape (%d, members), '
+                         'not %s' % (len(codes), ratios.shape))
+
+    # Assets without a region can't be aggregated
+    codes = np.asarray(codes, dtype=np.float64)
+    keep = np.isfinite(codes)
+    regions, inverse = np.unique(codes[keep].astype(np.int64),
+                                 return_inverse=True)
+    ratios = ratios[keep]
+
+    sums, counts = region_sums(inverse, len(regions), ratios)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_ratio = np.where(counts > 0, sums / counts, np.nan)
+
+    # Members with a loss for each region; the means are over just these
+    nmembers = (counts > 0).sum(axis=1)
+    divisor = np.maximum(nmembers, 1)
+
+    result = pd.DataFrame({code: regions})
+    result['nmembers'] = nmembers
+
+    stats = [(LOSS_RATIO + '_mean', mean_ratio)]
+    if values is not None:
+        losses = ratios * np.asarray(values, dtype=np.float64)[keep,
+                                                                np.newaxis]
+        loss_sums, _ = region_sums(inverse, len(regions), losses)
+        stats.append(('structural_loss_sum',
+                      np.where(counts > 0, loss_sums, np.nan)))
+
+    for column, data in stats:
+        result[column] = np.nansum(data, axis=1) / divisor
+        for q, quantile in zip(quantiles, member_quantiles(data, quantiles)):
+            result['%s_q%g' % (column, 100 * q)] = quantile
+
+    for threshold in thresholds:
+        result['%s_mean_p%g' % (LOSS_RATIO, threshold)] = \
+            (mean_ratio >= threshold).sum(axis=1) / ratios.shape[1]
+
+    return result
+
+
+def parse_args():
+    """Parse arguments for the script.
+
+    Returns:
+        dict : Dictionary of arguments passed to the script
+    """
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+
+    parser.add_argument(
+        'impact_files',
+        help='Per-asset HazImp output (CSV), one file per member\n\n',
+        nargs='+'
+    )
+
+    parser.add_argument(
+        '-o', '--output_file',
+        help='Output file (CSV), one row per region\n\n',
+        type=str, required=True
+    )
+
+    parser.add_argument(
+        '-q', '--quantiles',
+        help='Quantiles (0-1) of the regional loss\ndefault=%s\n\n'
+             % ' '.join(str(x) for x in LOSS_QUANTILES),
+        type=float, nargs='+', default=LOSS_QUANTILES
+    )
+
+    parser.add_argument(
+        '-t', '--thresholds',
+        help='Damage thresholds (mean structural loss ratio of a region)\n'
+             'default=%s\n\n' % ' '.join(str(x) for x in DAMAGE_THRESHOLDS),
+        type=float, nargs='+', default=DAMAGE_THRESHOLDS
+    )
+
+    parser.add_argument(
+        '-c', '--code',
+        help='Field holding the region code\ndefault=%s\n\n' % IMPACT_CODE,
+        type=str, default=IMPACT_CODE
+    )
+
+    return vars(parser.parse_args())
+
+
+if __name__ == '__main__':
+
+    start_time = time.time()
+
+    # Get the arguments, print them pretty
+    args = parse_args()
+    pprint(args)
+
+    print('Reading %d members...' % len(args['impact_files']))
+    codes, ratios, values = read_member_losses(args['impact_files'],
+                                               args['code'])
+
+    print('Calculating regional loss over the members...')
+    impacts = ensemble_impacts(codes, ratios, values, args['quantiles'],
+                               args['thresholds'], args['code'])
+    impacts.to_csv(args['output_file'], index=False)
+    print('Data written to %s' % args['output_file'])
+
+    print('DONE')
+    end_time = time.time()
+    print('Time elapsed = %s seconds' % (end_time - start_time))
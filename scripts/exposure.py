@@ -0,0 +1,406 @@
+####################################################
+#   Loads exposure tables (e.g. the NEXIS residential wind
+#       exposure CSV files), caching each one in a binary columnar
+#       format keyed on the checksum of the source file, so that the
+#       text is only parsed the first time the file is used.
+#       Also samples hazard grids at the exposure locations through
+#       an index into the grid, built once per grid and exposure.
+####################################################
+
+# Usage (convert ahead of time, e.g. when a new exposure file lands):
+#   python exposure.py /g/data/w85/BNHCRC/exposure/NSW_Residential_Wind_Exposure_2018_TCRM.csv
+
+# Import modules
+import os
+import json
+import hashlib
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from cube_utils import linear_weights
+
+# Feather is quickest to read, but needs pyarrow; pickle needs nothing
+try:
+    import pyarrow  # noqa: F401
+    CACHE_FORMAT = 'feather'
+except ImportError:
+    CACHE_FORMAT = 'pkl'
+
+# Columns holding the location of each asset
+EXPOSURE_LATITUDE = 'LATITUDE'
+EXPOSURE_LONGITUDE = 'LONGITUDE'
+
+# Ways of sampling a grid at a point
+SAMPLE_METHODS = ['nearest', 'bilinear']
+
+# Size of the blocks read when computing a checksum
+BLOCK_SIZE = 2 ** 23
+
+# Checksums, keyed on the path, size and modification time of each file
+_checksums = {}
+
+# Grid indices of exposure locations, keyed on the grid and locations
+_grid_index_cache = {}
+
+
+def checksum_path(filepath, cache_dir=None):
+    """Path of the stored checksum of a file.
+
+    Args:
+        filepath (str) : Path of the file
+        cache_dir (str) : Directory of the cache (default: alongside the file)
+
+    Returns:
+        str : Path of the stored checksum
+    """
+    if cache_dir is None:
+        cache_dir = os.path.dirname(os.path.abspath(filepath))
+
+    return os.path.join(cache_dir, os.path.basename(filepath) + '.sha1')
+
+
+def read_checksum(filepath, key):
+    """Read a stored checksum, if it is for the same version of the file.
+
+    Args:
+        filepath (str) : Path of the stored checksum
+        key (list) : Path, size and modification time of the file
+
+    Returns:
+        str : Hex digest, or None if not stored or the file has changed
+    """
+    try:
+        with open(filepath) as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    return stored.get('sha1') if stored.get('key') == key else None
+
+
+def write_checksum(filepath, key, digest):
+    """Store the checksum of a file, replacing it in one step.
+
+    Args:
+        filepath (str) : Path of the stored checksum
+        key (list) : Path, size and modification time of the file
+        digest (str) : Hex digest of the contents of the file
+    """
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+    tmp_filepath = '%s.%d.tmp' % (filepath, os.getpid())
+    with open(tmp_filepath, 'w') as f:
+        json.dump({'key': key, 'sha1': digest}, f)
+    os.replace(tmp_filepath, filepath)
+
+
+def checksum(filepath, cache_dir=None):
+    """Get (and cache) the SHA-1 checksum of a file.
+
+    The checksum is stored in the cache directory, keyed on the path,
+    size and modification time of the file, so a large file is only
+    read again when it changes.
+
+    Args:
+        filepath (str) : Path of the file
+        cache_dir (str) : Directory of the cache (default: alongside the file)
+
+    Returns:
+        str : Hex digest of the contents of the file
+    """
+    stat = os.stat(filepath)
+    key = [os.path.abspath(filepath), stat.st_size, stat.st_mtime]
+
+    if tuple(key) in _checksums:
+        return _checksums[tuple(key)]
+
+    stored = checksum_path(filepath, cache_dir)
+    digest = read_checksum(stored, key)
+    if digest is None:
+        sha1 = hashlib.sha1()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                sha1.update(block)
+        digest = sha1.hexdigest()
+        try:
+            write_checksum(stored, key, digest)
+        except OSError as e:
+            # A read-only directory shouldn't stop the run
+            print('Unable to store the checksum of %s: %s' % (filepath, e))
+
+    _checksums[tuple(key)] = digest
+    return digest
+
+
+def cache_path(filepath, cache_dir=None):
+    """Path of the cached copy of an exposure file.
+
+    Args:
+        filepath (str) : Path of the exposure CSV file
+        cache_dir (str) : Directory of the cache (default: alongside the file)
+
+    Returns:
+        str : Path of the cached table
+    """
+    if cache_dir is None:
+        cache_dir = os.path.dirname(os.path.abspath(filepath))
+
+    base = os.path.splitext(os.path.basename(filepath))[0]
+    return os.path.join(
+        cache_dir, '%s.%s.%s' % (base, checksum(filepath, cache_dir)[:16], CACHE_FORMAT)
+    )
+
+
+def read_cache(filepath, columns=None):
+    """Read a cached exposure table.
+
+    Args:
+        filepath (str) : Path of the cached table
+        columns (list) : Columns to read (default: all of them)
+
+    Returns:
+        pandas.DataFrame : Exposure table
+    """
+    # Feather only reads the columns asked for
+    if CACHE_FORMAT == 'feather':
+        return pd.read_feather(filepath, columns=columns)
+
+    df = pd.read_pickle(filepath)
+    return df if columns is None else df[columns]
+
+
+def write_cache(df, filepath):
+    """Write an exposure table to the cache, replacing it in one step.
+
+    Args:
+        df (pandas.DataFrame) : Exposure table
+        filepath (str) : Path of the cached table
+    """
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+    # Write alongside and then rename, so readers never see a partial file
+    tmp_filepath = '%s.%d.tmp' % (filepath, os.getpid())
+    if CACHE_FORMAT == 'feather':
+        df.reset_index(drop=True).to_feather(tmp_filepath)
+    else:
+        df.to_pickle(tmp_filepath)
+    os.replace(tmp_filepath, filepath)
+
+
+def load_exposure(filepath, cache_dir=None, columns=None):
+    """Load an exposure table, from the cache if the file has been seen.
+
+    The first time a file is loaded it is parsed and cached; the cache
+    is keyed on its checksum, so an updated file is parsed again.
+
+    Args:
+        filepath (str) : Path of the exposure CSV file
+        cache_dir (str) : Directory of the cache (default: alongside the file)
+        columns (list) : Columns to return (default: all of them)
+
+    Returns:
+        pandas.DataFrame : Exposure table
+    """
+    cached = cache_path(filepath, cache_dir)
+
+    if os.path.isfile(cached):
+        return read_cache(cached, columns)
+
+    df = pd.read_csv(filepath, low_memory=False)
+    try:
+        write_cache(df, cached)
+    except OSError as e:
+        # A read-only directory shouldn't stop the run
+        print('Unable to cache %s: %s' % (filepath, e))
+
+    return df if columns is None else df[columns]
+
+
+def axis_weights(points, values, method='nearest'):
+    """Indices and weights of values along one (monotonic) axis of a grid.
+
+    Args:
+        points (numpy.ndarray) : Grid coordinate points
+        values (numpy.ndarray) : Coordinates of the exposure locations
+        method (str) : 'nearest' or 'bilinear'
+
+    Returns:
+        tuple : (indices, weights, outside) where indices and weights
+            have one column per grid point used (1 for nearest, 2 for
+            bilinear), and outside flags values beyond the grid
+    """
+    index, fraction = linear_weights(points, values)
+
+    # Allow for rounding at the edges of the grid
+    tolerance = 1e-6
+    outside = (fraction < -tolerance) | (fraction > 1. + tolerance)
+    fraction = np.clip(fraction, 0., 1.)
+
+    if method == 'nearest':
+        indices = (index + (fraction >= 0.5))[:, np.newaxis]
+        weights = np.ones(indices.shape)
+    else:
+        indices = np.stack([index, index + 1], axis=1)
+        weights = np.stack([1. - fraction, fraction], axis=1)
+
+    return indices, weights, outside
+
+
+def build_grid_index(lat, lon, latitude, longitude, method='nearest'):
+    """Flat grid indices and weights to sample a grid at exposure locations.
+
+    Args:
+        lat (numpy.ndarray) : Latitude points of the grid
+        lon (numpy.ndarray) : Longitude points of the grid
+        latitude (numpy.ndarray) : Latitude of each asset
+        longitude (numpy.ndarray) : Longitude of each asset
+        method (str) : 'nearest' or 'bilinear'
+
+    Returns:
+        tuple : (indices, weights) arrays with one row per asset; assets
+            outside the grid have index -1
+    """
+    if method not in SAMPLE_METHODS:
+        raise ValueError('Unknown sampling method %s' % method)
+
+    lat_index, lat_weight, lat_outside = axis_weights(lat, latitude, method)
+    lon_index, lon_weight, lon_outside = axis_weights(lon, longitude, method)
+
+    # Every combination of the latitude and longitude points used
+    indices = (lat_index[:, :, np.newaxis] * len(lon) +
+               lon_index[:, np.newaxis, :]).reshape(len(latitude), -1)
+    weights = (lat_weight[:, :, np.newaxis] *
+               lon_weight[:, np.newaxis, :]).reshape(len(latitude), -1)
+
+    indices[lat_outside | lon_outside] = -1
+
+    return indices, weights
+
+
+def grid_index(cube, exposure, method='nearest', cache_dir=None):
+    """Get (and cache) the grid index of the exposure locations.
+
+    The index depends only on the grid and the exposure, so is shared by
+    every forecast cycle and hazard on the same grid.
+
+    Args:
+        cube (iris.cube.Cube) : Cube with 1-D latitude and longitude
+        exposure (pandas.DataFrame) : Exposure table, from load_exposure
+        method (str) : 'nearest' or 'bilinear'
+        cache_dir (str) : Directory to keep indices in between runs
+            (default: only cache in memory)
+
+    Returns:
+        tuple : (indices, weights) from build_grid_index
+    """
+    lat = cube.coord('latitude').points
+    lon = cube.coord('longitude').points
+    latitude = exposure[EXPOSURE_LATITUDE].values
+    longitude = exposure[EXPOSURE_LONGITUDE].values
+
+    digest = hashlib.sha1(method.encode())
+    for points in [lat, lon, latitude, longitude]:
+        digest.update(np.asarray(points, dtype=np.float64).tobytes())
+    key = digest.hexdigest()
+
+    if key not in _grid_index_cache:
+        filepath = None
+        if cache_dir is not None:
+            filepath = os.path.join(cache_dir, 'grid_index_%s.npz' % key)
+
+        if filepath is not None and os.path.isfile(filepath):
+            with np.load(filepath) as saved:
+                _grid_index_cache[key] = (saved['indices'], saved['weights'])
+        else:
+            indices, weights = build_grid_index(lat, lon, latitude,
+                                                longitude, method)
+            _grid_index_cache[key] = (indices, weights)
+            if filepath is not None:
+                os.makedirs(cache_dir, exist_ok=True)
+                np.savez(filepath, indices=indices, weights=weights)
+
+    return _grid_index_cache[key]
+
+
+def sample_grid(cube, index):
+    """Sample a hazard grid at the exposure locations of a grid index.
+
+    Args:
+        cube (iris.cube.Cube) : Hazard with latitude, longitude as the
+            last two dimensions (any leading dimensions are kept)
+        index (tuple) : (indices, weights) from grid_index
+
+    Returns:
+        numpy.ndarray : Hazard at each asset (NaN outside the grid or
+            where the grid is masked)
+    """
+    indices, weights = index
+
+    data = np.ma.filled(np.ma.asarray(cube.data, dtype=np.float64), np.nan)
+    data = data.reshape(data.shape[:-2] + (-1,))
+
+    # Gather every grid point used in one step, then weight them
+    values = data[..., np.where(indices < 0, 0, indices)]
+    values = (values * weights).sum(axis=-1)
+    values[..., (indices < 0).any(axis=-1)] = np.nan
+
+    return values
+
+
+def sample_hazards(grids, exposure, method='nearest', cache_dir=None):
+    """Sample hazard grids at every asset of an exposure table.
+
+    Args:
+        grids (dict) : Hazard name -> 2-D cube
+        exposure (pandas.DataFrame) : Exposure table, from load_exposure
+        method (str) : 'nearest' or 'bilinear'
+        cache_dir (str) : Directory to keep grid indices in
+
+    Returns:
+        pandas.DataFrame : Exposure table with a column for each hazard
+    """
+    exposure = exposure.copy()
+    for name, cube in grids.items():
+        index = grid_index(cube, exposure, method, cache_dir)
+        exposure[name] = sample_grid(cube, index)
+
+    return exposure
+
+
+def parse_args():
+    """Parse arguments for the script.
+
+    Returns:
+        dict : Dictionary of arguments passed to the script
+    """
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+
+    parser.add_argument(
+        'exposure_files',
+        help='Exposure CSV files to cache\n\n',
+        nargs='+'
+    )
+
+    parser.add_argument(
+        '--cache_dir',
+        help='Directory of the cache\ndefault=alongside each file\n\n',
+        type=str, default=None
+    )
+
+    return vars(parser.parse_args())
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+
+    for filepath in args['exposure_files']:
+        start_time = time.time()
+        df = load_exposure(filepath, args['cache_dir'])
+        print('Cached %s (%d assets) as %s in %.1f seconds' % (
+            filepath, len(df), cache_path(filepath, args['cache_dir']),
+            time.time() - start_time
+        ))
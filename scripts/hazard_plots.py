@@ -0,0 +1,277 @@
+####################################################
+#   Plots of the hazard grids from op_hazard_output.py:
+#       animations of the (10 min) weather fields and panels
+#       comparing the rain and wind hazard grids.
+####################################################
+
+# Import modules
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib.animation as animation
+import cartopy.crs as ccrs
+import iris.plot as iplt
+import iris.quickplot as qplt
+
+# Locations marked on every plot (longitude, latitude, marker)
+MARKERS = [
+    (151.7524, -32.4047, 'o'),  # Dungog
+    (151.7817, -32.9283, 'd'),  # Newcastle
+]
+
+# Animations: cube name -> (title, contour levels, units, filename)
+ANIMATIONS = {
+    'rain': ('10min rainfall', np.arange(2, 31, 1), 'kg m-2',
+             'rain_10min_%03d.png'),
+    'gust': ('Instantaneous 10m wind gust', np.arange(5, 60, 1), 'm s-1',
+             'gust_10min_%03d.png'),
+    'ws10m': ('Instantaneous 10m windspeed', np.arange(5, 35, 1), 'm s-1',
+              'windspeed_10min_%03d.png'),
+    'ws900': ('Instantaneous 900hPa windspeed', np.arange(5, 35, 1), 'm s-1',
+              'windspeed_900hpa_%03d.png'),
+}
+
+# Movie writers, by file extension
+MOVIE_WRITERS = {
+    '.mp4': animation.FFMpegWriter,
+    '.gif': animation.PillowWriter,
+}
+
+# Frames per second of the movies
+MOVIE_FPS = 6
+
+# Hazard panels: hazard -> (title, contour levels)
+RAIN_PANELS = [
+    ('PTEA', 'Point total event accum.', np.arange(20, 560, 20)),
+    ('P6RR', 'Point 6hr max. rain', np.arange(20, 360, 20)),
+    ('P1RR', 'Point 1hr max. rain', np.arange(10, 160, 10)),
+    ('N1RR', 'Neighbourhood 1hr max. rain', np.arange(10, 160, 10)),
+    ('PIRR', 'Point 10min max. rain', np.arange(0, 40, 5)),
+]
+WIND_PANELS = [
+    ('PSMW', 'Point 10m max. wind', np.arange(0, 40, 5)),
+    ('PSWG', 'Point 10m max. wind gust', np.arange(0, 70, 10)),
+    ('NSWG', 'Neighbourhood 10m max. wind gust', np.arange(0, 70, 10)),
+    ('PGWS', 'Point 900hPa max. wind', np.arange(0, 70, 5)),
+]
+
+
+def plot_markers(color='red'):
+    """Mark the locations of interest on the current axes.
+
+    Args:
+        color (str) : Marker colour
+    """
+    for lon, lat, marker in MARKERS:
+        plt.plot(lon, lat, color=color, marker=marker)
+
+
+def frame_title(cube, title, i):
+    """Title of one frame of an animation.
+
+    Args:
+        cube (iris.cube.Cube) : Time-varying cube (time, lat, lon)
+        title (str) : Title, to which the time of the frame is added
+        i (int) : Index of the frame
+
+    Returns:
+        str : Title of the frame
+    """
+    time = cube.coord('time')
+    return "%s (%s UTC)" % (
+        title, time.cell(i).point.strftime('%m/%d/%Y %H:%M:%S')
+    )
+
+
+def render_frames(cube, title, levels, units, filename, first=0):
+    """Save one frame per timestep of a cube, reusing a single figure.
+
+    The coastlines, markers and colourbar are drawn once; each frame
+    only replaces the filled contours and the title.
+
+    Args:
+        cube (iris.cube.Cube) : Time-varying cube (time, lat, lon)
+        title (str) : Title, to which the time of each frame is added
+        levels (numpy.ndarray) : Contour levels
+        units (str) : Colourbar label
+        filename (str) : Path of each frame, with a %d for the frame number
+        first (int) : Number of the first frame (when split across workers)
+
+    Returns:
+        list : Paths of the frames
+    """
+    plt.switch_backend('Agg')
+
+    fig = plt.figure(figsize=(10, 7))
+    suptitle = fig.suptitle('')
+
+    # As iris would, if it were left to create the axes
+    projection = iplt.default_projection(cube) or ccrs.PlateCarree()
+    axes = plt.axes(projection=projection)
+    axes.coastlines('10m')
+    plot_markers()
+
+    filenames = []
+    frame_artists = []
+    for i in range(cube.shape[0]):
+        # iris draws contour lines as well as the filled contours, so
+        # remove everything the last frame added
+        for artist in frame_artists:
+            artist.remove()
+        before = set(axes.get_children())
+        contours = iplt.contourf(cube[i, :, :], levels, axes=axes)
+        frame_artists = [artist for artist in axes.get_children()
+                         if artist not in before]
+
+        # The levels (and so colours) are the same for every frame
+        if i == 0:
+            cbar = plt.colorbar(contours, ax=axes, shrink=1)
+            cbar.set_label(units)
+
+        suptitle.set_text(frame_title(cube, title, i))
+        filenames.append(filename % (first + i))
+        fig.savefig(filenames[-1], dpi=150)
+
+    plt.close(fig)
+
+    return filenames
+
+
+def write_movie(filenames, movie, fps=MOVIE_FPS):
+    """Join rendered frames into a movie (e.g. .mp4 or .gif).
+
+    Args:
+        filenames (list) : Paths of the frames, in order
+        movie (str) : Path of the movie; the extension sets the format
+        fps (int) : Frames per second
+    """
+    ext = os.path.splitext(movie)[1].lower()
+    if ext not in MOVIE_WRITERS:
+        raise ValueError('Unknown movie format %s' % ext)
+
+    plt.switch_backend('Agg')
+
+    # Show each frame at its own size, with nothing around it
+    image = plt.imread(filenames[0])
+    height, width = image.shape[:2]
+    fig = plt.figure(figsize=(width / 100., height / 100.), dpi=100)
+    axes = fig.add_axes([0, 0, 1, 1])
+    axes.axis('off')
+    shown = axes.imshow(image)
+
+    writer = MOVIE_WRITERS[ext](fps=fps)
+    with writer.saving(fig, movie, dpi=100):
+        for filename in filenames:
+            shown.set_data(plt.imread(filename))
+            writer.grab_frame()
+
+    plt.close(fig)
+
+
+def animate(cube, title, levels, units, filename, workers=1, movie=None):
+    """Save one frame per timestep of a cube, and optionally a movie.
+
+    Args:
+        cube (iris.cube.Cube) : Time-varying cube (time, lat, lon)
+        title (str) : Title, to which the time of each frame is added
+        levels (numpy.ndarray) : Contour levels
+        units (str) : Colourbar label
+        filename (str) : Path of each frame, with a %d for the frame number
+        workers (int) : Number of processes rendering frames
+        movie (str) : Path of a movie (.mp4 or .gif) of the frames, if any
+
+    Returns:
+        list : Paths of the frames
+    """
+    nframes = cube.shape[0]
+    print('Rendering %s frames' % nframes)
+
+    if workers <= 1:
+        filenames = render_frames(cube, title, levels, units, filename)
+    else:
+        # One contiguous run of frames per worker, each with one figure
+        bounds = np.linspace(0, nframes, workers + 1).astype(int)
+        mp_context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=mp_context) as pool:
+            futures = [
+                pool.submit(render_frames, cube[start:stop], title, levels,
+                            units, filename, start)
+                for start, stop in zip(bounds[:-1], bounds[1:])
+                if stop > start
+            ]
+            filenames = [name for future in futures
+                         for name in future.result()]
+
+    if movie is not None:
+        write_movie(filenames, movie)
+
+    return filenames
+
+
+def animate_all(cubes, output_dir, workers=1, movie_format=None):
+    """Animate each of the weather fields used to calculate the hazards.
+
+    Args:
+        cubes (dict) : Name (see ANIMATIONS) -> time-varying cube
+        output_dir (str) : Directory for the frames
+        workers (int) : Number of processes rendering frames
+        movie_format (str) : Also join the frames of each field into a
+            movie of this format (e.g. mp4 or gif), if given
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    for name, cube in cubes.items():
+        title, levels, units, filename = ANIMATIONS[name]
+
+        movie = None
+        if movie_format is not None:
+            base = filename.split('_%')[0]
+            movie = os.path.join(output_dir, '%s.%s' % (base, movie_format))
+
+        animate(cube, title, levels, units, os.path.join(output_dir, filename),
+                workers=workers, movie=movie)
+
+
+def plot_panels(grids, panels, title, filename):
+    """Plot hazard grids side by side.
+
+    Args:
+        grids (dict) : Hazard name -> cube
+        panels (list) : (hazard, title, contour levels) of each panel
+        title (str) : Figure title
+        filename (str) : Path of the figure
+    """
+    fig = plt.figure()
+    plt.suptitle(title)
+
+    for i, (name, panel_title, levels) in enumerate(panels):
+        plt.subplot(1, len(panels), i + 1)
+        qplt.contourf(grids[name], levels)
+        plt.gca().coastlines('10m')
+        plot_markers(color='white')
+        plt.title(panel_title)
+
+    fig.set_size_inches(24, 6)
+    plt.subplots_adjust(hspace=0.0, wspace=0.3)
+    plt.savefig(filename, dpi=150)
+    plt.close(fig)
+
+
+def plot_hazards(grids, output_dir, label):
+    """Plot the rain and wind hazard grids.
+
+    Args:
+        grids (dict) : Hazard name -> cube
+        output_dir (str) : Directory for the figures
+        label (str) : Label of the forecast, used in the filenames
+    """
+    plot_panels(
+        grids, RAIN_PANELS, 'Rainfall hazard grids (10min data)',
+        os.path.join(output_dir, '%s_rain_hazard_10min.png' % label)
+    )
+    plot_panels(
+        grids, WIND_PANELS, 'Wind hazard grids (10min data)',
+        os.path.join(output_dir, '%s_wind_hazard_10min.png' % label)
+    )
@@ -0,0 +1,314 @@
+####################################################
+#   Running state of the event hazard grids (maxima, totals and
+#       rolling rain windows), saved to disk between runs so that
+#       each new forecast cycle or batch of timesteps only has to
+#       fold in the data it adds, rather than recompute the event.
+####################################################
+
+# Import modules
+import os
+from collections import OrderedDict
+
+import numpy as np
+import iris
+import iris.analysis
+from cf_units import Unit
+from iris.coords import CellMethod
+
+from cube_utils import realise
+from neighbourhood import DEFAULT_RADIUS, neighbourhood_max_cube
+from rainfall import RAIN_DURATIONS, cumulative_sum, rolling_max, window_length
+
+# Point hazards that are an event maximum: hazard -> weather field
+MAX_HAZARDS = OrderedDict([
+    ('PSWG', 'gust'),
+    ('PSMW', 'ws10m'),
+    ('PGWS', 'ws900'),
+    ('PIRR', 'rain'),
+])
+
+# Times are kept in fixed units, whatever the units of each file
+STATE_UNITS = Unit('hours since 1970-01-01 00:00:00', calendar='standard')
+
+
+def load_state(filepath):
+    """Load the hazard state saved by save_state.
+
+    Args:
+        filepath (str) : Path of the state file (.npz)
+
+    Returns:
+        dict : Name -> array; empty if there is no state yet
+    """
+    if not os.path.isfile(filepath):
+        return {}
+
+    with np.load(filepath) as saved:
+        return {name: saved[name] for name in saved.files}
+
+
+def save_state(state, filepath):
+    """Save the hazard state, replacing any previous state in one step.
+
+    Args:
+        state (dict) : Name -> array
+        filepath (str) : Path of the state file (.npz)
+    """
+    directory = os.path.dirname(filepath)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    # Write alongside and then rename, so a failed run can't corrupt it
+    tmp_filepath = filepath + '.tmp.npz'
+    np.savez(tmp_filepath, **state)
+    os.replace(tmp_filepath, filepath)
+
+
+def file_end(filepath, variable):
+    """Last time in a file, in STATE_UNITS, without reading its data.
+
+    Args:
+        filepath (str) : Path of the file
+        variable (str) : Name of a time-varying variable in the file
+
+    Returns:
+        float : Last time point of the variable
+    """
+    cubes = iris.load(filepath, iris.Constraint(
+        cube_func=lambda cube: cube.var_name == variable
+    ))
+    if not cubes:
+        raise ValueError('No %s found in %s' % (variable, filepath))
+
+    time = cubes[0].coord('time')
+    return time.units.convert(time.points.max(), STATE_UNITS)
+
+
+def new_files(state, filepaths, variable, fields):
+    """Select the files holding timesteps not yet folded into the state.
+
+    Files that end before the last time folded in for every field they
+    hold are left out, so they are never loaded (or de-accumulated). The
+    last file is always kept, as the template of the hazard grids.
+
+    Args:
+        state (dict) : Name -> array
+        filepaths (list) : Files, in time order
+        variable (str) : Name of a time-varying variable in the files
+        fields (list) : Weather fields read from the files (e.g. gust)
+
+    Returns:
+        list : Indices of the files to load
+    """
+    lasts = [state[field + '_last'] for field in fields
+             if field + '_last' in state]
+    if len(lasts) < len(fields):
+        return list(range(len(filepaths)))
+
+    last = min(lasts)
+    keep = [i for i, filepath in enumerate(filepaths)
+            if file_end(filepath, variable) > last]
+
+    return keep or [len(filepaths) - 1]
+
+
+def state_times(cube):
+    """Times (and the limits of their bounds) of a cube in STATE_UNITS.
+
+    Args:
+        cube (iris.cube.Cube) : Cube with a time coordinate
+
+    Returns:
+        tuple : (points, lower bounds, upper bounds) as arrays
+    """
+    time = cube.coord('time')
+    points = time.units.convert(time.points, STATE_UNITS)
+    if time.has_bounds():
+        bounds = time.units.convert(time.bounds, STATE_UNITS)
+        return points, bounds.min(axis=1), bounds.max(axis=1)
+
+    return points, points, points
+
+
+def new_timesteps(state, field, cube):
+    """Select the timesteps of a cube after the last one already folded in.
+
+    The start and end of the event and the last time folded in are
+    updated in the state.
+
+    Args:
+        state (dict) : Name -> array
+        field (str) : Name of the weather field (e.g. gust)
+        cube (iris.cube.Cube) : Time-varying cube, time first
+
+    Returns:
+        iris.cube.Cube : The new timesteps, or None if there are none
+    """
+    points, lower, upper = state_times(cube)
+
+    last = state.get(field + '_last')
+    if last is not None:
+        start = np.searchsorted(points, last, side='right')
+        if start == len(points):
+            return None
+        cube = cube[start:]
+        points, lower, upper = points[start:], lower[start:], upper[start:]
+
+    state.setdefault(field + '_start', np.array(lower[0]))
+    state[field + '_end'] = np.array(upper[-1])
+    state[field + '_last'] = np.array(points[-1])
+
+    return cube
+
+
+def fold(state, name, data, ufunc):
+    """Fold new data into a running statistic of the state.
+
+    Args:
+        state (dict) : Name -> array
+        name (str) : Name of the statistic (e.g. PSWG)
+        data (numpy.ndarray) : New values, on the grid of the statistic
+        ufunc (numpy.ufunc) : How to combine them, e.g. np.maximum
+
+    Returns:
+        numpy.ndarray : The updated statistic
+    """
+    data = np.ma.filled(data, -np.inf if ufunc is np.maximum else 0)
+
+    if name not in state:
+        state[name] = np.array(data, dtype=np.float64)
+    elif state[name].shape != data.shape:
+        raise ValueError(
+            'The grid of %s has changed from %s to %s'
+            % (name, state[name].shape, data.shape)
+        )
+    else:
+        ufunc(state[name], data, out=state[name])
+
+    return state[name]
+
+
+def fold_rain(state, cube, steps):
+    """Fold new rainfall into the total and rolling window maxima.
+
+    The last few timesteps are kept in the state, so that windows that
+    straddle the old and new data are counted.
+
+    Args:
+        state (dict) : Name -> array
+        cube (iris.cube.Cube) : New rainfall per timestep, time first
+        steps (dict) : Name of each window hazard and its length in timesteps
+    """
+    data = np.ma.filled(cube.data, 0)
+    fold(state, 'PTEA', data.sum(axis=0), np.add)
+
+    tail = state.get('rain_tail')
+    if tail is not None:
+        data = np.concatenate([tail, data])
+
+    csum = cumulative_sum(data)
+    for name, n in steps.items():
+        fold(state, name, rolling_max(csum, n), np.maximum)
+
+    keep = max(steps.values()) - 1
+    state['rain_tail'] = data[max(len(data) - keep, 0):]
+
+
+def update_state(state, weather, durations=RAIN_DURATIONS):
+    """Fold the new timesteps of each weather field into the state.
+
+    Args:
+        state (dict) : Name -> array (updated in place)
+        weather (dict) : Name -> cube, from op_hazard_output.load_weather
+        durations (dict) : Rolling rain windows (hours), e.g. P1RR: 1
+
+    Returns:
+        dict : The updated state
+    """
+    steps = OrderedDict(
+        (name, window_length(weather['rain'], hours))
+        for name, hours in durations.items()
+    )
+
+    # Realise the event maxima of the new timesteps in a single pass
+    maxima = OrderedDict()
+    new = {}
+    for field in ['gust', 'ws10m', 'ws900', 'rain']:
+        new[field] = new_timesteps(state, field, weather[field])
+    for name, field in MAX_HAZARDS.items():
+        if new[field] is not None:
+            maxima[name] = new[field].collapsed('time', iris.analysis.MAX)
+    realise(list(maxima.values()))
+
+    for name, cube in maxima.items():
+        fold(state, name, cube.data, np.maximum)
+
+    if new['rain'] is not None:
+        fold_rain(state, new['rain'], steps)
+
+    return state
+
+
+def state_cube(state, field, template, name, methods):
+    """Build a cube of one of the hazards from the state.
+
+    Args:
+        state (dict) : Name -> array
+        field (str) : Name of the weather field the hazard is from
+        template (iris.cube.Cube) : Time-varying cube of that field
+        name (str) : Name of the hazard (e.g. PSWG)
+        methods (list) : Cell methods (e.g. 'sum', 'maximum') to record
+
+    Returns:
+        iris.cube.Cube : Cube of the hazard over the whole event (masked
+            where there is no value yet, e.g. a rain window longer than
+            the data so far)
+    """
+    data = np.ma.masked_invalid(state[name]).astype(template.dtype)
+    if not np.ma.is_masked(data):
+        data = data.filled()
+    result = template[0].copy(data=data)
+
+    # Time coordinate spans the event, as cube.collapsed would give
+    time = result.coord('time')
+    lower, upper = STATE_UNITS.convert(
+        np.array([state[field + '_start'], state[field + '_end']]), time.units
+    )
+    result.replace_coord(
+        time.copy(points=[(lower + upper) / 2.], bounds=[[lower, upper]])
+    )
+
+    for method in methods:
+        result.add_cell_method(CellMethod(method, coords='time'))
+
+    return result
+
+
+def state_grids(state, weather, radius=DEFAULT_RADIUS,
+                durations=RAIN_DURATIONS):
+    """Build the hazard grids from the state.
+
+    Args:
+        state (dict) : Name -> array, from update_state
+        weather (dict) : Name -> cube, used as templates for the grids
+        radius (float) : Neighbourhood radius (degrees)
+        durations (dict) : Rolling rain windows (hours), e.g. P1RR: 1
+
+    Returns:
+        OrderedDict : Hazard name -> cube
+    """
+    grids = OrderedDict()
+    for name, field in MAX_HAZARDS.items():
+        grids[name] = state_cube(state, field, weather[field], name,
+                                 ['maximum'])
+    grids['PTEA'] = state_cube(state, 'rain', weather['rain'], 'PTEA',
+                               ['sum'])
+    for name in durations:
+        grids[name] = state_cube(state, 'rain', weather['rain'], name,
+                                 ['sum', 'maximum'])
+
+    # Neighbourhood maxima
+    grids['NSWG'] = neighbourhood_max_cube(grids['PSWG'], radius)
+    grids['N1RR'] = neighbourhood_max_cube(grids['P1RR'], radius)
+
+    return grids
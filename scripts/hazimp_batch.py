@@ -0,0 +1,459 @@
+####################################################
+#   Generates HazImp configuration files for a set of forecast
+#       cycles and hazards from a single template, and runs them
+#       in parallel, loading each exposure file and vulnerability
+#       curve set only once for all of the cycles that share them.
+####################################################
+
+# Usage:
+#   python hazimp_batch.py generate -c 2019052600 2019052606 -o configs/
+#   python hazimp_batch.py run configs/*.yaml -w 4
+
+# Import modules
+import os
+import re
+import copy
+import argparse
+import datetime
+import time
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pprint import pprint
+
+import yaml
+
+# Variable holding each hazard in its own op_<hazard>_<label>.nc file
+HAZARD_VARIABLES = {
+    'PSWG': 'wndgust10m',
+}
+
+# HazImp jobs whose results depend only on their inputs (not the
+# hazard), so are run once and shared by every configuration
+PRELOAD_JOBS = ['load_exposure', 'load_xml_vulnerability']
+
+# Default fields of the exposure holding the location of each asset,
+# as in the HazImp load_exposure job
+HAZIMP_LATITUDE = 'exposure_latitude'
+HAZIMP_LONGITUDE = 'exposure_longitude'
+
+# Configuration entries read by the preload jobs
+PRELOAD_KEYS = ['template', 'load_exposure', 'vulnerability_filename']
+
+# Configuration keys naming output files, whose directories must exist
+OUTPUT_KEYS = ['save', 'save_agg', 'file_name']
+
+# Contexts preloaded by preload_contexts, inherited by the workers
+_preloaded = {}
+
+
+def parse_args():
+    """Parse arguments for the script.
+
+    Returns:
+        dict : Dictionary of arguments passed to the script
+    """
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    # Generate configuration files
+    generate = subparsers.add_parser(
+        'generate', formatter_class=argparse.RawTextHelpFormatter,
+        help='Write a configuration file for each cycle and hazard'
+    )
+
+    default_template = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        '..', 'configuration', 'hazimp', 'template.yaml'
+    )
+    generate.add_argument(
+        '-t', '--template',
+        help='Template configuration\ndefault=%s\n\n' % default_template,
+        type=str, default=default_template
+    )
+
+    generate.add_argument(
+        '-c', '--cycles',
+        help='Forecast cycles (YYYYMMDDHH)\n\n',
+        nargs='+', required=True
+    )
+
+    generate.add_argument(
+        '-z', '--hazards',
+        help='Hazards to calculate the impact of\ndefault=PSWG\n\n',
+        nargs='+', default=['PSWG']
+    )
+
+    default_hazard_mask = '/g/data/w85/BNHCRC/hazard/may2019/op_{hazard}_{label}.nc'
+    generate.add_argument(
+        '--hazard_mask',
+        help='Hazard file mask\ndefault=%s\n\n' % default_hazard_mask,
+        type=str, default=default_hazard_mask
+    )
+
+    generate.add_argument(
+        '--combined',
+        help='Hazards are all in one op_hazards_<label>.nc file (the\n'
+             'combined output of op_hazard_output.py), named by hazard\n\n',
+        action='store_true'
+    )
+
+    generate.add_argument(
+        '--combined_mask',
+        help='Combined hazard file mask, used with --combined\n'
+             'default=the hazard mask with op_{hazard}_ replaced by op_hazards_\n\n',
+        type=str, default=None
+    )
+
+    default_impact_dir = '/g/data/w85/BNHCRC/impact'
+    generate.add_argument(
+        '--impact_dir',
+        help='Impact output directory\ndefault=%s\n\n' % default_impact_dir,
+        type=str, default=default_impact_dir
+    )
+
+    default_exposure = '/g/data/w85/BNHCRC/exposure/NSW_Residential_Wind_Exposure_2018_TCRM.csv'
+    generate.add_argument(
+        '-e', '--exposure_file',
+        help='Exposure file\ndefault=%s\n\n' % default_exposure,
+        type=str, default=default_exposure
+    )
+
+    default_vulnerability = 'domestic_wind_vul_curves2.xml'
+    generate.add_argument(
+        '--vulnerability_file',
+        help='Vulnerability curves\ndefault=%s\n\n' % default_vulnerability,
+        type=str, default=default_vulnerability
+    )
+
+    default_vulnerability_set = 'domestic_wind_2012'
+    generate.add_argument(
+        '--vulnerability_set',
+        help='Vulnerability set\ndefault=%s\n\n' % default_vulnerability_set,
+        type=str, default=default_vulnerability_set
+    )
+
+    generate.add_argument(
+        '-o', '--output_dir',
+        help='Directory to write the configuration files to\ndefault=.\n\n',
+        type=str, default='.'
+    )
+
+    # Run configuration files
+    run = subparsers.add_parser(
+        'run', formatter_class=argparse.RawTextHelpFormatter,
+        help='Run HazImp for each configuration file'
+    )
+
+    run.add_argument(
+        'config_files',
+        help='HazImp configuration files\n\n',
+        nargs='+'
+    )
+
+    run.add_argument(
+        '-w', '--workers',
+        help='Number of configurations run at once\ndefault=1\n\n',
+        type=int, default=1
+    )
+
+    run.add_argument(
+        '--cache_dir',
+        help='Directory to keep the binary copies of the exposure files in\n'
+             'default=alongside each exposure file\n\n',
+        type=str, default=None
+    )
+
+    # Parse the arguments, convert to dict
+    args = vars(parser.parse_args())
+
+    if args['command'] == 'generate':
+        for cycle in args['cycles']:
+            if not re.match(r'^\d{10}$', cycle):
+                parser.error('Cycle %s is not of the form YYYYMMDDHH' % cycle)
+
+        if args['combined'] and args['combined_mask'] is None:
+            args['combined_mask'] = args['hazard_mask'].replace(
+                'op_{hazard}_', 'op_hazards_'
+            )
+            if args['combined_mask'] == args['hazard_mask']:
+                parser.error('No op_{hazard}_ in the hazard mask to name the '
+                             'combined file by; use --combined_mask')
+
+    return args
+
+
+def cycle_fields(cycle):
+    """Fields of a forecast cycle used in the template and file masks.
+
+    Args:
+        cycle (str) : Forecast cycle, e.g. 2019052600
+
+    Returns:
+        dict : cycle (2019052600) and label (20190526_00)
+    """
+    date = datetime.datetime.strptime(cycle, '%Y%m%d%H')
+
+    return {
+        'cycle': cycle,
+        'label': date.strftime('%Y%m%d_%H'),
+    }
+
+
+def generate_configs(args):
+    """Write a configuration file for each cycle and hazard.
+
+    Args:
+        args (dict) : Arguments dictionary from parse_args
+
+    Returns:
+        list : Paths of the configuration files written
+    """
+    with open(args['template']) as f:
+        template = f.read()
+
+    os.makedirs(args['output_dir'], exist_ok=True)
+    single = len(args['hazards']) == 1
+
+    filepaths = []
+    for cycle in args['cycles']:
+        for hazard in args['hazards']:
+            fields = cycle_fields(cycle)
+            fields['hazard'] = hazard
+
+            if args['combined']:
+                fields['hazard_file'] = args['combined_mask'].format(**fields)
+                fields['variable'] = hazard
+            else:
+                if hazard not in HAZARD_VARIABLES:
+                    raise ValueError(
+                        'No variable known for %s; use --combined' % hazard
+                    )
+                fields['hazard_file'] = args['hazard_mask'].format(**fields)
+                fields['variable'] = HAZARD_VARIABLES[hazard]
+
+            for key in ['impact_dir', 'exposure_file', 'vulnerability_file',
+                        'vulnerability_set']:
+                fields[key] = args[key]
+
+            # Keep the existing naming (<cycle>.yaml) for a single hazard
+            if single:
+                filename = '%s.yaml' % cycle
+            else:
+                filename = '%s_%s.yaml' % (cycle, hazard)
+            filepath = os.path.join(args['output_dir'], filename)
+
+            with open(filepath, 'w') as f:
+                f.write(template.format(**fields))
+            filepaths.append(filepath)
+
+    return filepaths
+
+
+def read_config(filepath):
+    """Read a HazImp configuration file.
+
+    Args:
+        filepath (str) : Path of the configuration file
+
+    Returns:
+        list : Configuration, as a list of single-key dicts
+    """
+    with open(filepath) as f:
+        return yaml.safe_load(f)
+
+
+def make_output_dirs(config_list):
+    """Create the directories of the output files of a configuration.
+
+    Args:
+        config_list (list) : Configuration from read_config
+    """
+    def walk(item):
+        if isinstance(item, dict):
+            for key, value in item.items():
+                if key in OUTPUT_KEYS and isinstance(value, str):
+                    directory = os.path.dirname(value)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                else:
+                    walk(value)
+        elif isinstance(item, list):
+            for value in item:
+                walk(value)
+
+    walk(config_list)
+
+
+def split_jobs(config_list):
+    """Build the HazImp jobs of a configuration, split into those that
+    can be shared between configurations and the rest.
+
+    Args:
+        config_list (list) : Configuration from read_config
+
+    Returns:
+        tuple : (preload jobs, remaining jobs)
+    """
+    from hazimp import config
+
+    jobs = config.instance_builder(config_list)
+    preload = [job for job in jobs if job.call_name in PRELOAD_JOBS]
+    remaining = [job for job in jobs if job.call_name not in PRELOAD_JOBS]
+
+    return preload, remaining
+
+
+def preload_key(config_list):
+    """Key identifying the inputs of the shared jobs of a configuration.
+
+    Args:
+        config_list (list) : Configuration from read_config
+
+    Returns:
+        str : Key, equal for configurations loading the same exposure and
+            vulnerability files in the same way
+    """
+    shared = [item for item in config_list
+              if set(item).intersection(PRELOAD_KEYS)]
+
+    return repr(shared)
+
+
+def load_exposure_context(cont, atts, cache_dir=None):
+    """Load an exposure file into a HazImp context, as the HazImp
+    load_exposure job does, but through the binary exposure cache.
+
+    Args:
+        cont (hazimp.context.Context) : Context to load the exposure into
+        atts (dict) : Arguments of the load_exposure job
+        cache_dir (str) : Directory of the cache (default: alongside the file)
+    """
+    import exposure
+
+    df = exposure.load_exposure(atts['file_name'], cache_dir)
+    latitude = atts.get('exposure_latitude') or HAZIMP_LATITUDE
+    longitude = atts.get('exposure_longitude') or HAZIMP_LONGITUDE
+    for column in [latitude, longitude]:
+        if column not in df.columns:
+            raise RuntimeError('No %s column in %s'
+                               % (column, atts['file_name']))
+
+    cont.exposure_lat = df.pop(latitude).values
+    cont.exposure_long = df.pop(longitude).values
+    cont.exposure_att = df
+
+
+def preload_contexts(config_files, cache_dir=None):
+    """Run the shared jobs once for each set of configurations sharing them.
+
+    The exposure is loaded through the binary exposure cache, so only
+    the first run parses the CSV file.
+
+    Args:
+        config_files (list) : Paths of the configuration files
+        cache_dir (str) : Directory of the exposure cache (default:
+            alongside each exposure file)
+
+    Returns:
+        dict : Configuration file -> key of its preloaded context
+    """
+    from hazimp import context
+
+    keys = {}
+    for filepath in config_files:
+        config_list = read_config(filepath)
+        key = preload_key(config_list)
+        if key not in _preloaded:
+            preload, _ = split_jobs(config_list)
+            print('Preloading exposure and vulnerability for %s' % filepath)
+            cont = context.Context()
+            for job in preload:
+                if job.call_name == 'load_exposure':
+                    load_exposure_context(cont, job.atts_to_add, cache_dir)
+                else:
+                    job(cont)
+            _preloaded[key] = cont
+        keys[filepath] = key
+
+    return keys
+
+
+def run_config(filepath, key=None):
+    """Run HazImp for one configuration file.
+
+    Args:
+        filepath (str) : Path of the configuration file
+        key (str) : Key of the preloaded context to start from, if any
+
+    Returns:
+        tuple : (filepath, time taken in seconds)
+    """
+    from hazimp import context, pipeline
+
+    start_time = time.time()
+    config_list = read_config(filepath)
+    make_output_dirs(config_list)
+
+    preload, remaining = split_jobs(config_list)
+    if key in _preloaded:
+        cont = copy.deepcopy(_preloaded[key])
+    else:
+        cont = context.Context()
+        remaining = preload + remaining
+    pipeline.PipeLine(remaining).run(cont)
+
+    return filepath, time.time() - start_time
+
+
+def run_configs(config_files, workers=1, cache_dir=None):
+    """Run HazImp for each configuration file, in parallel.
+
+    Args:
+        config_files (list) : Paths of the configuration files
+        workers (int) : Number of configurations run at once
+        cache_dir (str) : Directory of the exposure cache
+
+    Returns:
+        OrderedDict : Configuration file -> time taken in seconds
+    """
+    keys = preload_contexts(config_files, cache_dir)
+
+    times = OrderedDict()
+    if workers <= 1:
+        for filepath in config_files:
+            times.update([run_config(filepath, keys[filepath])])
+        return times
+
+    # Fork, so that the workers inherit the preloaded contexts rather
+    # than each re-reading them (only CSV and XML are open at this point)
+    mp_context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as pool:
+        futures = [pool.submit(run_config, filepath, keys[filepath])
+                   for filepath in config_files]
+        for future in futures:
+            filepath, seconds = future.result()
+            print('Completed %s (%.1f seconds)' % (filepath, seconds))
+            times[filepath] = seconds
+
+    return times
+
+
+if __name__ == '__main__':
+
+    start_time = time.time()
+
+    # Get the arguments, print them pretty
+    args = parse_args()
+    pprint(args)
+
+    if args['command'] == 'generate':
+        for filepath in generate_configs(args):
+            print('Configuration written to %s' % filepath)
+    else:
+        run_configs(args['config_files'], args['workers'], args['cache_dir'])
+
+    print('DONE')
+    end_time = time.time()
+    print('Time elapsed = %s seconds' % (end_time - start_time))
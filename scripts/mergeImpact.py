@@ -49,11 +49,22 @@ from os.path import dirname, realpath, isdir, join as pjoin
 
 import logging
 from collections import OrderedDict
+from contextlib import contextmanager
 
 import pandas as pd
 import geopandas as gpd
 import numpy as np
 
+from boundaries import (IMPACT_CODE, load_boundaries, load_regions,
+                        join_boundaries)
+
+# pyogrio writes whole columns at a time, rather than a feature at a time
+try:
+    import pyogrio  # noqa: F401
+    WRITE_ENGINE = 'pyogrio'
+except ImportError:
+    WRITE_ENGINE = 'fiona'
+
 
 # The columns represent the mean and total values for each region.
 # * "SA1_MAIN16" = SA1 code, named to match the field name in the region file
@@ -65,39 +76,16 @@ import numpy as np
 # * "SLRT" = standard deviation of structural loss ratio
 
 
-# Presently this is hard coded to match the fields of the input file
-# and the expected field widths of the output. When implemented into
-# HazImp, this will need to be determined automatically from the input
-# zone file, and appended with the known columns that are generated
-# within HazImp (currently listed just above).
-
-SCHEMA={
-  'geometry':'Polygon',
-  'properties':OrderedDict([
-      ('SA1_MAIN16','int:16'),
-      ('SA1_7DIG16','int:16'),
-      ('SA2_MAIN16','int:11'),
-      ('SA2_5DIG16','int:11'),
-      ('SA2_NAME16','str:50'),
-      ('SA3_CODE16','int:9'),
-      ('SA3_NAME16','str:50'),
-      ('SA4_CODE16','int:9'),
-      ('SA4_NAME16','str:50'),
-      ('GCC_CODE16','str:10'),
-      ('GCC_NAME16','str:50'),
-      ('STE_CODE16','int:9'),
-      ('STE_NAME16','str:50'),
-      ('AREASQKM16','float:12.4'),
-      ('Shape_Leng','float:9.6'),
-      ('Shape_Area','float:9.6'),
-      ('SLM','float:15.2'),
-      ('SLT','float:15.2'),
-      ('RVM','float:15.2'),
-      ('RVT','float:15.2'),
-      ('SLRM','float:9.7'),
-      ('SLRT','float:9.7')
-  ])
-}
+# The output schema is derived from the data (see deriveSchema), so
+# it follows whatever fields the region file has.
+
+# Output formats: name -> (file extension, OGR driver)
+OUTPUT_FORMATS = OrderedDict([
+    ('shp', ('.shp', 'ESRI Shapefile')),
+    ('parquet', ('.parquet', None)),
+    ('fgb', ('.fgb', 'FlatGeobuf')),
+    ('geojson', ('.geojson', 'GeoJSON')),
+])
 
 
 # pylint: disable=R0914
@@ -180,6 +168,18 @@ def startup():
                         help='File containing impact data')
     parser.add_argument('-o', '--outputfile',
                         help='Output file location')
+    parser.add_argument('-b', '--bbox', type=float, nargs=4,
+                        help='Only use regions intersecting this domain '
+                             '(lon_W lat_S lon_E lat_N)')
+    parser.add_argument('-f', '--format', choices=list(OUTPUT_FORMATS),
+                        help='Output format (default: from the output '
+                             'file extension, else shp)')
+    parser.add_argument('-t', '--tolerance', type=float,
+                        help='Simplify the boundaries to this tolerance '
+                             '(degrees)')
+    parser.add_argument('--cachedir',
+                        help='Directory of the boundary store '
+                             '(default: alongside the shape file)')
     parser.add_argument('-l', '--loglevel',
                         help='Logging detail level')
     parser.add_argument('-v', '--verbose', help='Verbose output',
@@ -228,34 +228,174 @@ def startup():
     else:
         logger.warn("No output file specified")
         base, ext = os.path.splitext(impactFile)
-        outputFile = "{0}.shp".format(base)
+        fmt = args.format or 'shp'
+        outputFile = "{0}{1}".format(base, OUTPUT_FORMATS[fmt][0])
         logger.warn("Using default output path: {0}".format(outputFile))
 
-    mergeImpact(impactFile, shapeFile, outputFile)
+    mergeImpact(impactFile, shapeFile, outputFile, bbox=args.bbox,
+                cacheDir=args.cachedir, fmt=args.format,
+                tolerance=args.tolerance)
     logger.info("Completed mergeImpact.py")
 
-def mergeImpact(impactFile, shapeFile, output, joinField='SA1_MAIN16'):
+@contextmanager
+def timePhase(timings, phase):
+    """
+    Time a phase of the processing, and log how long it took.
+
+    :param dict timings: Phase -> time taken (seconds), updated in place
+    :param str phase: Name of the phase
+    """
+    start = time.time()
+    yield
+    timings[phase] = time.time() - start
+    logging.info("{0}: {1:.2f} seconds".format(phase, timings[phase]))
+
+def outputFormat(output, fmt=None):
+    """
+    Work out the format of an output file.
+
+    :param str output: Output file
+    :param str fmt: One of ``OUTPUT_FORMATS``, or ``None`` to go by the
+                    file extension (defaulting to shapefile)
+
+    :returns: Name of the format
+    """
+    if fmt is not None:
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError("Unknown output format: {0}".format(fmt))
+        return fmt
+
+    ext = os.path.splitext(output)[1].lower()
+    for name, (extension, driver) in OUTPUT_FORMATS.items():
+        if ext == extension:
+            return name
+    if ext == '.json':
+        return 'geojson'
+    return 'shp'
+
+def deriveSchema(gdf):
+    """
+    Derive the output schema from the data, with text fields only as
+    wide as their longest value.
+
+    :param gdf: :class:`geopandas.GeoDataFrame` to write
+
+    :returns: Schema dict, as used by fiona
+    """
+    schema = gpd.io.file.infer_schema(gdf)
+    for name, ftype in schema['properties'].items():
+        if ftype == 'str':
+            width = max(gdf[name].astype(str).str.len().max(), 1)
+            schema['properties'][name] = 'str:{0}'.format(int(width))
+    return schema
+
+def writeOutput(gdf, output, fmt=None):
+    """
+    Write the merged impact data in one of the ``OUTPUT_FORMATS``.
+
+    :param gdf: :class:`geopandas.GeoDataFrame` to write
+    :param str output: Output file
+    :param str fmt: Output format, or ``None`` to go by the file extension
+    """
+    fmt = outputFormat(output, fmt)
+    extension, driver = OUTPUT_FORMATS[fmt]
+    logging.debug("Output format: {0}".format(fmt))
+
+    if fmt == 'parquet':
+        gdf.to_parquet(output)
+    elif WRITE_ENGINE == 'pyogrio':
+        # Field types are taken from the data
+        gdf.to_file(output, driver=driver, engine='pyogrio')
+    else:
+        gdf.to_file(output, driver=driver, schema=deriveSchema(gdf))
+
+def readImpact(impactFile, joinField='SA1_MAIN16'):
+    """
+    Read regional impact data, either the HazImp aggregation (three
+    header rows, then the fixed columns) or a table with a single header
+    row naming its columns (e.g. from ensemble_impact.py).
+
+    :param str impactFile: Regional impact data (csv)
+    :param str joinField: Field to hold the region code
+
+    :returns: :class:`pandas.DataFrame` with an integer region code in
+              ``joinField``
+    """
+    with open(impactFile) as fh:
+        header = fh.readline().strip().split(',')
+
+    for code in [joinField, IMPACT_CODE]:
+        if code in header:
+            df = pd.read_csv(impactFile, dtype={code:np.int64})
+            return df.rename(columns={code:joinField})
 
-    logging.info("Merging impact data with region shape file")
     colnames = [joinField, "SLM", "SLT", "RVM", "RVT", "SLRM", "SLRT"]
+    return pd.read_csv(impactFile, names=colnames,
+                       dtype={joinField:np.int64}, skiprows=3)
+
+def mergeImpact(impactFile, shapeFile, output, joinField='SA1_MAIN16',
+                bbox=None, cacheDir=None, fmt=None, tolerance=None):
+    """
+    Join aggregated impact data to the boundaries of its regions.
+
+    The region codes are read as integers. With a domain, the boundaries
+    come from a store of the shape file clipped to it (see
+    boundaries.py); otherwise only the regions in the impact data are
+    read from the shape file, and stored for the next run with the same
+    regions. Either way they are joined by a lookup of the codes.
+
+    :param str impactFile: Aggregated impact data (csv) from HazImp, or
+                           regional impacts with a header row (see
+                           :func:`readImpact`)
+    :param str shapeFile: Shape file of the region boundaries
+    :param str output: Output file
+    :param str joinField: Field holding the region code
+    :param tuple bbox: (lon_W, lat_S, lon_E, lat_N) of the domain, or
+                       ``None`` to read just the regions with impacts
+    :param str cacheDir: Directory of the boundary store
+    :param str fmt: Output format (see ``OUTPUT_FORMATS``), or ``None``
+                    to go by the output file extension
+    :param float tolerance: Simplify the boundaries to this tolerance
+                            (degrees), or ``None`` for full resolution
+
+    :returns: :class:`collections.OrderedDict` of the time taken by each
+              phase (seconds)
+    """
+
+    logging.info("Merging impact data with region shape file")
+    timings = OrderedDict()
 
-    dtype = {joinField:str}
     logging.debug("Loading impact data: {0}".format(impactFile))
-    df = pd.read_csv(impactFile,
-                     names=colnames, dtype=dtype,
-                     skiprows=3)
+    with timePhase(timings, "Read impact data"):
+        df = readImpact(impactFile, joinField)
     logging.info(df.columns)
+
     logging.debug("Loading shape file: {0}".format(shapeFile))
-    gdf = gpd.read_file(shapeFile)
+    with timePhase(timings, "Read boundaries"):
+        if bbox is not None:
+            gdf = load_boundaries(shapeFile, bbox, code='SA1_MAIN16',
+                                  cache_dir=cacheDir, tolerance=tolerance)
+        else:
+            gdf = load_regions(shapeFile, df[joinField].values,
+                               code='SA1_MAIN16', cache_dir=cacheDir,
+                               tolerance=tolerance)
+
     logging.debug("Merging on {0}".format(joinField))
-    mgdf = gdf.merge(df, left_on='SA1_MAIN16', right_on=joinField)
+    with timePhase(timings, "Join"):
+        mgdf = join_boundaries(df, gdf, impactcode=joinField,
+                               boundarycode='SA1_MAIN16')
+
     logging.info("Writing output file: {0}".format(output))
     try:
-        mgdf.to_file(output, schema=SCHEMA)
+        with timePhase(timings, "Write output"):
+            writeOutput(mgdf, output, fmt)
     except:
         logging.exception("Cannot create output file")
         raise
 
+    logging.info("Total: {0:.2f} seconds".format(sum(timings.values())))
+    return timings
+
 if __name__ == "__main__":
     import argparse
     startup()
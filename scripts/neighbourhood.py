@@ -0,0 +1,386 @@
+####################################################
+#   Neighbourhood statistics on regular lat/lon grids.
+#       Replaces the per-cell iris.Constraint loops previously
+#       used for the neighbourhood hazards (NSWG, N1RR) with a
+#       whole-array operation over a precomputed circular
+#       footprint. Other statistics (mean, percentiles) use a
+#       neighbourhood index: the neighbours of every cell, built
+#       once per grid and radius and cached in memory and on disk.
+####################################################
+
+# Import modules
+import os
+import hashlib
+import warnings
+import numpy as np
+from scipy.ndimage import maximum_filter1d
+
+# Neighbourhood distance in degrees used for the NSWG and N1RR grids
+DEFAULT_RADIUS = 0.36
+
+# Mean radius of the Earth (km), for great-circle neighbourhoods
+EARTH_RADIUS = 6371.0
+
+# Relative tolerance on the radius, so that offsets a whole number of
+# (rounded) grid spacings away are counted the same along both axes
+RADIUS_TOLERANCE = 1e-4
+
+# Upper limit on the number of values gathered at once (bounds memory)
+MAX_GATHER = 2 ** 24
+
+# Neighbourhood indices, keyed on the grid, radius and distance
+_index_cache = {}
+
+
+def grid_spacing(cube):
+    """Work out the (regular) latitude/longitude spacing of a cube.
+
+    Args:
+        cube (iris.cube.Cube) : Cube with latitude and longitude coordinates
+
+    Returns:
+        tuple : (dlat, dlon) grid spacing in degrees
+    """
+    spacing = []
+    for name in ['latitude', 'longitude']:
+        points = cube.coord(name).points
+        spacing.append(abs(points[-1] - points[0]) / (len(points) - 1))
+
+    return tuple(spacing)
+
+
+def circular_footprint(radius, dlat, dlon):
+    """Build a boolean footprint of all grid offsets within a radius.
+
+    Args:
+        radius (float) : Neighbourhood radius in degrees
+        dlat (float) : Latitude spacing in degrees
+        dlon (float) : Longitude spacing in degrees
+
+    Returns:
+        numpy.ndarray : 2-D boolean array centred on the origin cell
+    """
+    radius = radius * (1. + RADIUS_TOLERANCE)
+    nlat = int(np.floor(radius / dlat))
+    nlon = int(np.floor(radius / dlon))
+
+    # Degree distance of every offset from the centre cell
+    ilat, ilon = np.mgrid[-nlat:nlat + 1, -nlon:nlon + 1]
+    rad = ((ilat * dlat) ** 2 + (ilon * dlon) ** 2) ** 0.5
+
+    return rad <= radius
+
+
+def neighbourhood_max(data, footprint):
+    """Maximum of every cell's neighbourhood, over the whole array at once.
+
+    The circular footprint is split into one horizontal run per row
+    offset; each run is a 1-D sliding-window maximum along longitude
+    which is then shifted along latitude and folded into the result.
+    Cells beyond the edge of the grid are ignored, as are masked cells.
+
+    Args:
+        data (numpy.ndarray) : Array with latitude, longitude as the last
+            two dimensions (any leading dimensions, e.g. time, are kept)
+        footprint (numpy.ndarray) : Boolean footprint from circular_footprint
+
+    Returns:
+        numpy.ndarray : Neighbourhood maximum, same shape as data
+    """
+    mask = np.ma.getmaskarray(data)
+    values = np.ma.getdata(data).astype(np.float64)
+    values = np.where(mask, -np.inf, values)
+
+    nlat = footprint.shape[0] // 2
+    nlon = footprint.shape[1] // 2
+    nrows = values.shape[-2]
+
+    result = np.full(values.shape, -np.inf)
+
+    # Sliding-window maxima are shared by rows with the same half-width
+    filtered = {}
+    for offset, row in zip(range(-nlat, nlat + 1), footprint):
+        if not row.any():
+            continue
+
+        # Footprints are symmetric, so each row is a centred run
+        half_width = nlon - np.argmax(row)
+        if half_width not in filtered:
+            filtered[half_width] = maximum_filter1d(
+                values, size=2 * half_width + 1, axis=-1,
+                mode='constant', cval=-np.inf
+            )
+        row_max = filtered[half_width]
+
+        # Fold row (i + offset) of the window maximum into row i
+        if offset >= 0:
+            target = result[..., :nrows - offset, :]
+            source = row_max[..., offset:, :]
+        else:
+            target = result[..., -offset:, :]
+            source = row_max[..., :nrows + offset, :]
+        np.maximum(target, source, out=target)
+
+    return np.ma.masked_invalid(result)
+
+
+def row_offsets(lat, dlat, dlon, radius, great_circle=False):
+    """Grid offsets within the radius of a cell, for each row of a grid.
+
+    Args:
+        lat (numpy.ndarray) : Latitude of each row (degrees)
+        dlat (float) : Latitude spacing in degrees
+        dlon (float) : Longitude spacing in degrees
+        radius (float) : Neighbourhood radius, in degrees or (for
+            great-circle distance) km
+        great_circle (bool) : Use great-circle distance rather than degrees
+
+    Returns:
+        list : (row offsets, column offsets) arrays for each row
+    """
+    if not great_circle:
+        # The same footprint applies to every row
+        footprint = circular_footprint(radius, dlat, dlon)
+        ilat, ilon = np.nonzero(footprint)
+        offsets = (ilat - footprint.shape[0] // 2,
+                   ilon - footprint.shape[1] // 2)
+        return [offsets] * len(lat)
+
+    # Largest offsets that could be within the radius (at the poles
+    # longitude offsets are unbounded, so cap them at a half circle)
+    radians = radius * (1. + RADIUS_TOLERANCE) / EARTH_RADIUS
+    nlat = int(np.floor(np.degrees(radians) / dlat))
+    max_lat = min(np.abs(lat).max() + nlat * dlat, 89.)
+    nlon = int(min(np.floor(np.degrees(radians) / np.cos(np.radians(max_lat))
+                            / dlon), np.ceil(180. / dlon)))
+    ilat, ilon = np.mgrid[-nlat:nlat + 1, -nlon:nlon + 1]
+
+    offsets = []
+    for latitude in np.radians(lat):
+        # Haversine distance from this row to every offset
+        other = latitude + np.radians(ilat * dlat)
+        hav = (np.sin((other - latitude) / 2.) ** 2 +
+               np.cos(latitude) * np.cos(other) *
+               np.sin(np.radians(ilon * dlon) / 2.) ** 2)
+        inside = 2. * np.arcsin(np.sqrt(np.minimum(hav, 1.))) <= radians
+        offsets.append((ilat[inside], ilon[inside]))
+
+    return offsets
+
+
+def build_index(lat, lon, radius, great_circle=False):
+    """Flat indices of the neighbours of every cell of a lat/lon grid.
+
+    Neighbours beyond the edge of the grid point at an extra (sentinel)
+    cell one past the end of the flattened grid, so every cell has the
+    same number of entries.
+
+    Args:
+        lat (numpy.ndarray) : Latitude points (degrees)
+        lon (numpy.ndarray) : Longitude points (degrees)
+        radius (float) : Neighbourhood radius, in degrees or (for
+            great-circle distance) km
+        great_circle (bool) : Use great-circle distance rather than degrees
+
+    Returns:
+        numpy.ndarray : (ncells, nneighbours) flat indices into the grid
+    """
+    nrows, ncols = len(lat), len(lon)
+    dlat = abs(lat[-1] - lat[0]) / (nrows - 1)
+    dlon = abs(lon[-1] - lon[0]) / (ncols - 1)
+    offsets = row_offsets(lat, dlat, dlon, radius, great_circle)
+
+    # Latitudes may run north to south
+    sign = 1 if lat[-1] >= lat[0] else -1
+
+    width = max(len(ilat) for ilat, _ in offsets)
+    sentinel = nrows * ncols
+    index = np.full((nrows, ncols, width), sentinel, dtype=np.int64)
+    columns = np.arange(ncols)[:, np.newaxis]
+
+    for row, (ilat, ilon) in enumerate(offsets):
+        rows = row + sign * ilat
+        cols = columns + ilon
+        valid = ((rows >= 0) & (rows < nrows))[np.newaxis, :] & \
+            (cols >= 0) & (cols < ncols)
+        index[row, :, :len(ilat)] = np.where(valid, rows * ncols + cols,
+                                             sentinel)
+
+    return index.reshape(sentinel, width)
+
+
+def index_key(lat, lon, radius, great_circle=False):
+    """Key of a neighbourhood index, from the grid and the neighbourhood.
+
+    Args:
+        lat (numpy.ndarray) : Latitude points (degrees)
+        lon (numpy.ndarray) : Longitude points (degrees)
+        radius (float) : Neighbourhood radius
+        great_circle (bool) : Use great-circle distance rather than degrees
+
+    Returns:
+        str : Hex digest identifying the index
+    """
+    digest = hashlib.sha1()
+    for points in [lat, lon]:
+        digest.update(np.asarray(points, dtype=np.float64).tobytes())
+    digest.update(repr((float(radius), bool(great_circle))).encode())
+
+    return digest.hexdigest()
+
+
+def neighbourhood_index(cube, radius=DEFAULT_RADIUS, great_circle=False,
+                        cache_dir=None):
+    """Get (and cache) the neighbourhood index of a cube's grid.
+
+    Args:
+        cube (iris.cube.Cube) : Cube with 1-D latitude and longitude
+        radius (float) : Neighbourhood radius, in degrees or (for
+            great-circle distance) km
+        great_circle (bool) : Use great-circle distance rather than degrees
+        cache_dir (str) : Directory to keep indices in between runs
+            (default: only cache in memory)
+
+    Returns:
+        numpy.ndarray : (ncells, nneighbours) index from build_index
+    """
+    lat = cube.coord('latitude').points
+    lon = cube.coord('longitude').points
+    key = index_key(lat, lon, radius, great_circle)
+
+    if key not in _index_cache:
+        filepath = None
+        if cache_dir is not None:
+            filepath = os.path.join(cache_dir, 'neighbourhood_%s.npy' % key)
+
+        if filepath is not None and os.path.isfile(filepath):
+            _index_cache[key] = np.load(filepath)
+        else:
+            index = build_index(lat, lon, radius, great_circle)
+
+            # Save the smallest integers that fit
+            dtype = np.int32 if index.max() < 2 ** 31 else np.int64
+            _index_cache[key] = index.astype(dtype)
+            if filepath is not None:
+                os.makedirs(cache_dir, exist_ok=True)
+                np.save(filepath, _index_cache[key])
+
+    return _index_cache[key]
+
+
+def neighbourhood_stat(data, index, statistic='max', percentile=None):
+    """Statistic of every cell's neighbourhood, from a neighbourhood index.
+
+    Cells beyond the edge of the grid are ignored, as are masked cells.
+
+    Args:
+        data (numpy.ndarray) : Array with latitude, longitude as the last
+            two dimensions (any leading dimensions, e.g. time, are kept)
+        index (numpy.ndarray) : Index from neighbourhood_index
+        statistic (str) : One of 'max', 'min', 'mean' or 'percentile'
+        percentile (float) : Percentile (0-100) for 'percentile'
+
+    Returns:
+        numpy.ndarray : Masked neighbourhood statistic, same shape as data
+    """
+    functions = {
+        'max': np.nanmax,
+        'min': np.nanmin,
+        'mean': np.nanmean,
+        'percentile': lambda x, axis: np.nanpercentile(x, percentile, axis),
+    }
+    if statistic not in functions:
+        raise ValueError('Unknown neighbourhood statistic %s' % statistic)
+    if statistic == 'percentile' and percentile is None:
+        raise ValueError('A percentile is needed for a percentile statistic')
+    function = functions[statistic]
+
+    # Flatten the grid, with NaN for masked cells and the sentinel
+    shape = data.shape
+    values = np.ma.filled(np.ma.asarray(data, dtype=np.float64), np.nan)
+    values = values.reshape(shape[:-2] + (-1,))
+    values = np.concatenate(
+        [values, np.full(shape[:-2] + (1,), np.nan)], axis=-1
+    )
+
+    ncells, width = index.shape
+    leading = int(np.prod(shape[:-2]))
+    block = max(MAX_GATHER // (width * leading), 1)
+
+    result = np.empty(shape[:-2] + (ncells,))
+    with warnings.catch_warnings():
+        # Cells with no valid neighbours are left as NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for start in range(0, ncells, block):
+            end = min(start + block, ncells)
+            result[..., start:end] = function(
+                values[..., index[start:end]], axis=-1
+            )
+
+    return np.ma.masked_invalid(result.reshape(shape))
+
+
+def neighbourhood_cube(cube, radius=DEFAULT_RADIUS, statistic='max',
+                       percentile=None, great_circle=False, cache_dir=None):
+    """Neighbourhood statistic of a cube.
+
+    Args:
+        cube (iris.cube.Cube) : 2-D (or time-stacked 3-D) lat/lon cube
+        radius (float) : Neighbourhood radius, in degrees or (for
+            great-circle distance) km
+        statistic (str) : One of 'max', 'min', 'mean' or 'percentile'
+        percentile (float) : Percentile (0-100) for 'percentile'
+        great_circle (bool) : Use great-circle distance rather than degrees
+        cache_dir (str) : Directory to keep neighbourhood indices in
+
+    Returns:
+        iris.cube.Cube : Copy of the cube holding the neighbourhood statistic
+    """
+    index = neighbourhood_index(cube, radius, great_circle, cache_dir)
+    data = neighbourhood_stat(cube.data, index, statistic, percentile)
+
+    return neighbourhood_copy(cube, data)
+
+
+def neighbourhood_copy(cube, data):
+    """Copy of a cube with new data, keeping the input dtype.
+
+    Args:
+        cube (iris.cube.Cube) : Source cube
+        data (numpy.ma.MaskedArray) : Neighbourhood statistic
+
+    Returns:
+        iris.cube.Cube : Copy of the cube holding the data
+    """
+    # Keep the input dtype (and drop the mask if nothing was masked)
+    data = data.astype(cube.dtype)
+    if not np.ma.is_masked(data):
+        data = data.filled()
+
+    return cube.copy(data=data)
+
+
+def neighbourhood_max_cube(cube, radius=DEFAULT_RADIUS, great_circle=False,
+                           cache_dir=None):
+    """Neighbourhood maximum of a cube within a radius.
+
+    Args:
+        cube (iris.cube.Cube) : 2-D (or time-stacked 3-D) lat/lon cube
+        radius (float) : Neighbourhood radius, in degrees or (for
+            great-circle distance) km
+        great_circle (bool) : Use great-circle distance rather than degrees
+        cache_dir (str) : Directory to keep neighbourhood indices in
+
+    Returns:
+        iris.cube.Cube : Copy of the cube holding the neighbourhood maximum
+    """
+    # The footprint filter is quicker than gathering for degree distance
+    if great_circle:
+        return neighbourhood_cube(cube, radius, 'max',
+                                  great_circle=great_circle,
+                                  cache_dir=cache_dir)
+
+    footprint = circular_footprint(radius, *grid_spacing(cube))
+    data = neighbourhood_max(cube.data, footprint)
+
+    return neighbourhood_copy(cube, data)
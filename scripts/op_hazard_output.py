@@ -3,52 +3,22 @@
 Created on Wed Mar 13 10:45:13 2019
 
 Script loads .nc data gathered from MARS (at this stage via twister) and
-outputs hazard grids as separate .nc files computed over forecast 
+outputs hazard grids as separate .nc files computed over forecast.
 
+Usage:
+    python op_hazard_output.py -s fc_slvl_20191021_12.nc
+        -p fc_plvl_20191021_12.nc -o /g/data/w85/BNHCRC/hazard/
 
-@author: dwilke
-"""
+Add -m combined to write all of the grids to a single file, which can be
+read back with load_hazard_grids.
 
-# -*- coding: utf-8 -*-
-"""
-Created on Tue Oct 22 2019
+For an ensemble, put {member} in the file names and list the members:
+    python op_hazard_output.py -s fc_slvl_20191021_12_{member}.nc
+        -p fc_plvl_20191021_12_{member}.nc --members 000 001 002
 
 @author: dwilke
 """
 
-
-import iris
-import iris.pandas
-import iris.analysis.cartography
-from iris.cube import Cube
-import matplotlib
-import matplotlib.pyplot as plt
-import matplotlib.colors as col
-import matplotlib.ticker as tick
-import iris.quickplot as qplt
-import iris.plot as iplt
-import os
-import sys
-import argparse
-from pprint import pprint
-from glob import glob as ls
-import warnings
-import numpy as np
-import datetime
-from iris.experimental.equalise_cubes import equalise_attributes
-from iris.util import unify_time_units
-import iris.coord_categorisation as ct
-import time
-
-import pandas as pd 
-from pandas import DataFrame
-import cf_units as unit
-import datetime
-
-import glob
-import calendar
-import datetime
-
 """
 Key:
 
@@ -65,582 +35,583 @@ PGWS - (P)oint (G)radient <900hPa> (W)ind (S)peed
 
 """
 
-#%% Load all files and create base weather cubes:
-
-file_sfc = 'fc_slvl_20191021_12.nc'
-file_upp = 'fc_plvl_20191021_12.nc'
-    
-lat_S = -34.0
-lat_N = -31.5
-lon_W = 150.5
-lon_E = 153.0 
-
-lat_constraint = iris.Constraint(
-            latitude = lambda cell: lat_S <= cell <= lat_N
-        )
-lon_constraint = iris.Constraint(
-            longitude = lambda cell: lon_W <= cell <= lon_E
-        )
-
-fc_slvl = iris.load(file_sfc,lat_constraint & lon_constraint)
-fc_plvl = iris.load(file_upp,lat_constraint & lon_constraint)
-
-uwnd900 = fc_plvl[1]
-vwnd900 = fc_plvl[0]
-
-uwnd10m = fc_slvl[1]
-vwnd10m = fc_slvl[0]
-wg10m = fc_slvl[3]
-
-# Regrid U onto V
-interpolator = iris.analysis.Linear()
-vwnd900 = vwnd900.regrid(uwnd900, interpolator)
-vwnd10m = vwnd10m.regrid(uwnd10m, interpolator)
-
-# Create a cube of wind speed at surface and 900hPa
-ws900 = (uwnd900 ** 2 + vwnd900 ** 2) ** 0.5
-ws10m = (uwnd10m ** 2 + vwnd10m ** 2) ** 0.5
-ws900.rename('900hPa windspeed')
-ws10m.rename('10m windspeed')
-
-ws900 = ws900[:,0,:,:]
-
-# Event maximum
-# Point gradient wind speed (event max.)
-PGWS = ws900.collapsed('time', iris.analysis.MAX)
-# Point surface (10m) mean wind speed (event max.)
-PSMW = ws10m.collapsed('time', iris.analysis.MAX)
-# Point surface (10m) wind gust (event max.)
-PSWG = wg10m.collapsed('time', iris.analysis.MAX)
-
-# Calculate the neighbourhood max. wind gust:
-NSWG = PSWG.copy()
-
-print("No. of points:", NSWG.shape[0]*NSWG.shape[1])
-for x_A in range (0,len(PSWG.coord('latitude').points)):
-    print("Doing: ", x_A, " out of ", len(PSWG.coord('latitude').points))
-    for y_A in range (0,len(PSWG.coord('longitude').points)):
-        
-        # Neighbourhood distance in degrees:
-        D = 0.36
-        
-        # Determine lat/lon of point
-        lat = PSWG.coord('latitude').points[x_A]
-        lon = PSWG.coord('longitude').points[y_A]
-        
-        lat_constraintN = iris.Constraint(
-            latitude = lambda cell: (lat-D) <= cell <= (lat+D)
-        )
-        lon_constraintN = iris.Constraint(
-            longitude = lambda cell: (lon-D) <= cell <= (lon+D)
-        )        
-        
-        # Slice cube to D * D square:
-        current = PSWG.extract(lat_constraintN & lon_constraintN)
-        # Save arrays of coordinates
-        grid_lon, grid_lat = iris.analysis.cartography.get_xy_grids(current)
-        # Determine degree distance point from (lon,lat) in numpy array
-        rad = ((grid_lon-lon)**2 + (grid_lat-lat)**2)**0.5
-        # Convert cube to df
-        current_df = iris.pandas.as_data_frame(current, copy=True)
-        # Determine max over region of interest:
-        NSWG.data[x_A,y_A] = np.amax(np.where(rad<=D,1,0)*current_df.values)
-
-# save files:
-iris.save(PGWS, 'op_PGWS_10min.nc')
-iris.save(PSMW, 'op_PSMW_10min.nc')
-iris.save(PSWG, 'op_PSWG_10min.nc')
-iris.save(NSWG, 'op_NSWG_10min.nc') 
-
-
-
-
-
-# Load hrly files into cubes (at 900hPa level in lat/lon range):
-# These files have no overlapping data:
-uwnd900 = iris.load(files_u_prs,iris.Constraint(pressure=900) & lat_constraint & lon_constraint)
-vwnd900 = iris.load(files_v_prs,iris.Constraint(pressure=900) & lat_constraint & lon_constraint)
-
-# Load 10min files into cubes (in lat/lon range):
-# Important- these files need to be sliced to remove the first timestep of each cube which overlaps 
-rain = iris.load(files_rain,lat_constraint & lon_constraint)
-uwnd10m = iris.load(files_u_10m,lat_constraint & lon_constraint)
-vwnd10m = iris.load(files_v_10m,lat_constraint & lon_constraint)
-gust = iris.load(files_gust,lat_constraint & lon_constraint)
-
-# Clean and concatenate wind data (10min rain data needs to be re-cubed due to timing):
-uwnd900 = clean_data(uwnd900)
-uwnd900 = uwnd900.concatenate_cube()
-
-vwnd900 = clean_data(vwnd900)
-vwnd900 = vwnd900.concatenate_cube()
-
-uwnd10m = clean_data(uwnd10m)
-uwnd10m = remove_first_timestep(uwnd10m)
-uwnd10m = uwnd10m.concatenate_cube()
-
-vwnd10m = clean_data(vwnd10m)
-vwnd10m = remove_first_timestep(vwnd10m)
-vwnd10m = vwnd10m.concatenate_cube()
-
-gust = clean_data(gust)
-gust = remove_first_timestep(gust)
-gust = gust.concatenate_cube()
-
-# Regrid U onto V
-interpolator = iris.analysis.Linear()
-vwnd900 = vwnd900.regrid(uwnd900, interpolator)
-vwnd10m = vwnd10m.regrid(uwnd10m, interpolator)
-
-# Create a cube of wind speed
-ws900 = (uwnd900 ** 2 + vwnd900 ** 2) ** 0.5
-ws10m = (uwnd10m ** 2 + vwnd10m ** 2) ** 0.5
-ws900.rename('900hPa windspeed')
-ws10m.rename('10m windspeed')
-
-# Create list of rain cube differences, removing first from each file
-rain_list = iris.cube.CubeList([])
-for i in range (0,len(rain)):
-    print(i)
-    for j in range (1,rain[i].shape[0]):
-        current = rain[i][j,:,:]-rain[i][j-1,:,:]
-        time_coord = iris.coords.DimCoord(rain[i].coord('time').bounds[j,1], standard_name='time', units='s')
-        latitude_coord = current.coords('latitude')[0]
-        longitude_coord = current.coords('longitude')[0]
-        data = np.zeros((1,current.shape[0],current.shape[1]))
-        data[0,:,:] = current.data
-        cube = Cube(data, units="kg m-2", dim_coords_and_dims=[(time_coord, 0),(latitude_coord, 1),(longitude_coord, 2)])
-        #cube.add_aux_coord(time_aux_coord)
-        rain_list.append(cube)
-
-rain = rain_list.concatenate_cube()
-
-#%% Rain hazard grids:  
-
-# Max 10min (instantaneous) rainfall rate: 
-PIRR = rain.collapsed('time', iris.analysis.MAX) 
-
-# Point total event accum
-PTEA = rain.collapsed('time', iris.analysis.SUM)
-
-# Calculate max 1hr rainfall rate:
-N = len(rain.coord('time').points)
-# Initialise empty list of cubes to store 6hr data:
-cube_list_1hr = iris.cube.CubeList([])
-# loop over cubes:
-for i in range (3,N-2):
-    time_start = iris.Constraint(
-            time = lambda cell: cell >= rain.coord('time').cell(i-3)
-        )
-        
-    time_end = iris.Constraint(
-            time = lambda cell: cell <= rain.coord('time').cell(i+2)
-        )
-
-    # Find a cube with appropriate 1hr rainfall data
-    current = rain.extract(time_start)
-    current = current.extract(time_end)
-
-    # Sum across 1hr to have one time dimension
-    current = current.collapsed('time', iris.analysis.SUM)
-    # add to list
-    cube_list_1hr.append(current)
-
-cube_1hr = cube_list_1hr.merge_cube() 
-
-# Determine max 1hr rain-rate:
-P1RR = cube_1hr.collapsed('time', iris.analysis.MAX)
-
-# Calculate max 6hr rainfall rate:
-# Initialise empty list of cubes to store 6hr data:
-cube_list_6hr = iris.cube.CubeList([])
-# loop over cubes:
-for i in range (18,N-17):
-    time_start = iris.Constraint(
-            time = lambda cell: cell >= rain.coord('time').cell(i-18)
-        )
-        
-    time_end = iris.Constraint(
-            time = lambda cell: cell <= rain.coord('time').cell(i+17)
-        )
-    
-    # Find a cube with appropriate 1hr rainfall data
-    current = rain.extract(time_start)
-    current = current.extract(time_end)
-
-    # Sum across 6hrs to have one time dimension
-    current = current.collapsed('time', iris.analysis.SUM)
-    # add to list
-    cube_list_6hr.append(current)
-
-cube_6hr = cube_list_6hr.merge_cube() 
-
-# Determine max 6hr rain-rate:
-P6RR = cube_6hr.collapsed('time', iris.analysis.MAX)
-
-# Determine the neighbourhood 1hr rain-rate:
-N1RR = P1RR.copy()
-
-print("No. of points:", N1RR.shape[0]*N1RR.shape[1])
-for x_A in range (0,len(P1RR.coord('latitude').points)):
-    print("Doing: ", x_A, " out of ", len(P1RR.coord('latitude').points))
-    for y_A in range (0,len(P1RR.coord('longitude').points)):
-        
-        # Neighbourhood distance in degrees:
-        D = 0.36
-        
-        # Determine lat/lon of point
-        lat = P1RR.coord('latitude').points[x_A]
-        lon = P1RR.coord('longitude').points[y_A]
-        
-        lat_constraintN = iris.Constraint(
-            latitude = lambda cell: (lat-D) <= cell <= (lat+D)
-        )
-        lon_constraintN = iris.Constraint(
-            longitude = lambda cell: (lon-D) <= cell <= (lon+D)
-        )        
-        
-        # Slice cube to D * D square:
-        current = P1RR.extract(lat_constraintN & lon_constraintN)
-   
-        # Save arrays of coordinates
-        grid_lon, grid_lat = iris.analysis.cartography.get_xy_grids(current)
-        # Determine degree distance point from (lon,lat) in numpy array
-        rad = ((grid_lon-lon)**2 + (grid_lat-lat)**2)**0.5
-        # Convert cube to df
-        current_df = iris.pandas.as_data_frame(current, copy=True)
-        # Determine max over region of interest:
-        N1RR.data[x_A,y_A] = np.amax(np.where(rad<=D,1,0)*current_df.values)
-   
-
-#%% Wind hazard grids:
-
-# Event maximum
-# Point gradient wind speed (event max.)
-PGWS = ws900.collapsed('time', iris.analysis.MAX)
-# Point surface (10m) mean wind speed (event max.)
-PSMW = ws10m.collapsed('time', iris.analysis.MAX)
-# Point surface (10m) wind gust (event max.)
-PSWG = gust.collapsed('time', iris.analysis.MAX)
-
-# Calculate the neighbourhood max. wind gust:
-NSWG = PSWG.copy()
-
-print("No. of points:", NSWG.shape[0]*NSWG.shape[1])
-for x_A in range (0,len(PSWG.coord('latitude').points)):
-    print("Doing: ", x_A, " out of ", len(PSWG.coord('latitude').points))
-    for y_A in range (0,len(PSWG.coord('longitude').points)):
-        
-        # Neighbourhood distance in degrees:
-        D = 0.36
-        
-        # Determine lat/lon of point
-        lat = PSWG.coord('latitude').points[x_A]
-        lon = PSWG.coord('longitude').points[y_A]
-        
-        lat_constraintN = iris.Constraint(
-            latitude = lambda cell: (lat-D) <= cell <= (lat+D)
-        )
-        lon_constraintN = iris.Constraint(
-            longitude = lambda cell: (lon-D) <= cell <= (lon+D)
-        )        
-        
-        # Slice cube to D * D square:
-        current = PSWG.extract(lat_constraintN & lon_constraintN)
-        # Save arrays of coordinates
-        grid_lon, grid_lat = iris.analysis.cartography.get_xy_grids(current)
-        # Determine degree distance point from (lon,lat) in numpy array
-        rad = ((grid_lon-lon)**2 + (grid_lat-lat)**2)**0.5
-        # Convert cube to df
-        current_df = iris.pandas.as_data_frame(current, copy=True)
-        # Determine max over region of interest:
-        NSWG.data[x_A,y_A] = np.amax(np.where(rad<=D,1,0)*current_df.values)
-
-
-
-
-#%% Determine rainfall 48hr to 09am 22/04/2015 (201504192300 to 201504212300)
-
-# Convert a time to epoch time for slicing:
-t_start = datetime.datetime(2015, 4, 19, 23)
-t_end = datetime.datetime(2015, 4, 21, 23)
-# Convert a time to epoch time for slicing:
-t_start = (calendar.timegm(t_start.timetuple()))/60/60
-t_end = (calendar.timegm(t_end.timetuple()))/60/60
-
-time_constraint = iris.Constraint(
-            time = lambda cell: t_start < cell.point <= t_end
-        )
-
-rain_sub = rain.extract(time_constraint)
-
-# Point total event accum
-PTEA_sub = rain_sub.collapsed('time', iris.analysis.SUM)
-
-
-#%% Save/load files:
-
-iris.save(rain, 'rain.nc')
-
-iris.save(PIRR, 'dungog_PIRR_10min.nc')
-iris.save(P1RR, 'dungog_P1RR_10min.nc')
-iris.save(P6RR, 'dungog_P6RR_10min.nc')
-iris.save(PTEA, 'dungog_PTEA_10min.nc')
-iris.save(N1RR, 'dungog_N1RR_10min.nc')
-
-iris.save(PGWS, 'dungog_PGWS_10min.nc')
-iris.save(PSMW, 'dungog_PSMW_10min.nc')
-iris.save(PSWG, 'dungog_PSWG_10min.nc')
-iris.save(NSWG, 'dungog_NSWG_10min.nc')   
-
-PIRR = iris.load_cube('dungog_PIRR_10min.nc')
-P1RR = iris.load_cube('dungog_P1RR_10min.nc')
-P6RR = iris.load_cube('dungog_P6RR_10min.nc')
-PTEA = iris.load_cube('dungog_PTEA_10min.nc')
-N1RR = iris.load_cube('dungog_N1RR_10min.nc')
-
-PGWS = iris.load_cube('dungog_PGWS_10min.nc')
-PSMW = iris.load_cube('dungog_PSMW_10min.nc')
-PSWG = iris.load_cube('dungog_PSWG_10min.nc')
-NSWG = iris.load_cube('dungog_NSWG_10min.nc')  
-
-
-# Load files:
-#P1RR_1hr = iris.load_cube('dungog_P1RR_1hr.nc')
-#P6RR_1hr = iris.load_cube('dungog_P6RR_1hr.nc')
-#PTEA_1hr = iris.load_cube('dungog_PTEA_1hr.nc')
-#N1RR_1hr = iris.load_cube('dungog_N1RR_1hr.nc')
-
-#%% Rain animation
-print(len(rain.coord('time').points))
-for i in range (0,len(rain.coord('time').points)):
-    print(i)
-    fig = plt.figure(i)
-    plt.clf()
-    title_text = "10min rainfall (%s UTC)" % (time.strftime('%m/%d/%Y %H:%M:%S',  time.gmtime(rain.coord('time').cell(i).point*60*60)))
-    plt.suptitle(title_text)
-# , brewer_cmap.N, cmap=brewer_cmap
-    #plt.subplot(2,1,1)
-    iplt.contourf(rain[i,:,:], np.arange(2,31,1))
-    plt.gca().coastlines('10m')
-    plt.plot(151.7524,-32.4047, color='red', marker='o')
-    plt.plot(151.7817,-32.9283, color='red', marker='d')
-    #plt.axis([145.5,151,-39, -35])
-    #plt.xticks([146,148,150])
-    #plt.yticks([-36,-38])
-    #plt.plot(149.8191,-36.6722, color='blue', marker='.')
-    #plt.plot(149.2336,-37.0016, color='red', marker='.')
-    #plt.plot(146.9509,-36.0690, color='black', marker='.')
-    #plt.title('Relative humidity')
-    cbar=plt.colorbar(shrink=1)
-    cbar.set_label('kg m-2')
-    fig.set_size_inches(10,7)
-
-    filename = "animation/rain_10min_%03d.png" % (i)
-    plt.savefig(filename,dpi=150)
-    plt.clf()    
-
-#%% Gust animation
-print(len(gust.coord('time').points))
-for i in range (0,len(gust.coord('time').points)):
-    print(i)
-    fig = plt.figure(i)
-    plt.clf()
-    title_text = "Instantaneous 10m wind gust (%s UTC)" % (gust.coord('time').cell(i).point)
-    plt.suptitle(title_text)
-# , brewer_cmap.N, cmap=brewer_cmap
-    #plt.subplot(2,1,1)
-    iplt.contourf(gust[i,:,:], np.arange(5,60,1))
-    plt.gca().coastlines('10m')
-    plt.plot(151.7524,-32.4047, color='red', marker='o')
-    plt.plot(151.7817,-32.9283, color='red', marker='d')
-    #plt.axis([145.5,151,-39, -35])
-    #plt.xticks([146,148,150])
-    #plt.yticks([-36,-38])
-    #plt.plot(149.8191,-36.6722, color='blue', marker='.')
-    #plt.plot(149.2336,-37.0016, color='red', marker='.')
-    #plt.plot(146.9509,-36.0690, color='black', marker='.')
-    #plt.title('Relative humidity')
-    cbar=plt.colorbar(shrink=1)
-    cbar.set_label('m s-1')
-    fig.set_size_inches(10,7)
-
-    filename = "animation/gust_10min_%02d.png" % (i)
-    plt.savefig(filename,dpi=150)
-    plt.clf()
-
-#% windspeed animation
-print(len(ws10m.coord('time').points))
-for i in range (0,len(ws10m.coord('time').points)):
-    print(i)
-    fig = plt.figure(i)
-    plt.clf()
-    title_text = "Instantaneous 10m windspeed (%s UTC)" % (ws10m.coord('time').cell(i).point)
-    plt.suptitle(title_text)
-# , brewer_cmap.N, cmap=brewer_cmap
-    #plt.subplot(2,1,1)
-    iplt.contourf(ws10m[i,:,:], np.arange(5,35,1))
-    plt.gca().coastlines('10m')
-    plt.plot(151.7524,-32.4047, color='red', marker='o')
-    plt.plot(151.7817,-32.9283, color='red', marker='d')
-    #plt.axis([145.5,151,-39, -35])
-    #plt.xticks([146,148,150])
-    #plt.yticks([-36,-38])
-    #plt.plot(149.8191,-36.6722, color='blue', marker='.')
-    #plt.plot(149.2336,-37.0016, color='red', marker='.')
-    #plt.plot(146.9509,-36.0690, color='black', marker='.')
-    #plt.title('Relative humidity')
-    cbar=plt.colorbar(shrink=1)
-    cbar.set_label('m s-1')
-    fig.set_size_inches(10,7)
-
-    filename = "animation/windspeed_10min_%02d.png" % (i)
-    plt.savefig(filename,dpi=150)  
-    
-#% 900hpa windspeed animation
-print(len(ws900.coord('time').points))
-for i in range (0,len(ws900.coord('time').points)):
-    print(i)
-    fig = plt.figure(i)
-    plt.clf()
-    title_text = "Instantaneous 900hPa windspeed (%s UTC)" % (ws900.coord('time').cell(i).point)
-    plt.suptitle(title_text)
-# , brewer_cmap.N, cmap=brewer_cmap
-    #plt.subplot(2,1,1)
-    iplt.contourf(ws900[i,:,:], np.arange(5,35,1))
-    plt.gca().coastlines('10m')
-    plt.plot(151.7524,-32.4047, color='red', marker='o')
-    plt.plot(151.7817,-32.9283, color='red', marker='d')
-    #plt.axis([145.5,151,-39, -35])
-    #plt.xticks([146,148,150])
-    #plt.yticks([-36,-38])
-    #plt.plot(149.8191,-36.6722, color='blue', marker='.')
-    #plt.plot(149.2336,-37.0016, color='red', marker='.')
-    #plt.plot(146.9509,-36.0690, color='black', marker='.')
-    #plt.title('Relative humidity')
-    cbar=plt.colorbar(shrink=1)
-    cbar.set_label('m s-1')
-    fig.set_size_inches(10,7)
-
-    filename = "animation/windspeed_900hpa_%02d.png" % (i)
-    plt.savefig(filename,dpi=150)      
-
-#%% Compare:
-
-fig = plt.figure(1)
-plt.clf()
-plt.suptitle('Rainfall hazard grids (10min data)')
-
-plt.subplot(1,5,1)
-qplt.contourf(PTEA, np.arange(20,560,20))
-plt.gca().coastlines('10m')
-plt.plot(151.7524,-32.4047, color='white', marker='o')
-plt.plot(151.7817,-32.9283, color='white', marker='d')
-#plt.axis([148,154,-36, -30])
-#plt.xticks([148,150,152,154])
-#plt.yticks([-38,-36,-34,-32,-30])
-#plt.colorbar()
-plt.title('Point total event accum.')
-
-plt.subplot(1,5,2)
-qplt.contourf(P6RR, np.arange(20,360,20))
-plt.gca().coastlines('10m')
-plt.plot(151.7524,-32.4047, color='white', marker='o')
-plt.plot(151.7817,-32.9283, color='white', marker='d')
-#plt.axis([148,154,-36, -30])
-#plt.xticks([148,150,152,154])
-#plt.yticks([-38,-36,-34,-32,-30])
-#plt.colorbar()
-plt.title('Point 6hr max. rain')
-
-plt.subplot(1,5,3)
-qplt.contourf(P1RR, np.arange(10,160,10))
-plt.gca().coastlines('10m')
-plt.plot(151.7524,-32.4047, color='white', marker='o')
-plt.plot(151.7817,-32.9283, color='white', marker='d')
-#plt.axis([148,154,-36, -30])
-#plt.xticks([148,150,152,154])
-#plt.yticks([-38,-36,-34,-32,-30])
-#plt.colorbar()
-plt.title('Point 1hr max. rain')
-
-plt.subplot(1,5,4)
-qplt.contourf(N1RR, np.arange(10,160,10))
-plt.gca().coastlines('10m')
-plt.plot(151.7524,-32.4047, color='white', marker='o')
-plt.plot(151.7817,-32.9283, color='white', marker='d')
-#plt.axis([148,154,-36, -30])
-#plt.xticks([148,150,152,154])
-#plt.yticks([-38,-36,-34,-32,-30])
-#plt.colorbar()
-plt.title('Neighbourhood 1hr max. rain')
-
-plt.subplot(1,5,5)
-qplt.contourf(PIRR, np.arange(0,40,5))
-plt.gca().coastlines('10m')
-plt.plot(151.7524,-32.4047, color='white', marker='o')
-plt.plot(151.7817,-32.9283, color='white', marker='d')
-#plt.axis([148,154,-36, -30])
-#plt.xticks([148,150,152,154])
-#plt.yticks([-38,-36,-34,-32,-30])
-#plt.colorbar()
-plt.title('Point 10min max. rain')
-
-fig.set_size_inches(24,6)
-plt.subplots_adjust(hspace=0.0,wspace=0.3)
-plt.savefig('dungog_rain_hazard_10min.png',dpi=150)
-
-
-       
-fig = plt.figure(2)
-plt.clf()
-plt.suptitle('Wind hazard grids (10min data)')
-
-plt.subplot(1,4,1)
-qplt.contourf(PSMW, np.arange(0,40,5))
-plt.gca().coastlines('10m')
-plt.plot(151.7524,-32.4047, color='white', marker='o')
-plt.plot(151.7817,-32.9283, color='white', marker='d')
-#plt.axis([150,153,-34, -31])
-#plt.xticks([150,152])
-#plt.yticks([-34,-32])
-#plt.colorbar()
-plt.title('Point 10m max. wind')
-
-
-plt.subplot(1,4,2)
-qplt.contourf(PSWG, np.arange(0,70,10))
-plt.gca().coastlines('10m')
-plt.plot(151.7524,-32.4047, color='white', marker='o')
-plt.plot(151.7817,-32.9283, color='white', marker='d')
-#plt.axis([150,153,-34, -31])
-#plt.xticks([150,152])
-#plt.yticks([-34,-32])
-#plt.colorbar()
-plt.title('Point 10m max. wind gust')
-
-plt.subplot(1,4,3)
-qplt.contourf(NSWG, np.arange(0,70,10))
-plt.gca().coastlines('10m')
-plt.plot(151.7524,-32.4047, color='white', marker='o')
-plt.plot(151.7817,-32.9283, color='white', marker='d')
-#plt.axis([150,153,-34, -31])
-#plt.xticks([150,152])
-#plt.yticks([-34,-32])
-#plt.colorbar()
-plt.title('Neighbourhood 10m max. wind gust')
-
-plt.subplot(1,4,4)
-qplt.contourf(PGWS, np.arange(0,70,5))
-plt.gca().coastlines('10m')
-plt.plot(151.7524,-32.4047, color='white', marker='o')
-plt.plot(151.7817,-32.9283, color='white', marker='d')
-#plt.axis([150,153,-34, -31])
-#plt.xticks([150,152])
-#plt.yticks([-34,-32])
-#plt.colorbar()
-plt.title('Point 900hPa max. wind')
-
-fig.set_size_inches(24,6)
-plt.subplots_adjust(hspace=0.0,wspace=0.3)
-plt.savefig('dungog_wind_hazard_10min.png',dpi=150)
+# Import modules
+import os
+import re
+import argparse
+import warnings
+import time
+from collections import OrderedDict
+from pprint import pprint
+
+import iris
+import iris.fileformats.netcdf
+
+import ensemble
+import hazard_state
+from barra import clean_data
+from cube_utils import (
+    DEFAULT_CHUNK, chunk_time, realise, regrid_linear, subset_bbox,
+    wind_speed
+)
+from neighbourhood import DEFAULT_RADIUS, neighbourhood_max_cube
+from rainfall import RAIN_DURATIONS, deaccumulate_cubes, rain_hazards
+
+# Turn off warnings for ease of reading output (Iris complains a lot)
+warnings.filterwarnings('ignore')
+
+# Hazard grids, in the order they are written
+HAZARDS = ['PIRR', 'P1RR', 'N1RR', 'P6RR', 'PTEA',
+           'PSWG', 'PSMW', 'NSWG', 'PGWS']
+
+# Names of the variables in the surface and pressure level files
+VARIABLES = {
+    'uwnd10m': 'uwnd10m',
+    'vwnd10m': 'vwnd10m',
+    'gust': 'wndgust10m',
+    'rain': 'accum_prcp',
+    'uwnd900': 'uwnd',
+    'vwnd900': 'vwnd',
+}
+
+# Pressure level (hPa) of the gradient wind
+GRADIENT_LEVEL = 900
+
+# Default bounding box: lon_W, lat_S, lon_E, lat_N
+DEFAULT_BBOX = (150.5, -34.0, 153.0, -31.5)
+
+# Ways of writing the hazard grids: one file per hazard, or all in one
+OUTPUT_MODES = ['separate', 'combined']
+
+# Compression and (maximum) chunk size along each axis of combined output
+COMPLEVEL = 4
+MAX_CHUNK = 256
+
+
+def parse_args():
+    """Parse arguments for the script.
+
+    Returns:
+        dict : Dictionary of arguments passed to the script
+    """
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+
+    parser.add_argument(
+        '-s', '--surface_files',
+        help='Surface level (10 min) forecast files, in time order\n\n',
+        nargs='+', required=True
+    )
+
+    parser.add_argument(
+        '-p', '--pressure_files',
+        help='Pressure level (hourly) forecast files, in time order\n\n',
+        nargs='+', required=True
+    )
+
+    parser.add_argument(
+        '-b', '--bbox',
+        help='Bounding box: lon_W lat_S lon_E lat_N\ndefault=%s\n\n'
+             % ' '.join(str(x) for x in DEFAULT_BBOX),
+        type=float, nargs=4, default=DEFAULT_BBOX
+    )
+
+    parser.add_argument(
+        '-r', '--radius',
+        help='Neighbourhood radius (degrees)\ndefault=%s\n\n' % DEFAULT_RADIUS,
+        type=float, default=DEFAULT_RADIUS
+    )
+
+    parser.add_argument(
+        '-d', '--durations',
+        help='Add (or change) a rolling rain window, in hours, e.g. P3RR=3\n'
+             'default=%s\n\n'
+             % ', '.join('%s=%s' % item for item in sorted(RAIN_DURATIONS.items())),
+        nargs='+', default=[]
+    )
+
+    parser.add_argument(
+        '--variable',
+        help='Override a variable name, e.g. rain=accum_prcp\ndefault=%s\n\n'
+             % ', '.join('%s=%s' % item for item in sorted(VARIABLES.items())),
+        action='append', default=[]
+    )
+
+    parser.add_argument(
+        '--chunk',
+        help='Number of timesteps per chunk of lazy data\n'
+             'default=%s\n\n' % DEFAULT_CHUNK,
+        type=int, default=DEFAULT_CHUNK
+    )
+
+    parser.add_argument(
+        '-l', '--label',
+        help='Label for the output files, e.g. 20190526_00\n'
+             'default=taken from the first surface file\n\n',
+        type=str, default=None
+    )
+
+    default_output_dir = '.'
+    parser.add_argument(
+        '-o', '--output_dir',
+        help='Output directory\ndefault=%s\n\n' % default_output_dir,
+        type=str, default=default_output_dir
+    )
+
+    parser.add_argument(
+        '-m', '--output_mode',
+        help='Write each hazard grid to its own file (op_<hazard>_<label>.nc)\n'
+             'or all of them to one file (op_hazards_<label>.nc)\n'
+             'default=%s\n\n' % OUTPUT_MODES[0],
+        choices=OUTPUT_MODES, default=OUTPUT_MODES[0]
+    )
+
+    parser.add_argument(
+        '--state',
+        help='Running state of the event (.npz): files ending before the\n'
+             'last time in the state are skipped, only the later timesteps\n'
+             'are folded in, and the state is updated\n\n',
+        type=str, default=None
+    )
+
+    parser.add_argument(
+        '--members',
+        help='Ensemble members, substituted for {member} in the file names;\n'
+             'the hazards of every member are calculated together\n'
+             'default=a single (deterministic) forecast\n\n',
+        nargs='+', default=None
+    )
+
+    parser.add_argument(
+        '--percentiles',
+        help='Ensemble percentiles of each hazard\ndefault=%s\n\n'
+             % ' '.join(str(x) for x in ensemble.ENSEMBLE_PERCENTILES),
+        type=float, nargs='+', default=ensemble.ENSEMBLE_PERCENTILES
+    )
+
+    parser.add_argument(
+        '--threshold',
+        help='Override the exceedance thresholds of a hazard, e.g.\n'
+             'PSWG=20,25,30\ndefault=%s\n\n'
+             % ', '.join('%s=%s' % (name, ','.join(str(x) for x in values))
+                         for name, values in
+                         sorted(ensemble.EXCEEDANCE_THRESHOLDS.items())),
+        action='append', default=[]
+    )
+
+    parser.add_argument(
+        '--plot',
+        help='Also plot the rain and wind hazard grids\n\n',
+        action='store_true'
+    )
+
+    parser.add_argument(
+        '--animation_dir',
+        help='Also render an animation of each field into this directory\n\n',
+        type=str, default=None
+    )
+
+    parser.add_argument(
+        '--animation_workers',
+        help='Number of processes rendering animation frames\ndefault=1\n\n',
+        type=int, default=1
+    )
+
+    parser.add_argument(
+        '--movie',
+        help='Also join the frames of each animation into a movie\n\n',
+        choices=['mp4', 'gif'], default=None
+    )
+
+    # Parse the arguments, convert to dict
+    args = vars(parser.parse_args())
+
+    # Apply any variable name overrides
+    args['variables'] = dict(VARIABLES)
+    for override in args.pop('variable'):
+        key, name = override.split('=', 1)
+        if key not in VARIABLES:
+            parser.error('Unknown variable %s' % key)
+        args['variables'][key] = name
+
+    # Add any rolling rain windows to the defaults
+    durations = dict(RAIN_DURATIONS)
+    for window in args['durations']:
+        name, hours = window.split('=', 1)
+        if name in HAZARDS and name not in RAIN_DURATIONS:
+            parser.error('%s is not a rolling rain window' % name)
+        try:
+            durations[name] = float(hours)
+        except ValueError:
+            parser.error('Invalid duration %s' % window)
+        if durations[name] <= 0:
+            parser.error('Invalid duration %s' % window)
+    args['durations'] = durations
+
+    # Apply any exceedance threshold overrides
+    args['thresholds'] = dict(ensemble.EXCEEDANCE_THRESHOLDS)
+    for override in args.pop('threshold'):
+        name, values = override.split('=', 1)
+        if name not in hazard_names(durations):
+            parser.error('Unknown hazard %s' % name)
+        args['thresholds'][name] = [float(x) for x in values.split(',')]
+
+    if args['members']:
+        for filepath in args['surface_files'] + args['pressure_files']:
+            if '{member}' not in filepath:
+                parser.error('%s has no {member} to fill in' % filepath)
+        if args['plot'] or args['animation_dir']:
+            parser.error('Plots and animations are of a single forecast')
+
+    # Label the outputs after the forecast (e.g. fc_slvl_20191021_12.nc)
+    if args['label'] is None:
+        filename = os.path.basename(args['surface_files'][0])
+        match = re.search(r'\d{8}_\d{2}', filename)
+        args['label'] = match.group(0) if match else '10min'
+
+    return args
+
+
+def hazard_names(durations=RAIN_DURATIONS):
+    """Names of the hazard grids, in the order they are written.
+
+    Args:
+        durations (dict) : Rolling rain windows (hours), e.g. P1RR: 1
+
+    Returns:
+        list : HAZARDS, followed by any other rolling rain windows
+    """
+    return HAZARDS + sorted(name for name in durations if name not in HAZARDS)
+
+
+def remove_first_timestep(cubes):
+    """Remove the first timestep of every cube (it overlaps the previous file).
+
+    Args:
+        cubes (iris.cube.CubeList) : List of cubes, time first
+
+    Returns:
+        iris.cube.CubeList : Cubes without their first timestep
+    """
+    return iris.cube.CubeList(cube[1:] for cube in cubes)
+
+
+def load_variable(filepaths, variable, bbox, pad=0, constraint=None):
+    """Load a variable from a set of files, subset to a bounding box.
+
+    Args:
+        filepaths (list) : Files to load
+        variable (str) : Name of the variable in the files
+        bbox (tuple) : (lon_W, lat_S, lon_E, lat_N) to subset to
+        pad (int) : Extra grid cells to keep around the bounding box
+        constraint (iris.Constraint) : Any further constraint (e.g. level)
+
+    Returns:
+        iris.cube.CubeList : One cube per file
+    """
+    var_constraint = iris.Constraint(
+        cube_func=lambda cube: cube.var_name == variable
+    )
+    if constraint is not None:
+        var_constraint = var_constraint & constraint
+
+    cubes = iris.load(filepaths, var_constraint)
+    if not cubes:
+        raise ValueError('No %s found in %s' % (variable, filepaths))
+
+    return iris.cube.CubeList(subset_bbox(cube, bbox, pad) for cube in cubes)
+
+
+def load_series(filepaths, variable, bbox, pad=0, constraint=None,
+                overlapping=False, chunk=DEFAULT_CHUNK):
+    """Load a variable into a single (lazy) time series.
+
+    Args:
+        filepaths (list) : Files to load, in time order
+        variable (str) : Name of the variable in the files
+        bbox (tuple) : (lon_W, lat_S, lon_E, lat_N) to subset to
+        pad (int) : Extra grid cells to keep around the bounding box
+        constraint (iris.Constraint) : Any further constraint (e.g. level)
+        overlapping (bool) : Whether the first timestep of each file
+            overlaps the previous file (true of the 10 min data)
+        chunk (int) : Number of timesteps per chunk
+
+    Returns:
+        iris.cube.Cube : Time series across all of the files
+    """
+    cubes = load_variable(filepaths, variable, bbox, pad, constraint)
+    if overlapping:
+        cubes = remove_first_timestep(cubes)
+    cubes = clean_data(cubes)
+
+    return chunk_time(cubes.concatenate_cube(), chunk)
+
+
+def load_weather(args):
+    """Load all of the weather fields needed for the hazard grids.
+
+    Args:
+        args (dict) : Arguments dictionary from parse_args
+
+    Returns:
+        OrderedDict : Name -> cube of rain, gust and wind speeds
+    """
+    variables = args['variables']
+    bbox = args['bbox']
+    chunk = args['chunk']
+    sfc = args['surface_files']
+    plvl = args['pressure_files']
+    level = iris.Constraint(pressure=GRADIENT_LEVEL)
+
+    # 10 min surface winds (V keeps a cell either side to regrid onto U)
+    uwnd10m = load_series(sfc, variables['uwnd10m'], bbox,
+                          overlapping=True, chunk=chunk)
+    vwnd10m = load_series(sfc, variables['vwnd10m'], bbox, pad=1,
+                          overlapping=True, chunk=chunk)
+    gust = load_series(sfc, variables['gust'], bbox,
+                       overlapping=True, chunk=chunk)
+
+    # Hourly winds at the gradient level (these files don't overlap)
+    uwnd900 = load_series(plvl, variables['uwnd900'], bbox,
+                          constraint=level, chunk=chunk)
+    vwnd900 = load_series(plvl, variables['vwnd900'], bbox, pad=1,
+                          constraint=level, chunk=chunk)
+
+    # Rain is accumulated over each file, so de-accumulate file by file
+    rain = deaccumulate_cubes(load_variable(sfc, variables['rain'], bbox))
+
+    # Regrid V onto U and create (lazy) cubes of wind speed
+    ws10m = wind_speed(uwnd10m, regrid_linear(vwnd10m, uwnd10m),
+                       '10m windspeed')
+    ws900 = wind_speed(uwnd900, regrid_linear(vwnd900, uwnd900),
+                       '900hPa windspeed')
+
+    return OrderedDict([
+        ('rain', rain),
+        ('gust', gust),
+        ('ws10m', ws10m),
+        ('ws900', ws900),
+    ])
+
+
+def load_ensemble(args):
+    """Load the weather fields of every ensemble member, stacked together.
+
+    The members share their grids, so the bounding box indices and
+    regridding weights are worked out for the first member and reused.
+
+    Args:
+        args (dict) : Arguments dictionary from parse_args
+
+    Returns:
+        OrderedDict : Name -> cube of (time, realization, lat, lon)
+    """
+    members_weather = []
+    for member in args['members']:
+        member_args = dict(args)
+        for key in ['surface_files', 'pressure_files']:
+            member_args[key] = [filepath.format(member=member)
+                                for filepath in args[key]]
+        members_weather.append(load_weather(member_args))
+
+    return ensemble.stack_weather(members_weather, args['members'],
+                                  args['chunk'])
+
+
+def skip_folded_files(args, state):
+    """Leave out the files whose timesteps are all in the hazard state.
+
+    Args:
+        args (dict) : Arguments dictionary from parse_args (updated)
+        state (dict) : Hazard state, from hazard_state.load_state
+
+    Returns:
+        dict : The updated arguments
+    """
+    variables = args['variables']
+    sources = [
+        ('surface_files', variables['gust'], ['gust', 'ws10m', 'rain']),
+        ('pressure_files', variables['uwnd900'], ['ws900']),
+    ]
+
+    # The members of an ensemble share their times
+    member = args['members'][0] if args['members'] else None
+
+    for key, variable, fields in sources:
+        filepaths = [filepath.format(member=member) if member else filepath
+                     for filepath in args[key]]
+        keep = hazard_state.new_files(state, filepaths, variable, fields)
+        if len(keep) < len(filepaths):
+            print('Skipping %d %s already in the state' % (
+                len(filepaths) - len(keep), key.replace('_', ' ')
+            ))
+        args[key] = [args[key][i] for i in keep]
+
+    return args
+
+
+def hazard_grids(weather, radius=DEFAULT_RADIUS, durations=RAIN_DURATIONS):
+    """Calculate all of the hazard grids from the weather fields.
+
+    Each field is read once: the wind event maxima are realised together
+    in a single pass, and the rain hazards share one cumulative sum.
+
+    Args:
+        weather (dict) : Name -> cube, from load_weather
+        radius (float) : Neighbourhood radius (degrees)
+        durations (dict) : Rolling rain windows (hours), e.g. P1RR: 1
+
+    Returns:
+        OrderedDict : Hazard name (see HAZARDS) -> cube
+    """
+    grids = OrderedDict()
+
+    # Wind event maxima
+    grids['PSWG'] = weather['gust'].collapsed('time', iris.analysis.MAX)
+    grids['PSMW'] = weather['ws10m'].collapsed('time', iris.analysis.MAX)
+    grids['PGWS'] = weather['ws900'].collapsed('time', iris.analysis.MAX)
+    realise(list(grids.values()))
+
+    # Rain event maxima and totals
+    grids.update(rain_hazards(weather['rain'], durations))
+
+    # Neighbourhood maxima
+    grids['NSWG'] = neighbourhood_max_cube(grids['PSWG'], radius)
+    grids['N1RR'] = neighbourhood_max_cube(grids['P1RR'], radius)
+
+    return OrderedDict((name, grids[name]) for name in hazard_names(durations))
+
+
+def save_hazard_grids(grids, output_dir, label):
+    """Save each hazard grid to its own file (op_<hazard>_<label>.nc).
+
+    Args:
+        grids (dict) : Hazard name -> cube
+        output_dir (str) : Output directory
+        label (str) : Label for the output files
+
+    Returns:
+        list : Paths of the files written
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    filepaths = []
+    for name, cube in grids.items():
+        filepath = os.path.join(output_dir, 'op_%s_%s.nc' % (name, label))
+        iris.save(cube, filepath)
+        filepaths.append(filepath)
+
+    return filepaths
+
+
+def save_combined_grids(grids, output_dir, label):
+    """Save all of the hazard grids to one file (op_hazards_<label>.nc).
+
+    Each grid becomes a compressed, chunked variable named after its
+    hazard (e.g. PSWG) on the shared lat/lon grid (with any leading
+    dimensions, e.g. ensemble member, of its own).
+
+    Args:
+        grids (dict) : Hazard name -> cube
+        output_dir (str) : Output directory
+        label (str) : Label for the output file
+
+    Returns:
+        list : Path of the file written
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    filepath = os.path.join(output_dir, 'op_hazards_%s.nc' % label)
+    with iris.fileformats.netcdf.Saver(filepath, 'NETCDF4') as saver:
+        for name, cube in grids.items():
+            cube = cube.copy()
+            cube.var_name = name
+            chunksizes = [min(n, MAX_CHUNK) for n in cube.shape]
+            saver.write(cube, zlib=True, complevel=COMPLEVEL,
+                        chunksizes=chunksizes)
+
+    return [filepath]
+
+
+def load_hazard_grids(filepath, names=None):
+    """Load hazard grids from a file written by save_combined_grids.
+
+    Args:
+        filepath (str) : Path of the combined hazard file
+        names (list) : Hazards to load (default: all of them)
+
+    Returns:
+        OrderedDict : Hazard name -> cube, in the order of names/HAZARDS
+    """
+    names = HAZARDS if names is None else names
+    constraint = iris.Constraint(cube_func=lambda cube: cube.var_name in names)
+
+    cubes = {cube.var_name: cube for cube in iris.load(filepath, constraint)}
+    missing = [name for name in names if name not in cubes]
+    if missing:
+        raise ValueError('No %s found in %s' % (', '.join(missing), filepath))
+
+    return OrderedDict((name, cubes[name]) for name in names)
+
+
+if __name__ == '__main__':
+
+    start_time = time.time()
+
+    # Get the arguments, print them pretty
+    args = parse_args()
+    pprint(args)
+
+    if args['state']:
+        state = hazard_state.load_state(args['state'])
+        skip_folded_files(args, state)
+
+    print('Loading weather data...')
+    if args['members']:
+        weather = load_ensemble(args)
+    else:
+        weather = load_weather(args)
+
+    print('Calculating hazard grids...')
+    if args['state']:
+        hazard_state.update_state(state, weather, args['durations'])
+        hazard_state.save_state(state, args['state'])
+        grids = hazard_state.state_grids(state, weather, args['radius'],
+                                         args['durations'])
+        grids = OrderedDict((name, grids[name])
+                            for name in hazard_names(args['durations']))
+    else:
+        grids = hazard_grids(weather, args['radius'], args['durations'])
+
+    if args['members']:
+        print('Calculating ensemble percentiles and probabilities...')
+        grids.update(ensemble.ensemble_grids(
+            grids, args['percentiles'], args['thresholds']
+        ))
+
+    print('Saving hazard grids...')
+    if args['output_mode'] == 'combined':
+        save = save_combined_grids
+    else:
+        save = save_hazard_grids
+    filepaths = save(grids, args['output_dir'], args['label'])
+    for filepath in filepaths:
+        print('Data written to %s' % filepath)
+
+    # Plotting is optional (and slow), so only import it when needed
+    if args['plot'] or args['animation_dir']:
+        import hazard_plots
+
+        if args['plot']:
+            print('Plotting hazard grids...')
+            hazard_plots.plot_hazards(grids, args['output_dir'], args['label'])
+
+        if args['animation_dir']:
+            print('Rendering animations...')
+            hazard_plots.animate_all(
+                weather, args['animation_dir'],
+                workers=args['animation_workers'], movie_format=args['movie']
+            )
+
+    print('DONE')
+    end_time = time.time()
+    print('Time elapsed = %s seconds' % (end_time - start_time))
@@ -0,0 +1,260 @@
+####################################################
+#   Rainfall hazard helpers.
+#       De-accumulates forecast rainfall into per-timestep amounts
+#       and computes the maximum rainfall accumulated over any number
+#       of rolling windows (e.g. 1, 3, 6, 24 hours) in a single
+#       pass over the resulting cube.
+####################################################
+
+# Import modules
+import datetime
+from collections import OrderedDict
+
+import numpy as np
+from iris.coords import CellMethod, DimCoord
+from iris.cube import Cube, CubeList
+from iris.util import unify_time_units
+
+# Default rolling windows (hours) for the rain-rate hazards
+RAIN_DURATIONS = {
+    'P1RR': 1,
+    'P6RR': 6,
+}
+
+
+def deaccumulate(cube):
+    """Convert accumulated rainfall from one file into per-timestep amounts.
+
+    The first timestep of each file only serves as the starting point
+    of the first difference, so it is dropped (it overlaps the end of
+    the previous file). Each remaining timestep is stamped with the end
+    of its accumulation period.
+
+    Args:
+        cube (iris.cube.Cube) : Accumulated rainfall (time, lat, lon)
+
+    Returns:
+        iris.cube.Cube : Rainfall accumulated over each timestep
+    """
+    # Difference consecutive timesteps in one operation
+    data = np.diff(cube.data, axis=0)
+
+    # Build the new time coordinate from the accumulation bounds
+    time = cube.coord('time')
+    if time.has_bounds():
+        points = time.bounds[1:, 1]
+    else:
+        points = time.points[1:]
+    time_coord = DimCoord(points, standard_name='time', units=time.units)
+
+    result = Cube(
+        data, units='kg m-2',
+        dim_coords_and_dims=[
+            (time_coord, 0),
+            (cube.coord('latitude').copy(), 1),
+            (cube.coord('longitude').copy(), 2)
+        ]
+    )
+    result.rename(cube.name())
+
+    return result
+
+
+def deaccumulate_cubes(cubes):
+    """De-accumulate the rainfall from each file and join into one cube.
+
+    Args:
+        cubes (iris.cube.CubeList) : Accumulated rainfall, one cube per file
+
+    Returns:
+        iris.cube.Cube : Rainfall accumulated over each timestep
+    """
+    rain = CubeList([deaccumulate(cube) for cube in cubes])
+
+    # Files may count time from different reference times
+    unify_time_units(rain)
+
+    return rain.concatenate_cube()
+
+
+def timestep(cube):
+    """Work out the (regular) interval between timesteps of a cube.
+
+    Args:
+        cube (iris.cube.Cube) : Cube with a time coordinate
+
+    Returns:
+        datetime.timedelta : Interval between consecutive timesteps
+    """
+    time = cube.coord('time')
+    first, second = time.units.num2date(time.points[:2])
+    return datetime.timedelta(seconds=(second - first).total_seconds())
+
+
+def window_length(cube, hours):
+    """Convert a duration in hours into a number of timesteps.
+
+    Args:
+        cube (iris.cube.Cube) : Cube with a time coordinate
+        hours (float) : Duration of the window in hours
+
+    Returns:
+        int : Number of timesteps in the window
+    """
+    steps = datetime.timedelta(hours=hours) / timestep(cube)
+    if steps < 1 or not np.isclose(steps, round(steps)):
+        raise ValueError(
+            'A %s hour window is not a whole number of %s timesteps'
+            % (hours, timestep(cube))
+        )
+
+    return int(round(steps))
+
+
+def event_max_template(cube, data, methods):
+    """Build a single-time cube for an event statistic of a cube.
+
+    Args:
+        cube (iris.cube.Cube) : Time-varying source cube
+        data (numpy.ndarray) : Data of the event statistic
+        methods (list) : Cell methods (e.g. 'sum', 'maximum') to record
+
+    Returns:
+        iris.cube.Cube : Cube of the event statistic
+    """
+    result = cube[0].copy(data=data)
+
+    # Time coordinate spans the event, as cube.collapsed would give
+    time = cube.coord('time')
+    bounds = time.bounds if time.has_bounds() else time.points[:, np.newaxis]
+    lower, upper = bounds.min(), bounds.max()
+    result.replace_coord(
+        result.coord('time').copy(points=[(lower + upper) / 2.],
+                                  bounds=[[lower, upper]])
+    )
+
+    for method in methods:
+        result.add_cell_method(CellMethod(method, coords='time'))
+
+    return result
+
+
+def cumulative_sum(cube):
+    """Cumulative sum of rainfall over time, with a leading zero.
+
+    The total over timesteps [i, i + n) is then csum[i + n] - csum[i].
+
+    Args:
+        cube (iris.cube.Cube or numpy.ndarray) : Rainfall per timestep,
+            time first
+
+    Returns:
+        numpy.ndarray : Cumulative sum (one longer than the time dimension)
+    """
+    data = cube.data if isinstance(cube, Cube) else cube
+    if np.ma.is_masked(data):
+        data = data.filled(0)
+
+    csum = np.zeros((data.shape[0] + 1,) + data.shape[1:])
+    np.cumsum(data, axis=0, out=csum[1:])
+
+    return csum
+
+
+def rolling_max(csum, steps, chunk=144):
+    """Maximum total over every complete window of a cumulative sum.
+
+    Args:
+        csum (numpy.ndarray) : Cumulative sum from cumulative_sum
+        steps (int) : Number of timesteps in each window
+        chunk (int) : Number of windows reduced at a time (bounds memory)
+
+    Returns:
+        numpy.ndarray : Maximum window total (-inf if there are no windows)
+    """
+    nwindows = csum.shape[0] - steps
+
+    # Running maximum over chunks of windows
+    event_max = np.full(csum.shape[1:], -np.inf)
+    for start in range(0, nwindows, chunk):
+        end = min(start + chunk, nwindows)
+        totals = csum[start + steps:end + steps] - csum[start:end]
+        np.maximum(event_max, totals.max(axis=0), out=event_max)
+
+    return event_max
+
+
+def window_maxima(cube, csum, durations, chunk=144):
+    """Event maximum of rolling window totals from a cumulative sum.
+
+    Args:
+        cube (iris.cube.Cube) : Rainfall per timestep, time first
+        csum (numpy.ndarray) : Cumulative sum from cumulative_sum
+        durations (dict) : Name of each hazard and its window in hours
+        chunk (int) : Number of windows reduced at a time (bounds memory)
+
+    Returns:
+        OrderedDict : Name of each hazard and a cube of its event maximum
+    """
+    ntimes = csum.shape[0] - 1
+
+    results = OrderedDict()
+    for name, hours in durations.items():
+        steps = window_length(cube, hours)
+        if ntimes < steps:
+            raise ValueError(
+                'Not enough data for a %s hour window (%s)' % (hours, name)
+            )
+
+        event_max = rolling_max(csum, steps, chunk)
+        results[name] = event_max_template(
+            cube, event_max.astype(cube.dtype), ['sum', 'maximum']
+        )
+
+    return results
+
+
+def rolling_accumulation_max(cube, durations=RAIN_DURATIONS, chunk=144):
+    """Event maximum of rainfall accumulated over rolling windows.
+
+    A single cumulative sum over time is shared by every window, so
+    each window total is one subtraction, whatever its length. Only
+    complete windows are considered.
+
+    Args:
+        cube (iris.cube.Cube) : Rainfall per timestep, time first
+        durations (dict) : Name of each hazard and its window in hours
+        chunk (int) : Number of windows reduced at a time (bounds memory)
+
+    Returns:
+        OrderedDict : Name of each hazard and a cube of its event maximum
+    """
+    return window_maxima(cube, cumulative_sum(cube), durations, chunk)
+
+
+def rain_hazards(cube, durations=RAIN_DURATIONS, chunk=144):
+    """All of the point rain hazards from a single pass over the data.
+
+    PIRR (maximum rainfall in any one timestep) and PTEA (total event
+    rainfall) are returned alongside the rolling window maxima.
+
+    Args:
+        cube (iris.cube.Cube) : Rainfall per timestep, time first
+        durations (dict) : Name of each hazard and its window in hours
+        chunk (int) : Number of windows reduced at a time (bounds memory)
+
+    Returns:
+        OrderedDict : Name of each hazard and a cube of it
+    """
+    csum = cumulative_sum(cube)
+
+    results = OrderedDict()
+    results['PIRR'] = event_max_template(
+        cube, cube.data.max(axis=0), ['maximum']
+    )
+    results['PTEA'] = event_max_template(
+        cube, csum[-1].astype(cube.dtype), ['sum']
+    )
+    results.update(window_maxima(cube, csum, durations, chunk))
+
+    return results
@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import box
+
+from boundaries import (join_boundaries, load_boundaries, load_regions,
+                        store_path)
+
+
+def write_regions(directory, n=6):
+    """Shape file of n unit squares with two code fields in opposite orders."""
+    gdf = gpd.GeoDataFrame({
+        'SA1_MAIN16': ['%d' % (100 + i) for i in range(n)],
+        'SA2_MAIN16': ['%d' % (200 - i) for i in range(n)],
+    }, geometry=[box(150 + i, -34, 151 + i, -33) for i in range(n)],
+        crs='EPSG:4326')
+    filepath = str(directory / 'regions.shp')
+    gdf.to_file(filepath)
+    return filepath
+
+
+def test_store_is_keyed_on_code(tmp_path):
+    filepath = write_regions(tmp_path)
+
+    assert store_path(filepath) != store_path(filepath, code='SA2_MAIN16')
+
+    first = load_boundaries(filepath, code='SA1_MAIN16')
+    second = load_boundaries(filepath, code='SA2_MAIN16')
+    assert list(first['SA1_MAIN16']) == sorted(first['SA1_MAIN16'])
+    assert list(second['SA2_MAIN16']) == sorted(second['SA2_MAIN16'])
+    assert second['SA2_MAIN16'].dtype == np.int64
+
+
+def test_load_regions_is_stored(tmp_path):
+    filepath = write_regions(tmp_path)
+    codes = [104, 101, 104]
+
+    gdf = load_regions(filepath, codes)
+    stored = store_path(filepath, codes=np.array([101, 104]))
+    assert os.path.isfile(stored)
+    assert list(gdf['SA1_MAIN16']) == [101, 104]
+    pd.testing.assert_frame_equal(load_regions(filepath, codes), gdf)
+
+
+def test_join_boundaries_drops_unknown_regions(tmp_path):
+    gdf = load_boundaries(write_regions(tmp_path))
+    impacts = pd.DataFrame({'SA1_CODE': [103, 999, 100],
+                            'loss': [3., 9., 1.]})
+
+    joined = join_boundaries(impacts, gdf)
+    assert list(joined['SA1_MAIN16']) == [103, 100]
+    assert list(joined['loss']) == [3., 1.]
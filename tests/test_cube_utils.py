@@ -0,0 +1,79 @@
+import dask.array as da
+import iris.analysis
+import numpy as np
+import pytest
+from iris.coords import DimCoord
+from iris.cube import Cube
+
+from cube_utils import _weights_cache, regrid_linear
+
+
+def wind_cube(data, lat, lon):
+    """Wind component on a (time, lat, lon) grid."""
+    time = DimCoord(np.arange(data.shape[0], dtype=np.float64),
+                    standard_name='time', units='hours since 2019-10-21')
+    return Cube(data, standard_name='northward_wind', units='m s-1',
+                dim_coords_and_dims=[
+                    (time, 0),
+                    (DimCoord(lat, standard_name='latitude',
+                              units='degrees'), 1),
+                    (DimCoord(lon, standard_name='longitude',
+                              units='degrees'), 2),
+                ])
+
+
+def staggered_grids(descending=False):
+    """v and u grids offset by half a cell, as on the Arakawa C grid."""
+    v_lat = -35. + 0.036 * np.arange(20)
+    v_lon = 150. + 0.036 * np.arange(25)
+    u_lat = v_lat + 0.018
+    u_lon = v_lon - 0.018
+    if descending:
+        v_lat, u_lat = v_lat[::-1], u_lat[::-1]
+    return (v_lat, v_lon), (u_lat, u_lon)
+
+
+@pytest.mark.parametrize('descending', [False, True])
+@pytest.mark.parametrize('lazy', [False, True])
+def test_regrid_linear_matches_iris(descending, lazy):
+    (v_lat, v_lon), (u_lat, u_lon) = staggered_grids(descending)
+    rng = np.random.default_rng(0)
+    data = rng.normal(0., 10., size=(4, len(v_lat), len(v_lon)))
+    data = data.astype(np.float32)
+
+    vwnd = wind_cube(da.from_array(data, chunks=(1, -1, -1)) if lazy
+                     else data, v_lat, v_lon)
+    uwnd = wind_cube(np.zeros((4, len(u_lat), len(u_lon)), np.float32),
+                     u_lat, u_lon)
+
+    result = regrid_linear(vwnd, uwnd)
+    expected = wind_cube(data, v_lat, v_lon).regrid(uwnd,
+                                                    iris.analysis.Linear())
+
+    assert result.has_lazy_data() == lazy
+    assert result.coord('latitude') == uwnd.coord('latitude')
+    assert result.coord('longitude') == uwnd.coord('longitude')
+    np.testing.assert_allclose(result.data, expected.data, rtol=1e-5,
+                               atol=1e-5)
+
+
+def test_regrid_linear_reuses_weights():
+    (v_lat, v_lon), (u_lat, u_lon) = staggered_grids()
+    data = np.ones((2, len(v_lat), len(v_lon)), np.float32)
+    uwnd = wind_cube(np.zeros((2, len(u_lat), len(u_lon)), np.float32),
+                     u_lat, u_lon)
+
+    _weights_cache.clear()
+    first = regrid_linear(wind_cube(data, v_lat, v_lon), uwnd)
+    second = regrid_linear(wind_cube(2. * data, v_lat, v_lon), uwnd)
+
+    assert len(_weights_cache) == 1
+    np.testing.assert_allclose(second.data, 2. * first.data)
+
+
+def test_regrid_linear_aligned_grids_unchanged():
+    (v_lat, v_lon), _ = staggered_grids()
+    vwnd = wind_cube(np.ones((2, len(v_lat), len(v_lon)), np.float32),
+                     v_lat, v_lon)
+
+    assert regrid_linear(vwnd, vwnd.copy()) is vwnd
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+from ensemble_impact import LOSS_RATIO, ensemble_impacts
+
+
+def test_ensemble_impacts_match_pandas():
+    rng = np.random.default_rng(0)
+    codes = rng.integers(100, 110, size=500).astype(float)
+    codes[:5] = np.nan
+    ratios = rng.random((500, 4))
+    ratios[rng.random(ratios.shape) < 0.1] = np.nan
+    values = rng.uniform(1e5, 5e5, size=500)
+
+    result = ensemble_impacts(codes, ratios, values, quantiles=[0.1, 0.5],
+                              thresholds=[0.5]).set_index('SA1_CODE')
+
+    df = pd.DataFrame(ratios).assign(code=codes).dropna(subset=['code'])
+    means = df.groupby('code').mean()
+    means.index = means.index.astype(np.int64)
+
+    np.testing.assert_allclose(result[LOSS_RATIO + '_mean'],
+                               means.mean(axis=1))
+    np.testing.assert_allclose(result[LOSS_RATIO + '_mean_q50'],
+                               means.quantile(0.5, axis=1))
+    np.testing.assert_allclose(result[LOSS_RATIO + '_mean_p0.5'],
+                               (means >= 0.5).sum(axis=1) / 4)
+
+
+def test_exceedance_counts_missing_members_as_not_exceeding():
+    codes = np.array([1., 1., 2.])
+    ratios = np.full((3, 10), np.nan)
+    ratios[:2, 0] = 0.9
+    ratios[2] = 0.
+
+    result = ensemble_impacts(codes, ratios, thresholds=[0.5])
+
+    assert list(result['nmembers']) == [1, 10]
+    assert list(result[LOSS_RATIO + '_mean_p0.5']) == [0.1, 0.]
+    assert list(result[LOSS_RATIO + '_mean']) == [0.9, 0.]
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from iris.coords import DimCoord
+from iris.cube import Cube
+
+from hazard_state import fold_rain
+from rainfall import cumulative_sum, rolling_max
+
+# Window lengths in 10 minute timesteps (P1RR, P6RR)
+STEPS = {'P1RR': 6, 'P6RR': 36}
+
+
+def rain_cube(data):
+    """Rainfall per 10 minute timestep on a small grid."""
+    time = DimCoord(np.arange(len(data)) / 6., standard_name='time',
+                    units='hours since 2019-10-21 00:00:00')
+    return Cube(data, long_name='rain',
+                dim_coords_and_dims=[(time, 0)])
+
+
+@pytest.mark.parametrize('splits', [[18], [40], [5, 12], [18, 30, 31]])
+def test_fold_rain_matches_single_pass(splits):
+    rng = np.random.default_rng(0)
+    data = rng.gamma(0.5, 2., size=(60, 3, 4))
+
+    state = {}
+    for part in np.split(data, splits):
+        fold_rain(state, rain_cube(part), STEPS)
+
+    csum = cumulative_sum(data)
+    for name, steps in STEPS.items():
+        np.testing.assert_allclose(state[name], rolling_max(csum, steps))
+    np.testing.assert_allclose(state['PTEA'], data.sum(axis=0))
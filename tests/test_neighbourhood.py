@@ -0,0 +1,141 @@
+import numpy as np
+import pytest
+from iris.coords import DimCoord
+from iris.cube import Cube
+
+import neighbourhood
+from neighbourhood import (DEFAULT_RADIUS, EARTH_RADIUS, circular_footprint,
+                           grid_spacing, neighbourhood_cube,
+                           neighbourhood_index, neighbourhood_max,
+                           neighbourhood_max_cube)
+
+
+# Grid spacing and radius that are exact in binary, so the baseline
+# distances (some exactly on the radius) have no rounding error
+SPACING = 2. ** -5
+RADIUS = 10 * SPACING
+
+
+def grid_cube(data, lat0=-34.5, lon0=150.25, spacing=SPACING):
+    """Cube on a regular lat/lon grid."""
+    nlat, nlon = data.shape[-2:]
+    lat = DimCoord(lat0 + spacing * np.arange(nlat),
+                   standard_name='latitude', units='degrees')
+    lon = DimCoord(lon0 + spacing * np.arange(nlon),
+                   standard_name='longitude', units='degrees')
+    return Cube(data, long_name='gust',
+                dim_coords_and_dims=[(lat, data.ndim - 2),
+                                     (lon, data.ndim - 1)])
+
+
+def baseline_max(cube, radius=RADIUS):
+    """Per-cell neighbourhood maximum, as in the original script."""
+    lats = cube.coord('latitude').points
+    lons = cube.coord('longitude').points
+    result = np.empty(cube.shape)
+    for i, lat in enumerate(lats):
+        for j, lon in enumerate(lons):
+            rows = ((lat - radius) <= lats) & (lats <= (lat + radius))
+            cols = ((lon - radius) <= lons) & (lons <= (lon + radius))
+            grid_lon, grid_lat = np.meshgrid(lons[cols], lats[rows])
+            rad = ((grid_lon - lon) ** 2 + (grid_lat - lat) ** 2) ** 0.5
+            result[i, j] = np.amax(np.where(rad <= radius, 1, 0) *
+                                   cube.data[np.ix_(rows, cols)])
+    return result
+
+
+@pytest.mark.parametrize('lat0, lon0', [(-34.5, 150.2), (-36., 140.),
+                                        (-33.012, 149.)])
+def test_footprint_is_symmetric_with_rounded_spacing(lat0, lon0):
+    # Mean spacings of float32 ACCESS coordinates at 0.036 degrees
+    cube = grid_cube(np.zeros((60, 70)), lat0, lon0, spacing=0.036)
+    cube.coord('latitude').points = \
+        cube.coord('latitude').points.astype(np.float32)
+    cube.coord('longitude').points = \
+        cube.coord('longitude').points.astype(np.float32)
+
+    footprint = circular_footprint(DEFAULT_RADIUS, *grid_spacing(cube))
+
+    np.testing.assert_array_equal(footprint, footprint.T)
+    np.testing.assert_array_equal(
+        footprint, circular_footprint(RADIUS, SPACING, SPACING)
+    )
+
+
+@pytest.mark.parametrize('lat0, lon0', [(-34.5, 150.25), (-12., 130.)])
+def test_neighbourhood_max_matches_baseline(lat0, lon0):
+    rng = np.random.default_rng(0)
+    cube = grid_cube(rng.gamma(2., 5., size=(40, 45)), lat0, lon0)
+
+    footprint = circular_footprint(RADIUS, *grid_spacing(cube))
+    np.testing.assert_allclose(neighbourhood_max(cube.data, footprint),
+                               baseline_max(cube))
+
+
+def test_neighbourhood_max_cube_keeps_leading_dimensions():
+    rng = np.random.default_rng(1)
+    data = rng.gamma(2., 5., size=(3, 30, 30))
+    cube = grid_cube(data)
+
+    result = neighbourhood_max_cube(cube, RADIUS)
+    for i in range(len(data)):
+        np.testing.assert_allclose(result.data[i],
+                                   baseline_max(grid_cube(data[i])))
+
+
+def baseline_neighbours(cube, radius=RADIUS, great_circle=False):
+    """Boolean (cell, cell) matrix of the cells within the radius."""
+    lon, lat = np.meshgrid(np.radians(cube.coord('longitude').points),
+                           np.radians(cube.coord('latitude').points))
+    lat, lon = lat.ravel(), lon.ravel()
+    if great_circle:
+        hav = (np.sin((lat[:, None] - lat[None, :]) / 2.) ** 2 +
+               np.cos(lat[:, None]) * np.cos(lat[None, :]) *
+               np.sin((lon[:, None] - lon[None, :]) / 2.) ** 2)
+        return 2. * EARTH_RADIUS * np.arcsin(np.sqrt(hav)) <= radius
+    rad = np.hypot(lat[:, None] - lat[None, :], lon[:, None] - lon[None, :])
+    return np.degrees(rad) <= radius * (1. + 1e-9)
+
+
+@pytest.mark.parametrize('statistic', ['max', 'mean'])
+@pytest.mark.parametrize('descending', [False, True])
+def test_neighbourhood_index_matches_baseline(statistic, descending):
+    rng = np.random.default_rng(2)
+    data = rng.gamma(2., 5., size=(25, 30))
+    cube = grid_cube(data)
+    if descending:
+        cube = cube[::-1]
+        data = data[::-1]
+
+    result = neighbourhood_cube(cube, RADIUS, statistic)
+
+    inside = baseline_neighbours(cube)
+    values = np.where(inside, data.ravel()[None, :], np.nan)
+    expected = getattr(np, 'nan' + statistic)(values, axis=1)
+    np.testing.assert_allclose(result.data.ravel(), expected)
+
+
+def test_great_circle_index_matches_baseline():
+    rng = np.random.default_rng(3)
+    data = rng.gamma(2., 5., size=(15, 18))
+    cube = grid_cube(data, lat0=-60.)
+
+    result = neighbourhood_max_cube(cube, 30., great_circle=True)
+
+    inside = baseline_neighbours(cube, 30., great_circle=True)
+    expected = np.nanmax(np.where(inside, data.ravel()[None, :], np.nan),
+                         axis=1)
+    np.testing.assert_allclose(result.data.ravel(), expected)
+
+
+def test_neighbourhood_index_is_cached_on_disk(tmp_path):
+    cube = grid_cube(np.zeros((12, 14)))
+
+    neighbourhood._index_cache.clear()
+    index = neighbourhood_index(cube, RADIUS, cache_dir=str(tmp_path))
+    assert len(list(tmp_path.glob('neighbourhood_*.npy'))) == 1
+
+    neighbourhood._index_cache.clear()
+    np.testing.assert_array_equal(
+        neighbourhood_index(cube, RADIUS, cache_dir=str(tmp_path)), index
+    )
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+from iris.coords import DimCoord
+from iris.cube import Cube, CubeList
+
+from rainfall import (deaccumulate_cubes, rain_hazards,
+                      rolling_accumulation_max)
+
+# Rolling windows (hours) checked against the original loops
+DURATIONS = {'P1RR': 1, 'P6RR': 6}
+
+
+def rain_cube(data):
+    """Rainfall per 10 minute timestep on a small lat/lon grid."""
+    ntimes, nlat, nlon = data.shape
+    time = DimCoord(np.arange(1, ntimes + 1) * 600., standard_name='time',
+                    units='seconds since 2019-10-21 00:00:00')
+    lat = DimCoord(-34. + 0.036 * np.arange(nlat), standard_name='latitude',
+                   units='degrees')
+    lon = DimCoord(150. + 0.036 * np.arange(nlon), standard_name='longitude',
+                   units='degrees')
+    return Cube(data, long_name='accum_prcp', units='kg m-2',
+                dim_coords_and_dims=[(time, 0), (lat, 1), (lon, 2)])
+
+
+def baseline_window_max(data, half):
+    """Maximum rolling total, looping over windows as the original script."""
+    ntimes = len(data)
+    totals = [data[i - half:i + half].sum(axis=0)
+              for i in range(half, ntimes - half + 1)]
+    return np.max(totals, axis=0)
+
+
+@pytest.mark.parametrize('ntimes, chunk', [(36, 144), (100, 144), (100, 7)])
+def test_rain_hazards_match_baseline(ntimes, chunk):
+    rng = np.random.default_rng(0)
+    data = rng.gamma(0.3, 3., size=(ntimes, 5, 6)).astype(np.float32)
+
+    hazards = rain_hazards(rain_cube(data), DURATIONS, chunk)
+
+    np.testing.assert_allclose(hazards['PIRR'].data, data.max(axis=0))
+    np.testing.assert_allclose(hazards['PTEA'].data, data.sum(axis=0),
+                               rtol=1e-5)
+    np.testing.assert_allclose(hazards['P1RR'].data,
+                               baseline_window_max(data, 3), rtol=1e-5)
+    np.testing.assert_allclose(hazards['P6RR'].data,
+                               baseline_window_max(data, 18), rtol=1e-5)
+
+    # The time coordinate spans the event, as a collapse over time would
+    time = hazards['P6RR'].coord('time')
+    np.testing.assert_array_equal(time.bounds, [[600., ntimes * 600.]])
+
+
+def test_rolling_windows_ignore_masked_rain():
+    rng = np.random.default_rng(1)
+    data = np.ma.masked_greater(
+        rng.gamma(0.3, 3., size=(48, 4, 4)).astype(np.float32), 5.
+    )
+
+    hazards = rolling_accumulation_max(rain_cube(data), {'P1RR': 1})
+    np.testing.assert_allclose(hazards['P1RR'].data,
+                               baseline_window_max(data.filled(0), 3),
+                               rtol=1e-5)
+
+
+def test_window_longer_than_data():
+    data = np.ones((5, 2, 2), dtype=np.float32)
+
+    with pytest.raises(ValueError):
+        rolling_accumulation_max(rain_cube(data), {'P1RR': 1})
+
+
+def accumulated_cube(data, start, units):
+    """Rainfall accumulated from the start of a forecast file."""
+    cube = rain_cube(np.cumsum(data, axis=0, dtype=np.float32))
+    hours = start + np.arange(len(data)) / 6.
+    cube.remove_coord('time')
+    cube.add_dim_coord(DimCoord(
+        hours - 1. / 12., standard_name='time', units=units,
+        bounds=np.column_stack([hours - 1. / 6., hours])
+    ), 0)
+    return cube
+
+
+def test_deaccumulate_matches_baseline():
+    rng = np.random.default_rng(2)
+    first = rng.gamma(0.3, 3., size=(13, 3, 4)).astype(np.float32)
+    second = rng.gamma(0.3, 3., size=(13, 3, 4)).astype(np.float32)
+
+    # The second file counts time from a different reference time
+    rain = deaccumulate_cubes(CubeList([
+        accumulated_cube(first, 0., 'hours since 2019-10-21 00:00:00'),
+        accumulated_cube(second, 0., 'hours since 2019-10-21 02:00:00'),
+    ]))
+
+    # Differences of consecutive timesteps, dropping the first of each file
+    expected = np.concatenate([np.diff(np.cumsum(part, axis=0), axis=0)
+                               for part in [first, second]])
+    np.testing.assert_allclose(rain.data, expected, rtol=1e-5, atol=1e-5)
+
+    hours = rain.coord('time').units.convert(rain.coord('time').points,
+                                             'hours since 2019-10-21')
+    np.testing.assert_allclose(hours, np.concatenate([
+        np.arange(1, 13) / 6., 2. + np.arange(1, 13) / 6.
+    ]))